@@ -0,0 +1,262 @@
+"""
+Reading bepress exports straight from zip and tar archives
+
+An export delivered as an archive (e.g. BEPRESS_PATH/my_dump.zip) can be
+imported without extracting it first. The documents of the archive are
+addressed with paths that go through the archive file as if it was a
+directory (e.g. BEPRESS_PATH/my_dump.zip/vol1/iss1/1/metadata.xml) and the
+helpers in this module (walk, open_local...) fall back to the filesystem
+for any path that is not inside an archive. Archives packed with their
+export folder (e.g. `zip -r my_dump.zip my_dump/`) are read as if the
+folder was the archive itself.
+
+Members of zip archives are streamed. Members of tar archives are copied to
+a spooled temporary file while holding a lock, since tar archives can't be
+read concurrently. Compressed tar archives are slow to read out of order,
+so prefer zip or uncompressed tar deliveries.
+"""
+import os
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections import defaultdict
+
+from django.core.files import File as DjangoFile
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+ARCHIVE_EXTENSIONS = (
+    ".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz",
+)
+# Members of tar archives up to this size are held in memory
+SPOOL_MAX_SIZE = 1024 * 1024
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+class ExportArchive:
+    def __init__(self, path):
+        """
+        :param path: The path of a zip or tar archive file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.members = {}
+        # directory -> (subdirectories, files)
+        self.tree = defaultdict(lambda: (set(), []))
+        if zipfile.is_zipfile(path):
+            self.zip_file = zipfile.ZipFile(path)
+            self.tar_file = None
+            infos = (
+                (info.filename, info, info.file_size)
+                for info in self.zip_file.infolist() if not info.is_dir()
+            )
+        else:
+            self.zip_file = None
+            self.tar_file = tarfile.open(path)
+            infos = (
+                (info.name, info, info.size)
+                for info in self.tar_file.getmembers() if info.isfile()
+            )
+        members = [
+            (os.path.normpath(name).lstrip(os.sep), info, size)
+            for name, info, size in infos
+        ]
+        prefix = self.get_wrapper_prefix([name for name, _, _ in members])
+        for name, info, size in members:
+            name = name[len(prefix):]
+            self.members[name] = (info, size)
+            self.add_to_tree(name)
+
+    def get_wrapper_prefix(self, names):
+        """ Gets the folder all the members of the archive are packed under
+        Only a folder named after the archive is stripped, since the export
+        of a single volume (e.g. vol1/iss1/...) also has a single top level
+        directory that is part of the export.
+        :param names: The normalized names of the members
+        :return: The prefix to strip from the names of the members, or ""
+        """
+        top_levels = {name.split(os.sep, 1)[0] for name in names}
+        if len(top_levels) != 1:
+            return ""
+        top_level = top_levels.pop()
+        archive_name = os.path.basename(self.path)
+        for extension in ARCHIVE_EXTENSIONS:
+            if archive_name.lower().endswith(extension):
+                archive_name = archive_name[:-len(extension)]
+                break
+        # A member with the name of the folder is a file, not a folder
+        if top_level != archive_name or top_level in names:
+            return ""
+        return top_level + os.sep
+
+    def add_to_tree(self, name):
+        directory, filename = os.path.split(name)
+        self.tree[directory][1].append(filename)
+        while directory:
+            parent, subdirectory = os.path.split(directory)
+            subdirectories = self.tree[parent][0]
+            if subdirectory in subdirectories:
+                break
+            subdirectories.add(subdirectory)
+            directory = parent
+
+    def walk(self, member_dir=""):
+        """ Walks the members of the archive like os.walk
+        :param member_dir: The directory of the archive to walk
+        :return: A generator of (root, dirs, files) where root is the path
+            of the directory through the archive file
+        """
+        member_dir = normalize_member(member_dir)
+        pending = [member_dir]
+        while pending:
+            directory = pending.pop()
+            if directory not in self.tree:
+                continue
+            subdirectories, files_ = self.tree[directory]
+            dirs = sorted(subdirectories)
+            root = self.path
+            if directory:
+                root = os.path.join(self.path, directory)
+            yield root, dirs, list(files_)
+            # Like os.walk, dirs can be pruned by the caller
+            pending.extend(
+                os.path.join(directory, name) for name in reversed(dirs)
+            )
+
+    def listdir(self, member_dir):
+        subdirectories, files_ = self.tree.get(
+            normalize_member(member_dir), ((), []))
+        return sorted(subdirectories) + list(files_)
+
+    def isfile(self, member):
+        return normalize_member(member) in self.members
+
+    def getsize(self, member):
+        member = normalize_member(member)
+        if member not in self.members:
+            raise FileNotFoundError(os.path.join(self.path, member))
+        _, size = self.members[member]
+        return size
+
+    def open(self, member):
+        """ Opens a member of the archive for reading in binary mode
+        :return: A django File
+        """
+        member = normalize_member(member)
+        if member not in self.members:
+            raise FileNotFoundError(os.path.join(self.path, member))
+        info, size = self.members[member]
+        if self.zip_file is not None:
+            member_file = self.zip_file.open(info)
+        else:
+            member_file = tempfile.SpooledTemporaryFile(SPOOL_MAX_SIZE)
+            with self.lock:
+                source = self.tar_file.extractfile(info)
+                while True:
+                    chunk = source.read(64 * 1024)
+                    if not chunk:
+                        break
+                    member_file.write(chunk)
+            member_file.seek(0)
+        django_file = DjangoFile(member_file, name=os.path.basename(member))
+        django_file.size = size
+        return django_file
+
+    def close(self):
+        with self.lock:
+            if self.zip_file is not None:
+                # Members still being read are closed once they are done
+                self.zip_file.close()
+            else:
+                self.tar_file.close()
+
+
+def normalize_member(member):
+    member = os.path.normpath(member).lstrip(os.sep)
+    return "" if member == "." else member
+
+
+def get_archive(path):
+    """ Gets the ExportArchive for the given archive file
+    Archives are indexed once per process (processes can't share the open
+    file of an archive), and indexed again whenever the archive file is
+    modified or replaced (e.g. by a new delivery picked up by the watcher)
+    """
+    stat = os.stat(path)
+    key = (path, os.getpid())
+    version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _archives_lock:
+        cached_version, archive = _archives.get(key, (None, None))
+        if cached_version != version:
+            if archive is not None:
+                logger.info("Archive %s changed, indexing it again", path)
+                archive.close()
+            else:
+                logger.info("Indexing archive %s", path)
+            archive = ExportArchive(path)
+            _archives[key] = (version, archive)
+        return archive
+
+
+def split_archive_path(path):
+    """ Splits a path going through an archive file
+    :return: A tuple of the archive and the path of the member in the
+        archive, or None and the given path if it isn't inside an archive
+    """
+    candidate = path
+    while True:
+        if is_archive(candidate) and os.path.isfile(candidate):
+            return get_archive(candidate), os.path.relpath(path, candidate)
+        parent = os.path.dirname(candidate)
+        if parent == candidate:
+            return None, path
+        candidate = parent
+
+
+def walk(path):
+    """ os.walk that goes into archive files"""
+    archive, member = split_archive_path(path)
+    if archive is None:
+        return os.walk(path)
+    return archive.walk(member)
+
+
+def listdir(path):
+    archive, member = split_archive_path(path)
+    if archive is None:
+        return os.listdir(path)
+    return archive.listdir(member)
+
+
+def isfile(path):
+    archive, member = split_archive_path(path)
+    if archive is None:
+        return os.path.isfile(path)
+    return archive.isfile(member)
+
+
+def getsize(path):
+    archive, member = split_archive_path(path)
+    if archive is None:
+        return os.path.getsize(path)
+    return archive.getsize(member)
+
+
+def open_local(path):
+    """ Opens a local file, which may be a member of an archive, for reading
+    in binary mode
+    :return: A django File
+    """
+    archive, member = split_archive_path(path)
+    if archive is None:
+        return DjangoFile(open(path, "rb"))
+    return archive.open(member)
@@ -0,0 +1,81 @@
+"""
+Writes deferred during an import and flushed once per batch of articles
+
+Rather than issuing several queries per article, the registries of an
+ImportBatch (issues, notes, keywords...) queue their writes while a batch of articles
+is imported and perform them in bulk when the batch is flushed.
+"""
+from django.conf import settings
+from django.db import connection
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Deferred writes are flushed every N articles
+BATCH_SIZE = getattr(settings, "BEPRESS_IMPORT_BATCH_SIZE", 100)
+
+
+class ImportBatch:
+    def __init__(
+        self, size=BATCH_SIZE, issues=None, notes=None, custom_fields=None,
+        keywords=None, files=None, signals=None, content_hashes=None,
+    ):
+        """
+        :param size: Number of articles after which the batch is flushed
+        :param issues: An optional issues.IssuePlanner
+        :param notes: An optional notes.NoteRegistry
+        :param custom_fields: An optional custom_fields.CustomFieldMapping
+        :param keywords: An optional keywords.KeywordRegistry
+        :param files: An optional ingest.FileQueue
+        :param signals: An optional signals.DeferredSignals
+        :param content_hashes: An optional identity.ContentHashes, flushed
+            last so that articles are only stamped once the rest of the
+            batch was written
+        """
+        self.size = size
+        self.count = 0
+        self.issues = issues
+        self.notes = notes
+        self.custom_fields = custom_fields
+        self.keywords = keywords
+        self.files = files
+        self.signals = signals
+        self.content_hashes = content_hashes
+
+    @property
+    def registries(self):
+        return [
+            registry for registry in (
+                self.issues, self.notes, self.keywords, self.custom_fields,
+                self.files, self.signals, self.content_hashes,
+            )
+            if registry is not None
+        ]
+
+    def article_done(self):
+        """ Records an imported article, flushing the batch when it's full"""
+        self.count += 1
+        if self.count % self.size == 0:
+            self.flush()
+
+    def flush(self):
+        for registry in self.registries:
+            registry.flush()
+
+
+def bulk_create(model, objs, **kwargs):
+    """ Creates the given objects in bulk, ensuring their primary keys are set
+    Not every database backend returns the primary keys of a bulk insert, in
+    which case the objects are saved one by one.
+    :param model: The model class of the objects
+    :param objs: A list of unsaved model instances
+    :return: The list of saved objects
+    """
+    if not objs:
+        return objs
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs, **kwargs)
+    for obj in objs:
+        obj.save()
+    return objs
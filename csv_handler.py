@@ -8,19 +8,34 @@ Missing Metadata:
 
 
 """
+import csv
+import glob
+import multiprocessing
+import os
 import pathlib
 import urllib.parse as urlparse
+from collections import defaultdict
+from concurrent import futures
 from urllib.parse import parse_qs
 
 from bs4 import BeautifulSoup
 import requests
+from django.conf import settings
+from django.db import connections
 from django.template.loader import render_to_string
 from utils.logger import get_logger
 
+from plugins.bepress import http_client
+from plugins.bepress import profiling
+from plugins.bepress import records
+from plugins.bepress import utils
 from plugins.bepress.plugin_settings import BEPRESS_PATH
 
 logger = get_logger(__name__)
 
+# Number of processes converting CSV files at the same time
+WORKERS = getattr(settings, "BEPRESS_CSV_WORKERS", os.cpu_count() or 1)
+
 
 AUTHOR_FIELDS_MAP = {
     ('author%d_fname', 'first_name'),
@@ -38,29 +53,267 @@ SCRAPE_FIELDS = {
     "article_id",
 }
 
-
-def csv_to_xml(reader, commit=True, scrape_missing=True):
+# Fields rendered by the metadata.xml template, by name -> parsed key
+TEMPLATE_FIELDS = (
+    ("fpage", "fpage"),
+    ("doi", "doi"),
+    ("language", "language"),
+    ("distribution_license", "license_url"),
+    ("publication_date", "publication_date"),
+)
+# Author elements rendered by the metadata.xml template -> parsed key
+TEMPLATE_AUTHOR_TAGS = (
+    ("fname", "first_name"),
+    ("mname", "middle_name"),
+    ("lname", "last_name"),
+    ("suffix", "suffix"),
+    ("email", "email"),
+)
+
+
+def csv_to_xml(reader, commit=True, scrape_missing=True, profiler=None):
     """Converts a Bepress CSV Batch into Bepress XML format
 
     :param reader: A csv.DictReader
     :param commit: If true, the metadata is persisted to disk.
+    :param profiler: An optional profiling.ImportProfiler
     :return: A generator that yields XML documents and the path they'
     """
+    profiler = profiler or profiling.NullProfiler()
     file_path = None
     for row in reader:
-        parsed = parse_row(row)
+        profiler.start_item()
+        with profiler.stage("parse_row"):
+            parsed = parse_row(row)
         if scrape_missing:
-            scrape_missing_metadata(parsed)
-        xml = render_xml(parsed)
+            with profiler.stage("scrape_missing_metadata"):
+                scrape_missing_metadata(parsed)
+        with profiler.stage("render_xml"):
+            xml = render_xml(parsed)
         id = parsed["article_id"]
         if commit:
-            file_path = pathlib.Path(BEPRESS_PATH, row["issue"], id, "metadata.xml")
-            logger.info("Writing to %s", file_path)
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(str(file_path), "w") as xml_file:
-                xml_file.write(xml)
+            with profiler.stage("write_xml"):
+                file_path = get_metadata_path(row, id)
+                write_xml(xml, file_path)
 
         yield xml, file_path
+    profiler.dump()
+
+
+def csv_to_records(reader, scrape_missing=True, emit_xml=False, profiler=None):
+    """Converts a Bepress CSV Batch straight into article records
+
+    The records are those the import would extract from the XML written by
+    csv_to_xml (See parsed_to_record), without rendering, writing and
+    parsing that XML.
+    :param reader: A csv.DictReader
+    :param emit_xml: If true, the XML is still written to disk for auditing
+    :param profiler: An optional profiling.ImportProfiler
+    :return: A generator of tuples of the directory the XML of the article
+        is written to by csv_to_xml and its record
+    """
+    profiler = profiler or profiling.NullProfiler()
+    for row in reader:
+        profiler.start_item()
+        with profiler.stage("parse_row"):
+            parsed = parse_row(row)
+        if scrape_missing:
+            with profiler.stage("scrape_missing_metadata"):
+                scrape_missing_metadata(parsed)
+        file_path = get_metadata_path(row, parsed["article_id"])
+        if emit_xml:
+            with profiler.stage("render_xml"):
+                xml = render_xml(parsed)
+            with profiler.stage("write_xml"):
+                write_xml(xml, file_path)
+        with profiler.stage("parsed_to_record"):
+            record = parsed_to_record(parsed)
+
+        yield str(file_path.parent), record
+    profiler.dump()
+
+
+def import_csv(reader, scrape_missing=True, emit_xml=False, **import_kwargs):
+    """Imports a Bepress CSV Batch without going through XML files
+
+    The articles are imported as if the batch had been converted with
+    csv_to_xml and its exports imported with utils.import_archive.
+    :param reader: A csv.DictReader
+    :param emit_xml: If true, the XML is still written to disk for auditing
+    :param import_kwargs: Passed on to utils.import_archive, other than the
+        folder and documents to import
+    :return: The combined utils.ImportSummary of the exports of the batch
+    """
+    record_set = records.RecordSet()
+    # export -> directory of the document -> files
+    documents = defaultdict(dict)
+    iterator = csv_to_records(
+        reader, scrape_missing, emit_xml, import_kwargs.get("profiler"))
+    for root, record in iterator:
+        record_set.add(root, record)
+        folder = os.path.relpath(root, BEPRESS_PATH).split(os.sep)[0]
+        documents[folder][root] = ["metadata.xml"] if emit_xml else []
+
+    summary = utils.ImportSummary()
+    for folder in sorted(documents):
+        summary.merge(utils.import_archive(
+            folder=folder,
+            documents=sorted(documents[folder].items()),
+            record_source=record_set,
+            **import_kwargs
+        ))
+    return summary
+
+
+def get_metadata_path(row, article_id):
+    """ Gets the path the XML of a CSV row is written to"""
+    return pathlib.Path(BEPRESS_PATH, row["issue"], article_id, "metadata.xml")
+
+
+def write_xml(xml, file_path):
+    logger.info("Writing to %s", file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(str(file_path), "w") as xml_file:
+        xml_file.write(xml)
+
+
+def find_csv_files(paths):
+    """ Expands the given paths into the CSV files to convert
+    :param paths: A list of paths to CSV files, directories containing CSV
+        files (at any depth) or glob patterns
+    :return: A sorted list of paths to CSV files
+    :raises FileNotFoundError: If a path doesn't match any file
+    """
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(
+                os.path.join(glob.escape(path), "**", "*.csv"),
+                recursive=True,
+            )
+        elif glob.has_magic(path):
+            matches = [
+                match for match in glob.glob(path, recursive=True)
+                if os.path.isfile(match)
+            ]
+        elif os.path.isfile(path):
+            matches = [path]
+        else:
+            matches = []
+        if not matches:
+            raise FileNotFoundError("No CSV files found at %s" % path)
+        found.update(matches)
+    return sorted(found)
+
+
+class CSVSummary:
+    """ Counters of the conversion of one or more CSV files"""
+
+    def __init__(self):
+        self.files = 0
+        self.converted = 0
+        # (CSV path, error) of the files that failed to convert
+        self.failed_files = []
+        # (XML or None, path or None) of each document (See csv_to_xml)
+        self.documents = []
+
+    def merge(self, other):
+        self.files += other.files
+        self.converted += other.converted
+        self.failed_files.extend(other.failed_files)
+        self.documents.extend(other.documents)
+
+    def __str__(self):
+        lines = [
+            "Files: %d" % self.files,
+            "Converted: %d" % self.converted,
+            "Failed files: %d" % len(self.failed_files),
+        ]
+        for csv_path, error in self.failed_files:
+            lines.append("  %s: %s" % (csv_path, error))
+        return "\n".join(lines)
+
+
+def convert_csv_file(
+    csv_path, commit=True, scrape_missing=True, profiler=None,
+):
+    """ Converts a single CSV file (See csv_to_xml)
+    A file that fails to convert is recorded as such in the summary, with
+    the documents of the rows preceding the failure kept.
+    :param csv_path: The path to the CSV file
+    :return: A CSVSummary
+    """
+    summary = CSVSummary()
+    summary.files = 1
+    try:
+        with open(csv_path, "r", encoding="utf-8-sig") as csv_file:
+            reader = csv.DictReader(csv_file)
+            iterator = csv_to_xml(reader, commit, scrape_missing, profiler)
+            for xml, path in iterator:
+                summary.converted += 1
+                # The XML written to disk isn't shipped back to the parent
+                summary.documents.append(
+                    (None, str(path)) if path else (xml, None))
+    except Exception as e:
+        logger.error("Conversion of %s failed: %s", csv_path, e)
+        logger.exception(e)
+        summary.failed_files.append((csv_path, str(e)))
+    return summary
+
+
+def convert_csv_files(
+    csv_paths, commit=True, scrape_missing=True, workers=WORKERS,
+    profiler=None, on_file=None,
+):
+    """ Converts many CSV files at once, in a pool of processes
+    Each file is converted by a single process exactly as csv_to_xml would,
+    so that the rendering and writing of the documents of different files
+    runs in parallel.
+    :param csv_paths: A list of paths to CSV files (See find_csv_files)
+    :param workers: Number of processes converting files
+    :param profiler: An optional profiling.ImportProfiler, which requires
+        the files to be converted in this process (workers=1)
+    :param on_file: An optional callable taking the path and the CSVSummary
+        of each file as soon as it is converted
+    :return: The combined CSVSummary
+    """
+    summary = CSVSummary()
+    if workers <= 1 or len(csv_paths) <= 1:
+        for csv_path in csv_paths:
+            file_summary = convert_csv_file(
+                csv_path, commit, scrape_missing, profiler)
+            summary.merge(file_summary)
+            if on_file:
+                on_file(csv_path, file_summary)
+        return summary
+
+    # Children must not share the parent's database connections
+    connections.close_all()
+    context = multiprocessing.get_context("fork")
+    with futures.ProcessPoolExecutor(
+        max_workers=min(workers, len(csv_paths)), mp_context=context,
+    ) as executor:
+        pending = {
+            executor.submit(
+                convert_csv_file, csv_path, commit, scrape_missing,
+            ): csv_path
+            for csv_path in csv_paths
+        }
+        for future in futures.as_completed(pending):
+            csv_path = pending[future]
+            try:
+                file_summary = future.result()
+            except Exception as e:
+                # The worker process died
+                logger.error("Conversion of %s failed: %s", csv_path, e)
+                file_summary = CSVSummary()
+                file_summary.files = 1
+                file_summary.failed_files.append((csv_path, str(e)))
+            summary.merge(file_summary)
+            if on_file:
+                on_file(csv_path, file_summary)
+    summary.failed_files.sort()
+    return summary
 
 
 def render_xml(parsed):
@@ -73,6 +326,59 @@ def render_xml(parsed):
     return render_to_string(template, context)
 
 
+def parsed_to_record(parsed):
+    """Builds the record of an article from its parsed CSV row
+
+    Mirrors the template rendered by render_xml, so that the record matches
+    what records.extract_record extracts from the rendered XML. The only
+    exception are values missing from the row, which the template renders
+    as "None" and are left blank here.
+    :param parsed: Dict representation of an article's metadata
+    :return: A dict (See records.extract_record)
+    """
+    record = {name.replace("-", "_"): None for name in records.TAGS}
+    record.update(
+        articleid=get_text(parsed.get("article_id")),
+        title=get_text(parsed.get("title")),
+        abstract=get_text(parsed.get("abstract")),
+        publication_date=get_text(parsed.get("publication_date")),
+        submission_path=get_text(parsed.get("submission_path")),
+        document_type=get_text(parsed.get("document_type")),
+        fulltext_url=get_text(parsed.get("fulltext_url")),
+    )
+
+    fields = {}
+    for name, key in TEMPLATE_FIELDS:
+        if parsed.get(key):
+            fields[name] = get_text(parsed[key])
+    if parsed.get("peer_reviewed"):
+        fields["peer_reviewed"] = "true"
+    record["fields"] = fields
+
+    authors = []
+    for author in parsed["authors"]:
+        author_record = dict.fromkeys(records.AUTHOR_TAGS)
+        if author.get("is_corporate"):
+            author_record["organization"] = get_text(author.get("first_name"))
+        elif author.get("institution"):
+            author_record["institution"] = author["institution"]
+        for tag, key in TEMPLATE_AUTHOR_TAGS:
+            if author.get(key):
+                author_record[tag] = author[key]
+        authors.append(author_record)
+    record["authors"] = authors
+
+    # The disciplines are rendered, but not read by the import
+    record["keywords"] = []
+    record["supplemental_files"] = []
+    return record
+
+
+def get_text(value):
+    """ Gets a value as the text of an element of the rendered XML"""
+    return "" if value is None else str(value)
+
+
 def parse_row(row):
     """Parse the given Bepress CSV Row data into a dictionary
     :param row: Dict of a CSV Row:
@@ -133,7 +439,7 @@ def scrape_missing_metadata(data, unstamped=True):
     if data.get("calc_url"):
         try:
             logger.info("Fetching article from %s", data["calc_url"])
-            response = requests.get(data["calc_url"])
+            response = http_client.get(data["calc_url"])
         except requests.exceptions.RequestException as exc:
             logger.warning("Failed to extract PDF URL: %s", exc)
         else:
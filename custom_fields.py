@@ -0,0 +1,109 @@
+"""
+Mapping of bepress metadata fields into Janeway's custom submission fields
+
+The Janeway fields are resolved once per import and the answers of a batch
+of articles are written with a single batched upsert.
+"""
+from submission import models as submission_models
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def validate_custom_fields(pairs):
+    """ Validates a mapping of bepress field names to Janeway field names
+    :param pairs: An iterable of (bepress field, janeway field) pairs
+    :return: A dict mapping each bepress field to a Janeway field
+    :raises ValueError: When the mapping is invalid
+    """
+    custom_fields = {}
+    janeway_fields = set()
+    errors = []
+    for bepress_field, janeway_field in pairs:
+        bepress_field = (bepress_field or "").strip()
+        janeway_field = (janeway_field or "").strip()
+        if not bepress_field or not janeway_field:
+            errors.append(
+                "Blank field name in mapping '%s' -> '%s'"
+                "" % (bepress_field, janeway_field)
+            )
+        elif bepress_field in custom_fields:
+            errors.append("Bepress field '%s' mapped twice" % bepress_field)
+        elif janeway_field in janeway_fields:
+            errors.append(
+                "More than one field mapped to '%s'" % janeway_field)
+        else:
+            custom_fields[bepress_field] = janeway_field
+            janeway_fields.add(janeway_field)
+    if errors:
+        raise ValueError("Invalid custom fields: %s" % "; ".join(errors))
+    return custom_fields
+
+
+class CustomFieldMapping:
+    def __init__(self, journal, custom_fields):
+        """
+        :param journal: The journal.Journal receiving the import
+        :param custom_fields: a dict mapping a bepress field name to Janeway
+        """
+        self.journal = journal
+        self.fields = {}
+        self.pending = {}
+        mapping = validate_custom_fields(custom_fields.items())
+        for i, (bepress_field, janeway_field) in enumerate(mapping.items()):
+            self.fields[bepress_field], _ = submission_models.Field.objects \
+                .get_or_create(
+                    journal=journal,
+                    name=janeway_field,
+                    defaults=dict(
+                        required=False,
+                        kind="textarea",
+                        display=True,
+                        order=i,
+                    )
+                )
+
+    def add_answers(self, record, article):
+        """ Queues the answers to the custom fields found in the metadata
+        :param record: The article metadata (See records.extract_record)
+        :param article: a Janeway submission.Article instance
+        """
+        for bepress_field, submission_field in self.fields.items():
+            value = record["fields"].get(bepress_field)
+            if value is not None:
+                logger.debug(
+                    "Setting custom field %s to value:  '%s'",
+                    submission_field, value,
+                )
+                key = (submission_field.pk, article.pk)
+                self.pending[key] = value
+
+    def flush(self):
+        """ Upserts all the queued answers"""
+        if not self.pending:
+            return
+        field_ids = {field_id for field_id, _ in self.pending}
+        article_ids = {article_id for _, article_id in self.pending}
+        existing = {
+            (answer.field_id, answer.article_id): answer
+            for answer in submission_models.FieldAnswer.objects.filter(
+                field_id__in=field_ids,
+                article_id__in=article_ids,
+            )
+        }
+        updated = []
+        created = []
+        for (field_id, article_id), value in self.pending.items():
+            answer = existing.get((field_id, article_id))
+            if answer is None:
+                created.append(submission_models.FieldAnswer(
+                    field_id=field_id,
+                    article_id=article_id,
+                    answer=value,
+                ))
+            elif answer.answer != value:
+                answer.answer = value
+                updated.append(answer)
+        submission_models.FieldAnswer.objects.bulk_create(created)
+        submission_models.FieldAnswer.objects.bulk_update(updated, ["answer"])
+        self.pending = {}
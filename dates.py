@@ -0,0 +1,83 @@
+"""
+Parsing of the dates found in bepress metadata
+
+Dates in bepress archives and CSV batches come in a handful of formats and
+the same strings repeat thousands of times in an archive (e.g. all the
+articles in an issue share a publication date). Dates are parsed with
+datetime.fromisoformat and a few precompiled bepress formats first, whose
+results are memoized, and dateutil is only used as a last resort. Results
+from dateutil aren't memoized, since it fills the fields missing from
+partial dates with today's date.
+"""
+from datetime import datetime
+import functools
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Non ISO formats seen in bepress exports. Only formats that fully specify
+# the date are tried, so the result is the same dateutil would return.
+BEPRESS_DATE_FORMATS = (
+    "%m/%d/%Y",  # 01/15/2019
+    "%m/%d/%Y %H:%M",  # 1/15/2019 0:00
+    "%m/%d/%Y %H:%M:%S",  # 1/15/2019 00:00:00
+    "%B %d, %Y",  # January 15, 2019
+    "%d %B %Y",  # 15 January 2019
+)
+
+CACHE_SIZE = 4096
+
+
+def parse_bepress_date(date_string):
+    """ Parses a date from bepress metadata
+    :param date_string: The date as found in the metadata
+    :return: A datetime or None if the date can't be parsed
+    """
+    if not date_string:
+        return None
+    date_string = date_string.strip()
+    parsed = parse_fast(date_string)
+    if parsed is not None:
+        return parsed
+    try:
+        return parse_fallback(date_string)
+    except (ValueError, OverflowError):
+        logger.warning(
+            "Unable to parse datetime %s, trying to extract date...",
+            date_string,
+        )
+    try:
+        # Extract date from corrupt datetime
+        date_part, *_ = date_string.split("T")
+        return parse_fast(date_part) or parse_fallback(date_part)
+    except (ValueError, OverflowError):
+        logger.warning("No date could be parsed from %s", date_string)
+    return None
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_fast(date_string):
+    """ Parses ISO 8601 and the known bepress formats without dateutil
+    :return: A datetime or None if the string is in none of those formats
+    """
+    try:
+        return datetime.fromisoformat(date_string)
+    except ValueError:
+        pass
+    for date_format in BEPRESS_DATE_FORMATS:
+        try:
+            return datetime.strptime(date_string, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_fallback(date_string):
+    from dateutil import parser
+
+    return parser.parse(date_string)
+
+
+def clear_cache():
+    parse_fast.cache_clear()
@@ -0,0 +1,776 @@
+"""
+Set-based import engine for very large exports on PostgreSQL
+
+Importing an article through the ORM (See utils.create_article_record)
+takes dozens of queries, which adds up to hours for exports of 100k+
+documents. The ETL engine imports the documents in chunks instead: the
+records of a chunk are loaded into temporary staging tables with COPY and
+merged into Janeway's tables with a handful of set-based statements.
+
+    records -> COPY -> staging tables -> UPDATE/INSERT ... SELECT
+
+Rows relying on defaults only known to the models (new articles, accounts,
+frozen authors and identifiers) are still created through the ORM, in bulk.
+Issues, notes, keywords and custom fields go through the registries of the
+ORM import, so that they are matched the same way, and the files of the
+articles are always deferred (See ingest.ingest_files).
+
+A chunk that fails to merge is rolled back and split in halves, which are
+merged on their own, until the failing documents are isolated.
+
+On other databases, the import falls back to utils.import_archive.
+"""
+import io
+import os
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Account
+from identifiers.models import Identifier
+from submission import models as submission_models
+from utils.logger import get_logger
+
+from plugins.bepress import batch, failures, identity, ingest, issues, models
+from plugins.bepress import records, utils
+from plugins.bepress.custom_fields import CustomFieldMapping
+from plugins.bepress.dates import parse_bepress_date
+from plugins.bepress.keywords import KeywordRegistry
+from plugins.bepress.notes import NoteRegistry
+from plugins.bepress.plugin_settings import BEPRESS_PATH
+
+logger = get_logger(__name__)
+
+# Number of documents merged by each set of statements
+CHUNK_SIZE = getattr(settings, "BEPRESS_ETL_CHUNK_SIZE", 2000)
+
+STAGING_TABLES = {
+    "bepress_stage_article": (
+        ("bepress_id", "bigint"),
+        ("article_id", "integer"),
+        ("title", "text"),
+        ("abstract", "text"),
+        ("date_published", "timestamp with time zone"),
+        ("date_submitted", "timestamp with time zone"),
+        ("section_id", "integer"),
+        ("license_id", "integer"),
+        ("rights", "text"),
+        ("page_numbers", "text"),
+        ("total_pages", "integer"),
+        ("competing_interests", "text"),
+        ("publisher_name", "text"),
+        ("peer_reviewed", "boolean"),
+        ("submission_path", "text"),
+    ),
+    "bepress_stage_author": (
+        ("article_id", "integer"),
+        ("position", "integer"),
+        ("account_id", "integer"),
+    ),
+    "bepress_stage_frozen_author": (
+        ("frozen_author_id", "integer"),
+        ("first_name", "text"),
+        ("middle_name", "text"),
+        ("last_name", "text"),
+        ("name_suffix", "text"),
+        ("institution", "text"),
+        ("display_email", "boolean"),
+    ),
+}
+
+# Staged columns copied into the existing submission.FrozenAuthor rows.
+# Optional values only overwrite the frozen author when present
+FROZEN_AUTHOR_FIELDS = ("first_name", "last_name")
+OPTIONAL_FROZEN_AUTHOR_FIELDS = ("middle_name", "name_suffix", "institution")
+
+# Staged columns copied into submission.Article, by field name. Optional
+# values only overwrite the article when present in the metadata, like
+# the ORM import does
+ARTICLE_FIELDS = (
+    "title", "abstract", "date_published", "date_submitted",
+    "peer_reviewed",
+)
+OPTIONAL_ARTICLE_FIELDS = (
+    "section", "license", "rights", "page_numbers", "total_pages",
+    "competing_interests", "publisher_name",
+)
+
+
+def is_supported():
+    return connection.vendor == "postgresql"
+
+
+def copy_value(value):
+    """ Formats a value for COPY ... FROM in text format"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value).replace("\\", "\\\\")
+        .replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    )
+
+
+def copy_rows(cursor, table, rows):
+    """ Loads rows into a staging table with COPY
+    :param table: The name of the table (See STAGING_TABLES)
+    :param rows: A list of tuples with a value for each column of the table
+    """
+    if not rows:
+        return
+    columns = ", ".join(name for name, _ in STAGING_TABLES[table])
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(
+        "COPY %s (%s) FROM STDIN" % (table, columns), buffer)
+
+
+def create_staging_tables(cursor):
+    """ Creates the staging tables, dropped at the end of the transaction"""
+    for table, columns in STAGING_TABLES.items():
+        cursor.execute("CREATE TEMPORARY TABLE %s (%s) ON COMMIT DROP" % (
+            table, ", ".join("%s %s" % column for column in columns),
+        ))
+
+
+def column(model, field_name):
+    return connection.ops.quote_name(model._meta.get_field(field_name).column)
+
+
+def table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+class ChunkMerge:
+    def __init__(
+        self, journal, dump_name, stamped, default_section, section_key,
+        identities=None,
+    ):
+        """
+        :param journal: The journal.Journal receiving the import
+        :param dump_name: The name of the bepress dump
+        :param stamped: Whether to fetch the stamped galleys
+        :param default_section: The section of the articles without one
+        :param section_key: The custom field holding the section name
+        :param identities: An optional identity.IdentityIndex, used to update
+            the articles imported from other dumps or sources in place
+        """
+        self.journal = journal
+        self.dump_name = dump_name
+        self.identities = identities
+        self.stamped = stamped
+        self.default_section = default_section
+        self.section_key = section_key
+        # Sections and licences by name/URL -> id
+        self.sections = {}
+        self.licences = {}
+        self.copyright = submission_models.Licence.objects.filter(
+            journal=journal, short_name="Copyright",
+        ).first()
+        # Seconds spent in each step, reported as stages of the summary
+        self.timings = {}
+
+    def timed(self, name, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.timings[name] = (
+                self.timings.get(name, 0.0) + time.perf_counter() - start)
+
+    def get_section_id(self, record):
+        name = utils.get_section_name(record, self.section_key)
+        if not name:
+            return self.default_section.pk if self.default_section else None
+        if name not in self.sections:
+            section, _ = submission_models.Section.objects.get_or_create(
+                name=name,
+                journal=self.journal,
+            )
+            self.sections[name] = section.pk
+        return self.sections[name]
+
+    def get_license_id(self, record):
+        url = utils.get_license_url(record)
+        if not url:
+            return self.copyright.pk if self.copyright else None
+        if url not in self.licences:
+            licence, created = submission_models.Licence.objects.get_or_create(
+                journal=self.journal,
+                url=url,
+                defaults={
+                    "name": "Imported license",
+                    "short_name": "imported",
+                }
+            )
+            if created:
+                logger.info("Created new license %s", url)
+            self.licences[url] = licence.pk
+        return self.licences[url]
+
+    def get_articles(self, records_):
+        """ Gets the article of each record, creating the new ones in bulk
+        :param records_: A dict of bepress id -> record
+        :return: A dict of bepress id -> submission.Article, where only the
+            fields read by the import are loaded
+        """
+        imported_articles = {
+            imported.bepress_id: imported
+            for imported in models.ImportedArticle.objects.filter(
+                dump_name=self.dump_name,
+                journal=self.journal,
+                bepress_id__in=records_,
+            ).select_related("article").only(
+                "bepress_id", "article__id", "article__date_published",
+            )
+        }
+        missing = [
+            bepress_id for bepress_id in records_
+            if bepress_id not in imported_articles
+            or imported_articles[bepress_id].article is None
+        ]
+        found_articles = self.find_articles(
+            {bepress_id: records_[bepress_id] for bepress_id in missing},
+            imported_articles,
+        )
+        new_articles = {
+            bepress_id: submission_models.Article(
+                is_import=True,
+                journal=self.journal,
+                title=records_[bepress_id]["title"],
+                stage=submission_models.STAGE_PUBLISHED,
+            )
+            for bepress_id in missing
+            if bepress_id not in found_articles
+        }
+        batch.bulk_create(
+            submission_models.Article, list(new_articles.values()))
+        logger.info("Created %d new articles", len(new_articles))
+        new_articles.update(found_articles)
+
+        new_imported = []
+        updated_imported = []
+        for bepress_id, article in new_articles.items():
+            imported = imported_articles.get(bepress_id)
+            if imported is None:
+                new_imported.append(models.ImportedArticle(
+                    dump_name=self.dump_name,
+                    bepress_id=bepress_id,
+                    journal=self.journal,
+                    article=article,
+                ))
+            else:
+                imported.article = article
+                updated_imported.append(imported)
+        models.ImportedArticle.objects.bulk_create(new_imported)
+        models.ImportedArticle.objects.bulk_update(
+            updated_imported, ["article"])
+        articles = {
+            bepress_id: imported.article
+            for bepress_id, imported in imported_articles.items()
+        }
+        articles.update(new_articles)
+        return articles
+
+    def find_articles(self, records_, imported_articles):
+        """ Finds the articles imported for the records from other dumps
+        :param records_: A dict of bepress id -> record, for the records
+            without an article in this dump
+        :param imported_articles: A dict of bepress id -> ImportedArticle of
+            the records of the chunk imported in this dump
+        :return: A dict of bepress id -> submission.Article
+        """
+        if self.identities is None:
+            return {}
+        # An article is updated by a single document of the chunk
+        claimed = {
+            imported.article_id for imported in imported_articles.values()
+            if imported.article_id is not None
+        }
+        article_ids = {}
+        for bepress_id, record in records_.items():
+            article_id = self.identities.find(record)
+            if article_id is not None and article_id not in claimed:
+                article_ids[bepress_id] = article_id
+                claimed.add(article_id)
+        articles = submission_models.Article.objects.only(
+            "id", "date_published",
+        ).in_bulk(article_ids.values())
+        logger.info(
+            "Found %d articles imported from other dumps", len(articles))
+        return {
+            bepress_id: articles[article_id]
+            for bepress_id, article_id in article_ids.items()
+            if article_id in articles
+        }
+
+    def get_accounts(self, emails):
+        """ Gets the accounts of the given emails, creating the missing ones
+        :param emails: A dict of email -> defaults of a new account
+        :return: A dict of email -> Account id
+        """
+        accounts = dict(
+            Account.objects.filter(email__in=emails).values_list("email", "pk")
+        )
+        for email, defaults in emails.items():
+            if email not in accounts:
+                account, _ = Account.objects.get_or_create(
+                    email=email,
+                    defaults=defaults,
+                )
+                accounts[email] = account.pk
+        return accounts
+
+    def stage(self, cursor, documents, articles):
+        """ Loads the records of the documents into the staging tables"""
+        article_rows = []
+        author_rows = []
+        emails = {}
+        for bepress_id, (_, _, record) in documents.items():
+            article = articles[bepress_id]
+            date_published = (
+                parse_bepress_date(record["publication_date"])
+                or timezone.now()
+            )
+            date_submitted = date_published
+            if record["submission_date"] is not None:
+                date_submitted = (
+                    parse_bepress_date(record["submission_date"])
+                    or date_published
+                )
+            article.date_published = date_published
+            fields = record["fields"]
+            article_rows.append((
+                bepress_id,
+                article.pk,
+                record["title"],
+                record["abstract"] or "",
+                date_published,
+                date_submitted,
+                self.get_section_id(record),
+                self.get_license_id(record),
+                fields.get("rights"),
+                utils.get_page_numbers(record) or None,
+                utils.get_total_pages(record),
+                fields.get("financial_disclosure"),
+                fields.get("publisher_name"),
+                fields.get("peer_reviewed") == "true",
+                record["submission_path"],
+            ))
+            for author in record["authors"]:
+                if author["organization"] is None and author["email"]:
+                    emails.setdefault(
+                        author["email"], get_author_details(author))
+
+        accounts = self.get_accounts(emails)
+        for bepress_id, (_, _, record) in documents.items():
+            for position, author in enumerate(record["authors"]):
+                if author["organization"] is None and author["email"]:
+                    author_rows.append((
+                        articles[bepress_id].pk,
+                        position,
+                        accounts[author["email"]],
+                    ))
+
+        create_staging_tables(cursor)
+        copy_rows(cursor, "bepress_stage_article", article_rows)
+        copy_rows(cursor, "bepress_stage_author", author_rows)
+        cursor.execute("ANALYZE bepress_stage_article, bepress_stage_author")
+        return accounts
+
+    def merge_articles(self, cursor):
+        Article = submission_models.Article
+        assignments = [
+            "%s = s.%s" % (column(Article, name), name)
+            for name in ARTICLE_FIELDS
+        ]
+        assignments.append("%s = %%s" % column(Article, "stage"))
+        for name in OPTIONAL_ARTICLE_FIELDS:
+            staged = "%s_id" % name if name in {"section", "license"} else name
+            assignments.append(
+                "{column} = COALESCE(s.{staged}, a.{column})".format(
+                    column=column(Article, name),
+                    staged=staged,
+                )
+            )
+        cursor.execute(
+            "UPDATE {article} a SET {assignments}"
+            " FROM bepress_stage_article s WHERE a.{pk} = s.article_id".format(
+                article=table(Article),
+                assignments=", ".join(assignments),
+                pk=column(Article, "id"),
+            ),
+            [submission_models.STAGE_PUBLISHED],
+        )
+        ImportedArticle = models.ImportedArticle
+        cursor.execute(
+            "UPDATE {imported} i SET {path} = btrim(s.submission_path, '/')"
+            " FROM bepress_stage_article s"
+            " WHERE i.{article} = s.article_id"
+            " AND i.{dump} = %s AND i.{journal} = %s"
+            " AND COALESCE(s.submission_path, '') <> ''".format(
+                imported=table(ImportedArticle),
+                path=column(ImportedArticle, "submission_path"),
+                article=column(ImportedArticle, "article"),
+                dump=column(ImportedArticle, "dump_name"),
+                journal=column(ImportedArticle, "journal"),
+            ),
+            [self.dump_name, self.journal.pk],
+        )
+
+    def merge_authors(self, cursor):
+        AuthorOrder = submission_models.ArticleAuthorOrder
+        cursor.execute(
+            "INSERT INTO {order_table} ({article}, {author}, {order})"
+            " SELECT DISTINCT ON (s.article_id, s.account_id)"
+            "  s.article_id, s.account_id, s.position"
+            " FROM bepress_stage_author s WHERE NOT EXISTS ("
+            "  SELECT 1 FROM {order_table} o"
+            "  WHERE o.{article} = s.article_id AND o.{author} = s.account_id"
+            " ) ORDER BY s.article_id, s.account_id, s.position".format(
+                order_table=table(AuthorOrder),
+                article=column(AuthorOrder, "article"),
+                author=column(AuthorOrder, "author"),
+                order=column(AuthorOrder, "order"),
+            )
+        )
+        ImportedAuthor = models.ImportedArticleAuthor
+        cursor.execute(
+            "INSERT INTO {imported} ({article}, {author})"
+            " SELECT DISTINCT s.article_id, s.account_id"
+            " FROM bepress_stage_author s"
+            " ON CONFLICT DO NOTHING".format(
+                imported=table(ImportedAuthor),
+                article=column(ImportedAuthor, "article"),
+                author=column(ImportedAuthor, "author"),
+            )
+        )
+        # The first author is the correspondence author, as in the ORM import
+        Article = submission_models.Article
+        cursor.execute(
+            "UPDATE {article} a SET {correspondence} = s.account_id"
+            " FROM bepress_stage_author s"
+            " WHERE a.{pk} = s.article_id AND s.position = 0".format(
+                article=table(Article),
+                correspondence=column(Article, "correspondence_author"),
+                pk=column(Article, "id"),
+            )
+        )
+
+    def merge_frozen_authors(self, cursor, documents, articles, accounts):
+        """ Upserts the frozen authors of the articles in bulk
+        New frozen authors are created through the ORM, the existing ones
+        are updated from a staging table
+        """
+        article_ids = [article.pk for article in articles.values()]
+        existing = {}
+        corporate = set()
+        for frozen in submission_models.FrozenAuthor.objects.filter(
+            article_id__in=article_ids,
+        ):
+            if frozen.is_corporate:
+                corporate.add((frozen.article_id, frozen.institution))
+            else:
+                key = (frozen.article_id, frozen.order, frozen.author_id)
+                existing[key] = frozen
+        created = []
+        updated_rows = []
+        for bepress_id, (_, _, record) in documents.items():
+            article_id = articles[bepress_id].pk
+            corresp = record["fields"].get("corresponding_authors")
+            for position, author in enumerate(record["authors"]):
+                if author["organization"] is not None:
+                    key = (article_id, author["organization"])
+                    if key not in corporate:
+                        corporate.add(key)
+                        created.append(submission_models.FrozenAuthor(
+                            article_id=article_id,
+                            institution=author["organization"],
+                            is_corporate=True,
+                        ))
+                    continue
+                account_id = accounts.get(author["email"])
+                details = get_author_details(author)
+                if author["suffix"] is not None:
+                    details["name_suffix"] = author["suffix"]
+                display_email = bool(
+                    corresp and author["email"] and author["email"] in corresp)
+                frozen = existing.get((article_id, position, account_id))
+                if frozen is None:
+                    created.append(submission_models.FrozenAuthor(
+                        article_id=article_id,
+                        order=position,
+                        author_id=account_id,
+                        display_email=display_email,
+                        **details
+                    ))
+                else:
+                    updated_rows.append((
+                        frozen.pk,
+                        details["first_name"],
+                        details.get("middle_name"),
+                        details["last_name"],
+                        details.get("name_suffix"),
+                        details.get("institution"),
+                        display_email,
+                    ))
+        submission_models.FrozenAuthor.objects.bulk_create(created)
+        if not updated_rows:
+            return
+        # bulk_update builds a CASE per field and row in Python, which takes
+        # longer than the rest of the merge for a chunk of updated articles
+        copy_rows(cursor, "bepress_stage_frozen_author", updated_rows)
+        FrozenAuthor = submission_models.FrozenAuthor
+        assignments = [
+            "{column} = s.{name}".format(
+                column=column(FrozenAuthor, name), name=name)
+            for name in FROZEN_AUTHOR_FIELDS
+        ]
+        assignments.extend(
+            "{column} = COALESCE(s.{name}, f.{column})".format(
+                column=column(FrozenAuthor, name), name=name)
+            for name in OPTIONAL_FROZEN_AUTHOR_FIELDS
+        )
+        # Like the ORM import, an email is never hidden again
+        assignments.append(
+            "{column} = f.{column} OR s.display_email".format(
+                column=column(FrozenAuthor, "display_email")))
+        cursor.execute(
+            "UPDATE {frozen} f SET {assignments}"
+            " FROM bepress_stage_frozen_author s"
+            " WHERE f.{pk} = s.frozen_author_id".format(
+                frozen=table(FrozenAuthor),
+                assignments=", ".join(assignments),
+                pk=column(FrozenAuthor, "id"),
+            )
+        )
+
+    def merge_identifiers(self, documents, articles):
+        dois = {
+            articles[bepress_id].pk: record["fields"]["doi"]
+            for bepress_id, (_, _, record) in documents.items()
+            if record["fields"].get("doi") is not None
+        }
+        existing = set(Identifier.objects.filter(
+            id_type="doi", article_id__in=dois,
+        ).values_list("article_id", "identifier"))
+        Identifier.objects.bulk_create([
+            Identifier(id_type="doi", article_id=article_id, identifier=doi)
+            for article_id, doi in dois.items()
+            if (article_id, doi) not in existing
+        ])
+
+    def merge(self, documents, import_batch):
+        """ Merges a chunk of documents in a single transaction
+        :param documents: A dict of bepress id -> (root, files, record)
+        :param import_batch: The batch.ImportBatch of the import
+        :return: A dict of bepress id -> submission.Article
+        """
+        records_ = {
+            bepress_id: record
+            for bepress_id, (_, _, record) in documents.items()
+        }
+        with transaction.atomic(), connection.cursor() as cursor:
+            articles = self.timed(
+                "create_articles", self.get_articles, records_)
+            accounts = self.timed(
+                "copy", self.stage, cursor, documents, articles)
+            self.timed("merge_articles", self.merge_articles, cursor)
+            self.timed("merge_authors", self.merge_authors, cursor)
+            self.timed(
+                "merge_frozen_authors", self.merge_frozen_authors,
+                cursor, documents, articles, accounts,
+            )
+            self.timed(
+                "merge_identifiers", self.merge_identifiers,
+                documents, articles,
+            )
+            self.timed(
+                "registries", self.add_to_registries,
+                documents, articles, import_batch,
+            )
+            self.timed(
+                "media_galleys", self.add_media_galleys, documents, articles)
+        if self.identities is not None:
+            for bepress_id, record in records_.items():
+                self.identities.add(record, articles[bepress_id].pk)
+        return articles
+
+    def add_to_registries(self, documents, articles, import_batch):
+        for bepress_id, (root, files_, record) in documents.items():
+            article = articles[bepress_id]
+            import_batch.issues.add_article(
+                article, root, record["publication_title"])
+            utils.metadata_keywords(record, article, import_batch.keywords)
+            if record["fields"].get("notes") is not None:
+                import_batch.notes.add_note(article, record["fields"]["notes"])
+            for text in utils.get_publisher_notes(record):
+                import_batch.notes.add_publisher_note(article, text)
+            if import_batch.custom_fields:
+                import_batch.custom_fields.add_answers(record, article)
+            import_batch.files.add(utils.collect_pending_files(
+                record, article, root, files_, self.stamped))
+        import_batch.flush()
+
+    def add_media_galleys(self, documents, articles):
+        """ Generates the youtube galleys, which can't be deferred"""
+        for bepress_id, (_, _, record) in documents.items():
+            if record["fields"].get("multimedia_format") == "youtube":
+                article = submission_models.Article.objects.get(
+                    pk=articles[bepress_id].pk)
+                utils.add_multimedia_galley(record, article)
+
+
+def get_author_details(author):
+    """ Maps the author of a record to the fields of an account"""
+    details = {
+        "first_name": author["fname"] if author["fname"] is not None else " ",
+        "last_name": author["lname"] if author["lname"] is not None else " ",
+    }
+    if author["mname"] is not None:
+        details["middle_name"] = author["mname"]
+    if author["institution"] is not None:
+        details["institution"] = author["institution"]
+    return details
+
+
+def import_archive_etl(
+    folder, stamped, site, struct,
+    default_section=None, section_key=None, import_path=None,
+    custom_fields=None, chunk_size=CHUNK_SIZE, retry_failed=False,
+    force=False,
+):
+    """ Imports the articles of an export with set-based merges
+    Takes the same arguments as utils.import_archive, other than:
+    :param chunk_size: Number of documents merged at a time
+    :return: A utils.ImportSummary
+    """
+    if not is_supported():
+        logger.warning(
+            "The ETL engine requires PostgreSQL, using the ORM import")
+        return utils.import_archive(
+            folder, stamped, site, struct,
+            default_section, section_key, import_path,
+            custom_fields=custom_fields,
+            defer_files=True,
+            retry_failed=retry_failed,
+            force=force,
+        )
+    logger.set_prefix(site.code)
+    path = os.path.join(BEPRESS_PATH, folder)
+    failure_log = failures.FailureLog(site, folder, path)
+    if retry_failed:
+        documents = list(failure_log.documents())
+    else:
+        documents = list(utils.iter_metadata_roots(path, import_path))
+    record_cache = records.RecordCache()
+    record_cache.prune()
+    planner = issues.IssuePlanner(site, struct, path)
+    planner.plan((root for root, _ in documents), record_cache)
+
+    def make_batch():
+        import_batch = batch.ImportBatch(
+            size=chunk_size,
+            issues=planner,
+            notes=NoteRegistry(),
+            keywords=KeywordRegistry(),
+            files=ingest.FileQueue(),
+        )
+        if custom_fields:
+            import_batch.custom_fields = CustomFieldMapping(
+                site, custom_fields)
+        return import_batch
+
+    import_batch = make_batch()
+    identities = identity.IdentityIndex(site)
+    merge = ChunkMerge(
+        site, folder, stamped, default_section, section_key, identities)
+    content_hashes = identity.ContentHashes(identities)
+    options = utils.import_options(
+        stamped, default_section, section_key, custom_fields)
+    # root -> digest of the documents waiting to be merged
+    digests = {}
+    summary = utils.ImportSummary()
+
+    def merge_chunk(chunk):
+        """ Merges a chunk of documents, bisecting it when the merge fails so
+        that only the failing documents are left out of the import
+        :param chunk: A dict of bepress id -> (root, files, record)
+        """
+        nonlocal import_batch
+        try:
+            articles = merge.merge(chunk, import_batch)
+        except Exception as e:
+            # Anything cached while merging the chunk was rolled back
+            merge.sections.clear()
+            merge.licences.clear()
+            planner.reset()
+            import_batch = make_batch()
+            if len(chunk) > 1:
+                logger.warning(
+                    "Merge of %d documents failed, retrying in halves: %s",
+                    len(chunk), e,
+                )
+                items = list(chunk.items())
+                middle = len(items) // 2
+                merge_chunk(dict(items[:middle]))
+                merge_chunk(dict(items[middle:]))
+                return
+            root, _, _ = next(iter(chunk.values()))
+            logger.error("Merge of %s failed: %s", root, e)
+            logger.exception(e)
+            summary.failed += 1
+            failure_log.record(root, "merge", e)
+            digests.pop(root)
+            return
+        summary.imported += len(chunk)
+        for bepress_id, (root, _, _) in chunk.items():
+            failure_log.resolve(root)
+            content_hashes.add(articles[bepress_id].pk, digests.pop(root))
+        content_hashes.flush()
+        logger.info("Merged %d documents", summary.imported)
+
+    chunk = {}
+    for root, files_ in documents:
+        try:
+            record = record_cache.load(os.path.join(root, "metadata.xml"))
+            digest = identity.document_digest(record, root, files_, options)
+            if not force and utils.is_unchanged(
+                record, digest, root, identities, failure_log,
+            ):
+                summary.skipped += 1
+                continue
+            bepress_id = int(record["articleid"])
+        except Exception as e:
+            summary.failed += 1
+            logger.error("Unable to load %s: %s", root, e)
+            failure_log.record(root, "load_record", e)
+            continue
+        if bepress_id in chunk:
+            # Both documents update the same article, in order
+            logger.warning(
+                "%s has the same article id as %s, merging it separately",
+                root, chunk[bepress_id][0],
+            )
+            merge_chunk(chunk)
+            chunk = {}
+        chunk[bepress_id] = (root, files_, record)
+        digests[root] = digest
+        if len(chunk) >= chunk_size:
+            merge_chunk(chunk)
+            chunk = {}
+    if chunk:
+        merge_chunk(chunk)
+
+    summary.add_records(record_cache)
+    summary.stage_reports = [
+        (name, 1, summary.imported, 0, busy)
+        for name, busy in merge.timings.items()
+    ]
+    return summary
@@ -0,0 +1,93 @@
+"""
+Log of the documents of an export that failed to import
+
+Each failed document is recorded as a FailedImport, along with the stage of
+the import at which it failed and the exception raised, so that an import
+can later be retried for the failed documents only.
+"""
+import os
+import traceback
+
+from django.db.models import F
+from django.utils import timezone
+
+from utils.logger import get_logger
+
+from plugins.bepress import archives, models
+
+logger = get_logger(__name__)
+
+
+class FailureLog:
+    def __init__(self, journal, dump_name, export_path):
+        """
+        :param journal: The journal.Journal receiving the import, if any
+        :param dump_name: The name of the bepress dump
+        :param export_path: The absolute path to the provided exported data
+        """
+        self.journal = journal
+        self.dump_name = dump_name
+        self.export_path = export_path
+        self.failed = set(self.get_queryset().values_list("path", flat=True))
+
+    def get_queryset(self):
+        return models.FailedImport.objects.filter(
+            journal=self.journal,
+            dump_name=self.dump_name,
+        )
+
+    def relative_path(self, root):
+        return os.path.relpath(root, self.export_path)
+
+    def record(self, root, stage, exception):
+        """ Records the failure to import the document in the given directory
+        :param root: The directory of the document
+        :param stage: The stage of the import that failed
+        :param exception: The exception raised by the stage
+        """
+        path = self.relative_path(root)
+        details = dict(
+            stage=stage or "",
+            exception=type(exception).__name__,
+            message=str(exception),
+            traceback="".join(traceback.format_exception(
+                type(exception), exception, exception.__traceback__,
+            )),
+            last_failed=timezone.now(),
+        )
+        updated = self.get_queryset().filter(path=path).update(
+            attempts=F("attempts") + 1,
+            **details
+        )
+        if not updated:
+            models.FailedImport.objects.create(
+                journal=self.journal,
+                dump_name=self.dump_name,
+                path=path,
+                **details
+            )
+        self.failed.add(path)
+
+    def resolve(self, root):
+        """ Clears any failure recorded for the document in the given directory
+        """
+        path = self.relative_path(root)
+        if path in self.failed:
+            self.get_queryset().filter(path=path).delete()
+            self.failed.discard(path)
+
+    def has_failed(self, root):
+        """ Whether the document in the given directory failed to import"""
+        return self.relative_path(root) in self.failed
+
+    def documents(self):
+        """ Finds the failed documents that are still present in the export
+        :return: A generator of tuples of the directory and its files, like
+            utils.iter_metadata_roots
+        """
+        for path in sorted(self.failed):
+            root = os.path.join(self.export_path, path)
+            if archives.isfile(os.path.join(root, "metadata.xml")):
+                yield root, archives.listdir(root)
+            else:
+                logger.warning("Failed document %s is no longer found", root)
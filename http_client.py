@@ -0,0 +1,272 @@
+"""
+Shared HTTP client for fetching remote bepress content
+
+Every request made by the plugin goes through a single pooled session with
+connect/read timeouts, retries with exponential backoff and jitter, support
+for the Retry-After header and an AIMD (additive increase, multiplicative
+decrease) concurrency controller per host. The controller lets imports run
+at the highest rate a Digital Commons origin tolerates: every successful
+response grows the number of concurrent requests allowed against that host,
+while throttling responses (429/503) and timeouts halve it. Streamed
+requests (stream=True) hold their slot until their body was read or the
+response closed, so that the limit also applies to concurrent downloads
+(See StreamSlot).
+
+Settings (all optional):
+ - BEPRESS_HTTP_TIMEOUT: (connect, read) timeout in seconds
+ - BEPRESS_HTTP_MAX_RETRIES: Number of retries before giving up on a request
+ - BEPRESS_HTTP_BACKOFF: (base, cap) in seconds for the exponential backoff
+ - BEPRESS_HTTP_CONCURRENCY: (initial, maximum) concurrent requests per host
+"""
+import datetime
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import weakref
+
+from django.conf import settings
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import SSLError
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CONNECT_TIMEOUT, READ_TIMEOUT = getattr(
+    settings, "BEPRESS_HTTP_TIMEOUT", (10, 60))
+MAX_RETRIES = getattr(settings, "BEPRESS_HTTP_MAX_RETRIES", 5)
+BACKOFF_BASE, BACKOFF_CAP = getattr(settings, "BEPRESS_HTTP_BACKOFF", (1, 120))
+INITIAL_CONCURRENCY, MAX_CONCURRENCY = getattr(
+    settings, "BEPRESS_HTTP_CONCURRENCY", (2, 16))
+
+# Responses that indicate the origin is overloaded and we should slow down
+THROTTLE_STATUS_CODES = {429, 503}
+RETRY_STATUS_CODES = THROTTLE_STATUS_CODES | {500, 502, 504}
+
+SUCCESS = "success"
+THROTTLED = "throttled"
+FAILED = "failed"
+
+
+class HostLimiter:
+    """ AIMD concurrency controller for requests against a single host
+
+    The limit grows by one slot once a full window of requests (as many as
+    the current limit) has succeeded, and is halved whenever the host
+    signals it is overloaded. A Retry-After header pauses the host entirely
+    until the given time has elapsed.
+    """
+    def __init__(self, initial=INITIAL_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.active = 0
+        self.resume_at = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                pause = self.resume_at - time.monotonic()
+                if pause > 0:
+                    self._condition.wait(pause)
+                elif self.active >= int(self.limit):
+                    self._condition.wait()
+                else:
+                    self.active += 1
+                    return
+
+    def release(self, outcome):
+        with self._condition:
+            self.active -= 1
+            if outcome == SUCCESS:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif outcome == THROTTLED:
+                self.limit = max(1, self.limit / 2)
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        with self._condition:
+            self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+
+class StreamSlot:
+    """ Holds the slot of a streamed request until its body was read
+    The slot is released once the body of the response was read in full or
+    the response was closed, whichever comes first. An error reading the
+    body (e.g. a timeout or a reset connection midway through a download)
+    counts as the host being overloaded.
+    """
+
+    def __init__(self, limiter, response):
+        """
+        :param limiter: The HostLimiter the slot was acquired from
+        :param response: A requests.Response made with stream=True
+        """
+        self.limiter = limiter
+        self.outcome = SUCCESS
+        self.released = False
+        self._lock = threading.Lock()
+        close = response.close
+        raw = response.raw
+        read = raw.read
+
+        def close_response():
+            try:
+                close()
+            finally:
+                self.release()
+
+        def read_body(*args, **kwargs):
+            try:
+                data = read(*args, **kwargs)
+            except Exception:
+                self.outcome = THROTTLED
+                self.release()
+                raise
+            if not data or raw.closed:
+                self.release()
+            return data
+
+        response.close = close_response
+        raw.read = read_body
+        # Responses dropped without being closed still give their slot back
+        weakref.finalize(response, self.release)
+
+    def release(self):
+        with self._lock:
+            if self.released:
+                return
+            self.released = True
+        self.limiter.release(self.outcome)
+
+
+class FetchClient:
+    """ A pooled HTTP session shared by all the fetches of the plugin"""
+
+    def __init__(
+        self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+        max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE,
+        backoff_cap=BACKOFF_CAP,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=MAX_CONCURRENCY,
+            pool_maxsize=MAX_CONCURRENCY,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter_for(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._limiters:
+                self._limiters[host] = HostLimiter()
+            return self._limiters[host]
+
+    def backoff(self, attempt):
+        """ Exponential backoff with full jitter"""
+        ceiling = min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        limiter = self.limiter_for(url)
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except SSLError:
+                limiter.release(FAILED)
+                raise
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                limiter.release(THROTTLED)
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(
+                    "%s %s failed (%s), retrying in %.1fs",
+                    method, url, exc, delay,
+                )
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    if kwargs.get("stream") and response.raw is not None:
+                        StreamSlot(limiter, response)
+                    else:
+                        limiter.release(SUCCESS)
+                    return response
+                if response.status_code in THROTTLE_STATUS_CODES:
+                    limiter.release(THROTTLED)
+                else:
+                    limiter.release(FAILED)
+                if attempt == self.max_retries:
+                    return response
+
+                retry_after = parse_retry_after(
+                    response.headers.get("Retry-After"))
+                if retry_after is not None:
+                    delay = min(retry_after, self.backoff_cap)
+                    limiter.pause(delay)
+                else:
+                    delay = self.backoff(attempt)
+                response.close()
+                logger.warning(
+                    "%s %s returned %s, retrying in %.1fs",
+                    method, url, response.status_code, delay,
+                )
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        kwargs.setdefault("allow_redirects", False)
+        return self.request("HEAD", url, **kwargs)
+
+
+def parse_retry_after(value):
+    """ Parses a Retry-After header into a number of seconds
+    :param value: The header value, either in seconds or an HTTP-date
+    :return: The number of seconds to wait or None if it can't be parsed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0, (retry_at - now).total_seconds())
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = FetchClient()
+        return _client
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    return get_client().head(url, **kwargs)
@@ -0,0 +1,189 @@
+"""
+Identity of the imported articles across dumps
+
+An ImportedArticle maps the bepress id of a document to an article for a
+single dump, so the same Digital Commons content imported from a newer dump,
+or from the output of an OAI harvest, would otherwise create a second
+article. The IdentityIndex resolves a document to the article already
+imported for its journal, by bepress article id, then DOI, then submission
+path, so that repeat imports from any source update the article in place.
+
+It also knows the digest of the document each article was last imported
+from, so that unchanged documents can be skipped altogether. The digest
+covers the metadata.xml of the document (See records.RecordCache.load), the
+names and sizes of its files and the options of the import (See
+document_digest). Articles are only stamped with it once their import went
+through, batch and files included (See ContentHashes).
+"""
+import hashlib
+import os
+
+from django.db.models import Case, CharField, Value, When
+
+from identifiers.models import Identifier
+from utils.logger import get_logger
+
+from plugins.bepress import archives, models
+
+logger = get_logger(__name__)
+
+
+class IdentityIndex:
+    def __init__(self, journal):
+        """ Loads the identities of all the articles imported for a journal
+        :param journal: The journal.Journal receiving the import
+        """
+        self.journal = journal
+        # bepress id -> article id
+        self.bepress_ids = {}
+        # submission path -> article id
+        self.submission_paths = {}
+        # DOI -> article id
+        self.dois = {}
+        # article id -> digest of the document last imported
+        self.content_hashes = {}
+        self.load()
+
+    def load(self):
+        imported_articles = models.ImportedArticle.objects.filter(
+            journal=self.journal,
+            article__isnull=False,
+        ).order_by("pk").values_list(
+            "article_id", "bepress_id", "submission_path", "content_hash",
+        )
+        for article_id, bepress_id, submission_path, content_hash in (
+            imported_articles
+        ):
+            # The earliest import wins where older dumps duplicated articles
+            self.bepress_ids.setdefault(bepress_id, article_id)
+            if submission_path:
+                self.submission_paths.setdefault(submission_path, article_id)
+            if content_hash:
+                self.content_hashes[article_id] = content_hash
+        dois = Identifier.objects.filter(
+            id_type="doi",
+            article__journal=self.journal,
+        ).order_by("pk").values_list("identifier", "article_id")
+        for doi, article_id in dois:
+            self.dois.setdefault(doi, article_id)
+        logger.info(
+            "Loaded the identities of %d imported articles",
+            len(self.content_hashes),
+        )
+
+    def find(self, record):
+        """ Finds the article previously imported for a record
+        :param record: The article metadata (See records.extract_record)
+        :return: The id of the article or None
+        """
+        article_id = self.bepress_ids.get(int(record["articleid"]))
+        if article_id is None:
+            doi = record["fields"].get("doi")
+            if doi:
+                article_id = self.dois.get(doi)
+        if article_id is None:
+            submission_path = get_submission_path(record)
+            if submission_path:
+                article_id = self.submission_paths.get(submission_path)
+        return article_id
+
+    def is_unchanged(self, record, digest):
+        """ Whether the record was already imported from the same document
+        :param record: A record loaded by records.RecordCache.load
+        :param digest: The digest of the document (See document_digest)
+        """
+        if not digest:
+            return False
+        article_id = self.find(record)
+        return (
+            article_id is not None
+            and self.content_hashes.get(article_id) == digest
+        )
+
+    def add(self, record, article_id):
+        """ Records the article a record was imported into
+        :param record: The article metadata (See records.extract_record)
+        :param article_id: The id of the submission.Article
+        """
+        self.bepress_ids.setdefault(int(record["articleid"]), article_id)
+        doi = record["fields"].get("doi")
+        if doi:
+            self.dois.setdefault(doi, article_id)
+        submission_path = get_submission_path(record)
+        if submission_path:
+            self.submission_paths.setdefault(submission_path, article_id)
+
+
+class ContentHashes:
+    """ Stamps the imported articles with the digest of their document
+    Digests are queued as the articles are imported and written when the
+    batch is flushed, after the other registries, so that a document which
+    failed halfway through isn't skipped by the next import.
+    """
+
+    def __init__(self, identities):
+        """
+        :param identities: The IdentityIndex of the journal, updated with
+            the digests once they are written
+        """
+        self.identities = identities
+        # article id -> digest
+        self.pending = {}
+
+    def add(self, article_id, digest):
+        if digest:
+            self.pending[article_id] = digest
+
+    def stamp(self, article_id, digest):
+        """ Stamps a single article right away"""
+        if digest:
+            self.write({article_id: digest})
+
+    def flush(self):
+        self.write(self.pending)
+        self.pending = {}
+
+    def write(self, digests):
+        if not digests:
+            return
+        # Other dumps of the articles now describe stale content
+        models.ImportedArticle.objects.filter(
+            journal=self.identities.journal,
+            article_id__in=digests,
+        ).update(content_hash=Case(
+            *(
+                When(article_id=article_id, then=Value(digest))
+                for article_id, digest in digests.items()
+            ),
+            output_field=CharField(),
+        ))
+        self.identities.content_hashes.update(digests)
+
+
+def document_digest(record, root, files_, options):
+    """ Hashes everything the import of a document depends on
+    :param record: A record loaded by records.RecordCache.load
+    :param root: The directory of the document
+    :param files_: The names of the files of the document
+    :param options: The options of the import (See utils.import_options)
+    :return: A hex digest, or None for records without a digest
+    """
+    if not record.get("digest"):
+        return None
+    digest = hashlib.sha256(record["digest"].encode())
+    for name in sorted(files_):
+        try:
+            size = archives.getsize(os.path.join(root, name))
+        except OSError:
+            size = None
+        digest.update(("\0%s\0%s" % (name, size)).encode())
+    digest.update(("\0%r" % (options,)).encode())
+    return digest.hexdigest()
+
+
+def get_submission_path(record):
+    """ Gets the submission path of a record as stored on ImportedArticle"""
+    submission_path = record["submission_path"]
+    if submission_path:
+        return submission_path.strip("/")
+    return None
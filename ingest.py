@@ -0,0 +1,264 @@
+"""
+Second phase of an import with deferred files
+
+When importing with deferred files, the metadata of the whole archive is
+imported first, while the galleys and supplementary files of each article
+are queued as PendingFile records. These are then fetched and attached by a
+separate job (See the ingest_bepress_files command) which can run
+concurrently with other ingestion jobs.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django import db
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core import files
+from submission import models as submission_models
+from utils.logger import get_logger
+
+from plugins.bepress import archives, http_client, models
+
+logger = get_logger(__name__)
+
+# Number of threads fetching files concurrently
+FILE_WORKERS = getattr(settings, "BEPRESS_FILE_WORKERS", 4)
+# Number of pending files claimed by a job at a time
+CLAIM_SIZE = getattr(settings, "BEPRESS_FILE_CLAIM_SIZE", 50)
+# Number of times a file is attempted before being marked as failed
+MAX_ATTEMPTS = getattr(settings, "BEPRESS_FILE_MAX_ATTEMPTS", 3)
+# Claims older than this are assumed to belong to a job that died
+CLAIM_TIMEOUT = timedelta(
+    seconds=getattr(settings, "BEPRESS_FILE_CLAIM_TIMEOUT", 60 * 60))
+
+
+class FileQueue:
+    """ Queues the PendingFile records of a batch of articles"""
+
+    def __init__(self):
+        self.pending = []
+
+    def add(self, pending_files):
+        self.pending.extend(pending_files)
+
+    def flush(self):
+        """ Saves the queued files, skipping those already waiting to be
+        fetched for the same article (e.g. when an archive is imported again)
+        """
+        if not self.pending:
+            return
+        queued = set(models.PendingFile.objects.filter(
+            article_id__in={pending.article_id for pending in self.pending},
+            status__in=(models.PendingFile.PENDING, models.PendingFile.CLAIMED),
+        ).values_list("article_id", "kind", "url", "path"))
+        new_files = []
+        for pending in self.pending:
+            key = (pending.article_id, pending.kind, pending.url, pending.path)
+            if key not in queued:
+                queued.add(key)
+                new_files.append(pending)
+        models.PendingFile.objects.bulk_create(new_files)
+        self.pending = []
+
+
+class IngestSummary:
+    """ Counters reported at the end of a file ingestion job"""
+
+    def __init__(self):
+        self.ingested = 0
+        self.retried = 0
+        self.failed = 0
+
+    def merge(self, other):
+        self.ingested += other.ingested
+        self.retried += other.retried
+        self.failed += other.failed
+
+    def __str__(self):
+        return "\n".join([
+            "Ingested: %d" % self.ingested,
+            "Retried: %d" % self.retried,
+            "Failed: %d" % self.failed,
+        ])
+
+
+def claim_pending_files(size=CLAIM_SIZE, journal=None):
+    """ Claims pending files so that no other job ingests them
+    The files of an article are claimed together, since attaching them
+    concurrently could result in duplicate galleys.
+    :param size: The number of files to claim
+    :param journal: Only claim the files of the given journal.Journal
+    :return: A list of the claimed models.PendingFile
+    """
+    claimable = models.PendingFile.objects.filter(
+        Q(status=models.PendingFile.PENDING)
+        | Q(
+            status=models.PendingFile.CLAIMED,
+            claimed_at__lt=timezone.now() - CLAIM_TIMEOUT,
+        )
+    )
+    if journal:
+        claimable = claimable.filter(
+            article__in=submission_models.Article.objects.filter(
+                journal=journal),
+        )
+    with transaction.atomic():
+        locked = claimable
+        if db.connection.features.has_select_for_update_skip_locked:
+            locked = locked.select_for_update(skip_locked=True)
+        article_ids = set(locked.order_by(
+            "article_id", "pk").values_list("article_id", flat=True)[:size])
+        if not article_ids:
+            return []
+        if db.connection.features.has_select_for_update_skip_locked:
+            claimable = claimable.select_for_update(skip_locked=True)
+        claimed_ids = list(claimable.filter(
+            article_id__in=article_ids,
+        ).values_list("pk", flat=True))
+        models.PendingFile.objects.filter(pk__in=claimed_ids).update(
+            status=models.PendingFile.CLAIMED,
+            claimed_at=timezone.now(),
+        )
+    return list(
+        models.PendingFile.objects.filter(
+            pk__in=claimed_ids,
+        ).select_related("article").order_by("pk")
+    )
+
+
+def ingest_files(journal=None, workers=FILE_WORKERS, claim_size=CLAIM_SIZE):
+    """ Ingests pending files until the queue is exhausted
+    :param journal: Only ingest the files of the given journal.Journal
+    :param workers: Number of threads fetching files concurrently
+    :param claim_size: The number of files claimed at a time
+    :return: An IngestSummary
+    """
+    summary = IngestSummary()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            claimed = claim_pending_files(claim_size, journal)
+            if not claimed:
+                break
+            by_article = OrderedDict()
+            for pending in claimed:
+                by_article.setdefault(pending.article_id, []).append(pending)
+            for result in executor.map(
+                _ingest_in_thread, by_article.values(),
+            ):
+                summary.merge(result)
+            logger.info("Ingested %d files so far", summary.ingested)
+    return summary
+
+
+def ingest_article_files(pending_files):
+    """ Ingests the pending files of a single article in order
+    :param pending_files: A list of claimed models.PendingFile
+    :return: An IngestSummary
+    """
+    summary = IngestSummary()
+    for pending in pending_files:
+        pending.attempts += 1
+        try:
+            ingest_file(pending)
+        except Exception as e:
+            logger.error(
+                "Failed to ingest %s file of article %s: %s",
+                pending.kind, pending.article_id, e,
+            )
+            pending.error = str(e)
+            if pending.attempts >= MAX_ATTEMPTS:
+                pending.status = models.PendingFile.FAILED
+                summary.failed += 1
+                # The document of the article is no longer skipped on import
+                models.ImportedArticle.objects.filter(
+                    article_id=pending.article_id,
+                ).update(content_hash="")
+            else:
+                pending.status = models.PendingFile.PENDING
+                summary.retried += 1
+        else:
+            pending.status = models.PendingFile.DONE
+            pending.error = ""
+            summary.ingested += 1
+        pending.save(update_fields=["status", "attempts", "error"])
+    return summary
+
+
+def _ingest_in_thread(pending_files):
+    try:
+        return ingest_article_files(pending_files)
+    finally:
+        # Connections are per thread, close them before the thread is reused
+        db.connections.close_all()
+
+
+def ingest_file(pending):
+    """ Fetches a pending file and attaches it to its article
+    :param pending: A models.PendingFile
+    """
+    attach_pending_file(pending, fetch_pending_file(pending))
+
+
+def fetch_pending_file(pending):
+    """ Downloads (or opens) a pending file
+    :param pending: A models.PendingFile
+    :return: A django File, or None when there is nothing to attach
+    """
+    # Imported here since utils depends on this module for the FileQueue
+    from plugins.bepress import utils
+
+    if pending.kind == models.PendingFile.PDF_GALLEY:
+        if pending.path:
+            return archives.open_local(pending.path)
+        pdf_file = utils.fetch_galley_url(pending.url)
+        if pdf_file is None:
+            raise ValueError("Error fetching galley at %s" % pending.url)
+        return pdf_file
+    elif pending.kind == models.PendingFile.SUPP_FILE:
+        return utils.fetch_file(pending.url, pending.mime_type)
+    elif pending.kind == models.PendingFile.RELATION_GALLEY:
+        response = utils.unsafe_get_request(pending.url)
+        mime_type = utils.get_content_type_from_headers(response)
+        if mime_type in files.HTML_MIMETYPES:
+            return utils.fetch_file(pending.url, mime_type, "article.html")
+    elif pending.kind == models.PendingFile.IMAGE_GALLEY:
+        # Make a head request to check the mime
+        response = http_client.head(pending.url, allow_redirects=True)
+        mime_type = utils.get_content_type_from_headers(response)
+        if mime_type and mime_type in files.IMAGE_MIMETYPES:
+            return utils.fetch_file(pending.url, mime_type)
+    else:
+        raise ValueError("Unknown file kind %s" % pending.kind)
+    return None
+
+
+def attach_pending_file(pending, django_file):
+    """ Attaches a fetched file to the article it is pending for
+    :param pending: A models.PendingFile
+    :param django_file: The file returned by fetch_pending_file
+    """
+    from plugins.bepress import utils
+
+    if django_file is None:
+        return
+    article = pending.article
+    try:
+        if pending.kind == models.PendingFile.PDF_GALLEY:
+            utils.add_pdf_galley(django_file, article)
+        elif pending.kind == models.PendingFile.SUPP_FILE:
+            # HTML files are loaded as supplemental files
+            if pending.mime_type in files.HTML_MIMETYPES:
+                utils.add_html_galley(django_file, article)
+            else:
+                utils.add_supp_file_to_article(
+                    django_file, None, article, label=pending.label)
+        elif pending.kind == models.PendingFile.RELATION_GALLEY:
+            utils.add_html_galley(django_file, article)
+        elif pending.kind == models.PendingFile.IMAGE_GALLEY:
+            utils.add_image_galley(django_file, article)
+    finally:
+        django_file.close()
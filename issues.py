@@ -0,0 +1,247 @@
+"""
+Planning of the issues of a bepress archive
+
+A volume/issue is shared by dozens of articles, so rather than resolving
+the issue of every article as it is imported, the IssuePlanner derives the
+complete set of issues for the archive up front from the directory
+structure, creates the missing ones in bulk and attaches the imported
+articles to them in batches.
+"""
+from collections import defaultdict
+import os
+
+from django.utils import timezone
+from lxml import etree
+
+from journal import models as journal_models
+from submission import models as submission_models
+from utils.logger import get_logger
+
+from plugins.bepress import archives
+from plugins.bepress import batch
+from plugins.bepress import const
+from plugins.bepress.dates import parse_bepress_date
+
+logger = get_logger(__name__)
+
+
+def get_issue_details(relative_path, struct, date_published, pub_title=None):
+    """ Derives the issue of an article from the location of its metadata
+
+    Bepress exports have roughly this structure:
+    - Journal export (JOURNAL_STRUCTURE):
+        path/to/export/vol{volume_id}/iss{issue_id}/{article_id}/*
+    - Conference export (EVENTS_STRUCTURE):
+        path/to/export/{year}/*/*
+    :param relative_path: The path of the metadata.xml relative to the export
+    :param struct: (str) One of const.BEPRESS_STRUCTURES
+    :param date_published: The publication datetime of the article
+    :param pub_title: The publication-title of the article
+    :return: A tuple of the issue key (volume, issue, title), the year of the
+        issue and the code of its IssueType
+    """
+    year = issue_num = vol_num = None
+    issue_title = ""
+    issue_type_code = "issue"
+    if struct == const.EVENTS_STRUCTURE:
+        issue_type_code = "collection"
+        _, year, *remaining = relative_path.split("/")
+        if not year.isdigit():
+            year = str(date_published.year)
+        if pub_title:
+            issue_title = "%s %s" % (pub_title, year)
+    elif struct == const.JOURNAL_STRUCTURE:
+        _, volume_code, issue_code, article_id = relative_path.split("/")
+        vol_num = int(volume_code.replace("vol", ""))  # volN
+        issue_num = int(issue_code.replace("iss", ""))  # issN
+        # We don't have an issue date on metadata.xml so we use the article's
+        if date_published:
+            year = str(date_published.year)
+    elif struct == const.SERIES_STRUCTURE:
+        year = vol_num = str(date_published.year - 1)
+    else:
+        raise RuntimeError("Unkown bepress structure %s" % struct)
+
+    key = issue_key(vol_num or 1, issue_num or year, issue_title)
+    return key, year, issue_type_code
+
+
+def issue_key(volume, issue, issue_title):
+    return int(volume), str(issue), issue_title or ""
+
+
+def read_issue_metadata(metadata_path):
+    """ Reads the metadata required for planning the issue of an article
+    :return: A tuple of the publication date and publication title
+    """
+    parser = etree.XMLParser(recover=True, resolve_entities=False)
+    with archives.open_local(metadata_path) as metadata_file:
+        tree = etree.parse(metadata_file, parser=parser)
+    date_string = tree.findtext(".//publication-date")
+    pub_title = tree.findtext(".//publication-title")
+    date_published = parse_bepress_date(date_string) or timezone.now()
+    return date_published, pub_title
+
+
+class IssuePlanner:
+    def __init__(self, journal, struct, export_path):
+        """
+        :param journal: The journal.Journal receiving the import
+        :param struct: (str) One of const.BEPRESS_STRUCTURES
+        :param export_path: The absolute path to the provided exported data
+        """
+        self.journal = journal
+        self.struct = struct
+        self.export_path = export_path
+        self.issues = {}
+        self.pending = defaultdict(list)
+        self.issue_types = {
+            issue_type.code: issue_type
+            for issue_type in journal_models.IssueType.objects.filter(
+                journal=journal,
+                code__in={"issue", "collection"},
+            )
+        }
+
+    def get_details(self, root_path, date_published, pub_title=None):
+        relative_path = root_path.replace(self.export_path, "")
+        return get_issue_details(
+            relative_path, self.struct, date_published, pub_title)
+
+    def plan(self, roots, record_cache=None):
+        """ Creates in bulk all the issues required by the given documents
+        :param roots: The directories containing a metadata.xml to import
+        :param record_cache: An optional records.RecordCache to read the
+            documents from, which caches their records for the import
+        """
+        planned = {}
+        for root in roots:
+            metadata_path = os.path.join(root, "metadata.xml")
+            try:
+                if record_cache is not None:
+                    record = record_cache.load(metadata_path)
+                    date_published = parse_bepress_date(
+                        record["publication_date"]) or timezone.now()
+                    pub_title = record["publication_title"]
+                else:
+                    date_published, pub_title = read_issue_metadata(
+                        metadata_path)
+                key, year, type_code = self.get_details(
+                    root, date_published, pub_title)
+            except Exception as e:
+                logger.warning("Unable to plan issue for %s: %s", root, e)
+                continue
+            planned_year, _ = planned.get(key, (None, None))
+            if year and (not planned_year or year < planned_year):
+                planned[key] = (year, type_code)
+            else:
+                planned.setdefault(key, (planned_year, type_code))
+
+        self.issues = self.load_issues()
+        new_issues = []
+        updated_issues = []
+        for key, (year, type_code) in planned.items():
+            issue_date = parse_bepress_date(year) if year else None
+            issue = self.issues.get(key)
+            if issue is None:
+                volume, issue_num, issue_title = key
+                new_issues.append(journal_models.Issue(
+                    journal=self.journal,
+                    volume=volume,
+                    issue=issue_num,
+                    issue_title=issue_title,
+                    issue_type=self.issue_types.get(type_code),
+                    date=issue_date or timezone.now(),
+                ))
+            elif issue_date and issue.date != issue_date:
+                issue.date = issue_date
+                updated_issues.append(issue)
+
+        batch.bulk_create(journal_models.Issue, new_issues)
+        journal_models.Issue.objects.bulk_update(updated_issues, ["date"])
+        logger.info(
+            "Planned %d issues (%d new)", len(planned), len(new_issues))
+        for issue in new_issues:
+            key = issue_key(issue.volume, issue.issue, issue.issue_title)
+            self.issues[key] = issue
+
+    def load_issues(self):
+        return {
+            issue_key(issue.volume, issue.issue, issue.issue_title): issue
+            for issue in journal_models.Issue.objects.filter(
+                journal=self.journal,
+            )
+        }
+
+    def reset(self):
+        """ Drops the queued articles and reloads the issues, after the
+        transaction in which they were added was rolled back
+        """
+        self.pending.clear()
+        self.issues = self.load_issues()
+
+    def get_issue(self, article, root_path, pub_title=None):
+        """ Returns the planned issue for the article, creating it if needed
+        """
+        key, year, type_code = self.get_details(
+            root_path, article.date_published, pub_title)
+        return self.get_or_create_issue(key, year, type_code)
+
+    def get_or_create_issue(self, key, year, type_code):
+        if key not in self.issues:
+            volume, issue_num, issue_title = key
+            issue, created = journal_models.Issue.objects.get_or_create(
+                journal=self.journal,
+                volume=volume,
+                issue=issue_num,
+                issue_title=issue_title,
+                defaults={
+                    "issue_type": self.issue_types.get(type_code),
+                    "date": parse_bepress_date(year) if year else timezone.now(),
+                },
+            )
+            if created:
+                logger.info("Created new issue {}".format(issue))
+            self.issues[key] = issue
+        return self.issues[key]
+
+    def add_article(self, article, root_path, pub_title=None):
+        """ Queues the article to be added to its issue on the next flush
+        :return: The issue of the article, or None when it can't be derived
+            from the path and metadata of the article, in which case the
+            article is imported without an issue
+        """
+        try:
+            key, year, type_code = self.get_details(
+                root_path, article.date_published, pub_title)
+        except Exception as e:
+            logger.exception(e)
+            logger.error(
+                "Failed to get issue details for %s, path: %s",
+                article, root_path,
+            )
+            return None
+        issue = self.get_or_create_issue(key, year, type_code)
+        self.pending[issue].append(article.pk)
+        return issue
+
+    def flush(self):
+        """ Adds all queued articles to their issues"""
+        if not self.pending:
+            return
+        through = journal_models.Issue.articles.through
+        through.objects.bulk_create(
+            [
+                through(issue_id=issue.pk, article_id=article_id)
+                for issue, article_ids in self.pending.items()
+                for article_id in article_ids
+            ],
+            ignore_conflicts=True,
+        )
+        for issue, article_ids in self.pending.items():
+            submission_models.Article.objects.filter(
+                pk__in=article_ids,
+            ).update(primary_issue=issue)
+            logger.info(
+                "Added %d articles to issue %s", len(article_ids), issue)
+        self.pending.clear()
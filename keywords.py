@@ -0,0 +1,87 @@
+"""
+Import-wide registry of normalized keywords
+
+Keywords are folded on case and whitespace, so that "Open  Access" and
+"open access" resolve to the same Keyword. Existing keywords are loaded once
+per import, and new keywords and their links to the articles are created
+in bulk once per batch.
+"""
+from submission import models as submission_models
+from utils.logger import get_logger
+
+from plugins.bepress import batch
+
+logger = get_logger(__name__)
+
+
+def clean_keyword(word):
+    """ Collapses the whitespace in the given keyword"""
+    return " ".join(word.split())
+
+
+def keyword_key(word):
+    return clean_keyword(word).casefold()
+
+
+class KeywordRegistry:
+    def __init__(self):
+        # normalized keyword -> Keyword id
+        self.keywords = {}
+        self.new_keywords = {}
+        # (article id, normalized keyword) -> order
+        self.links = {}
+        self.orders = {}
+        self.max_length = submission_models.Keyword._meta.get_field(
+            "word").max_length
+        self.preload()
+
+    def preload(self):
+        existing = submission_models.Keyword.objects.order_by(
+            "pk").values_list("pk", "word")
+        for pk, word in existing.iterator():
+            # Keep the oldest of any pre-existing near-duplicates
+            self.keywords.setdefault(keyword_key(word), pk)
+
+    def add_keywords(self, article, words):
+        """ Queues the given keywords to be linked to the article
+        :param article: A submission.Article
+        :param words: An iterable of keywords as found in the metadata
+        """
+        order = self.orders.get(article.pk, 0)
+        for word in words:
+            word = clean_keyword(word)
+            if not word:
+                continue
+            if self.max_length and len(word) > self.max_length:
+                logger.warning("Keyword too long, skipping: %s", word)
+                continue
+            key = word.casefold()
+            if key not in self.keywords and key not in self.new_keywords:
+                self.new_keywords[key] = submission_models.Keyword(word=word)
+            if (article.pk, key) not in self.links:
+                self.links[(article.pk, key)] = order
+                order += 1
+        self.orders[article.pk] = order
+
+    def flush(self):
+        new_keywords = batch.bulk_create(
+            submission_models.Keyword,
+            list(self.new_keywords.values()),
+        )
+        for key, keyword in zip(self.new_keywords, new_keywords):
+            self.keywords[key] = keyword.pk
+        self.new_keywords = {}
+
+        through = submission_models.Article.keywords.through
+        has_order = any(
+            field.name == "order" for field in through._meta.get_fields()
+        )
+        links = []
+        for (article_id, key), order in self.links.items():
+            link = through(article_id=article_id, keyword_id=self.keywords[key])
+            if has_order:
+                link.order = order
+            links.append(link)
+        through.objects.bulk_create(links, ignore_conflicts=True)
+        self.links = {}
+        self.orders = {}
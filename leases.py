@@ -0,0 +1,222 @@
+"""
+Distributed imports of a bepress export
+
+The export is split into units of work (the directories containing the
+documents, i.e. the issues of a journal) which are registered in the
+database. Any number of workers, on any number of hosts, can then lease the
+units and import them. A worker renews the lease of its unit while
+importing it, and the units of workers that stop renewing their leases are
+reclaimed by other workers once the lease expires.
+"""
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django import db
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from utils.logger import get_logger
+
+from plugins.bepress import models, utils
+from plugins.bepress.plugin_settings import BEPRESS_PATH
+
+logger = get_logger(__name__)
+
+# Seconds after which the lease of a unit expires unless it is renewed
+LEASE_DURATION = getattr(settings, "BEPRESS_LEASE_DURATION", 300)
+# Seconds between renewals of a lease by a worker
+HEARTBEAT_INTERVAL = getattr(settings, "BEPRESS_LEASE_HEARTBEAT", 60)
+# Number of leases of a unit after which it is marked as failed
+MAX_ATTEMPTS = getattr(settings, "BEPRESS_LEASE_MAX_ATTEMPTS", 3)
+
+
+def get_owner():
+    """ Identifies this worker across hosts"""
+    return "%s:%d" % (socket.gethostname(), os.getpid())
+
+
+def register_work_units(journal, dump_name):
+    """ Registers the units of work of an export
+    Units that were already registered are left untouched, so that an export
+    can be registered again once more content has been added to it.
+    :param journal: The journal.Journal receiving the import
+    :param dump_name: The name of the bepress dump
+    :return: The number of units of the export
+    """
+    path = os.path.join(BEPRESS_PATH, dump_name)
+    unit_paths = sorted({
+        utils.get_unit_path(root, path)
+        for root, _ in utils.iter_metadata_roots(path)
+    })
+    models.WorkUnit.objects.bulk_create(
+        [
+            models.WorkUnit(journal=journal, dump_name=dump_name, path=path_)
+            for path_ in unit_paths
+        ],
+        ignore_conflicts=True,
+    )
+    return len(unit_paths)
+
+
+def lease_work_unit(journal, dump_name, owner):
+    """ Leases the next unit of work available
+    Units are claimed with a conditional UPDATE rather than by locking their
+    rows, which not every database supports: a worker only gets a unit when
+    the unit was still available as it updated it, and moves on to the next
+    unit when another worker got there first.
+    :param owner: The identifier of the worker leasing the unit
+    :return: The leased models.WorkUnit or None when no unit is available
+    """
+    while True:
+        now = timezone.now()
+        available = Q(status=models.WorkUnit.PENDING) | Q(
+            status=models.WorkUnit.LEASED, lease_expires__lt=now,
+        )
+        unit = models.WorkUnit.objects.filter(
+            available,
+            journal=journal,
+            dump_name=dump_name,
+        ).order_by("pk").first()
+        if unit is None:
+            return None
+        claimed = models.WorkUnit.objects.filter(available, pk=unit.pk).update(
+            status=models.WorkUnit.LEASED,
+            owner=owner,
+            lease_expires=now + timedelta(seconds=LEASE_DURATION),
+            attempts=F("attempts") + 1,
+        )
+        if not claimed:
+            # Leased by another worker since it was read
+            continue
+        if unit.status == models.WorkUnit.LEASED:
+            logger.warning(
+                "Reclaiming unit %s from expired lease of %s",
+                unit.path, unit.owner,
+            )
+        unit.refresh_from_db()
+        return unit
+
+
+def renew_lease(unit):
+    """ Extends the lease of a unit
+    :return: False when the lease was lost to another worker
+    """
+    return bool(models.WorkUnit.objects.filter(
+        pk=unit.pk,
+        owner=unit.owner,
+        status=models.WorkUnit.LEASED,
+    ).update(
+        lease_expires=timezone.now() + timedelta(seconds=LEASE_DURATION),
+    ))
+
+
+def complete_work_unit(unit, summary):
+    """ Records the outcome of the import of a unit
+    :param unit: The leased models.WorkUnit
+    :param summary: The utils.ImportSummary of the import of the unit
+    :return: False when the lease was lost to another worker
+    """
+    return bool(models.WorkUnit.objects.filter(
+        pk=unit.pk,
+        owner=unit.owner,
+        status=models.WorkUnit.LEASED,
+    ).update(
+        status=models.WorkUnit.DONE,
+        lease_expires=None,
+        imported=summary.imported,
+        failed=summary.failed,
+        error="",
+    ))
+
+
+def release_work_unit(unit, error):
+    """ Returns a unit whose import crashed to the pool of available units
+    Units that crashed too many times are marked as failed instead.
+    """
+    if unit.attempts >= MAX_ATTEMPTS:
+        status = models.WorkUnit.FAILED
+    else:
+        status = models.WorkUnit.PENDING
+    models.WorkUnit.objects.filter(pk=unit.pk, owner=unit.owner).update(
+        status=status,
+        lease_expires=None,
+        error=str(error),
+    )
+
+
+class Heartbeat(threading.Thread):
+    """ Renews the lease of a unit until stopped
+    Sets `lost` when the lease is lost to another worker, so that the import
+    of the unit can be abandoned.
+    """
+
+    def __init__(self, unit, interval=HEARTBEAT_INTERVAL):
+        super().__init__(daemon=True)
+        self.unit = unit
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                if not renew_lease(self.unit):
+                    logger.warning(
+                        "Lost the lease of unit %s", self.unit.path)
+                    self.lost.set()
+                    break
+        finally:
+            # Connections are per thread
+            db.connections.close_all()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_worker(site, folder, owner=None, **import_kwargs):
+    """ Leases and imports units of work until there are none left
+    The indexes of the journal (See utils.ImportState) are built once and
+    shared by the imports of all the units leased by the worker.
+    :param site: The journal.Journal receiving the import
+    :param folder: The name of the bepress dump
+    :param owner: The identifier of this worker (See get_owner)
+    :param import_kwargs: Passed on to utils.import_archive
+    :return: A utils.ImportSummary of all the units imported by this worker
+    """
+    owner = owner or get_owner()
+    summary = utils.ImportSummary()
+    state = None
+    while True:
+        unit = lease_work_unit(site, folder, owner)
+        if unit is None:
+            break
+        logger.info("Importing unit %s as %s", unit.path or "/", owner)
+        if state is None:
+            state = utils.ImportState(folder, site)
+        heartbeat = Heartbeat(unit)
+        heartbeat.start()
+        try:
+            unit_summary = utils.import_archive(
+                folder=folder, site=site, unit_path=unit.path,
+                state=state, stop=heartbeat.lost,
+                **import_kwargs
+            )
+        except Exception as e:
+            logger.exception(e)
+            release_work_unit(unit, e)
+            # The registries may hold the writes of the failed import
+            state = None
+        else:
+            summary.merge(unit_summary)
+            if heartbeat.lost.is_set() or not complete_work_unit(
+                unit, unit_summary,
+            ):
+                logger.warning(
+                    "Abandoned unit %s, leased by another worker", unit.path)
+        finally:
+            heartbeat.stop()
+    return summary
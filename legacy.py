@@ -0,0 +1,279 @@
+"""
+Redirects from legacy Digital Commons URLs to the imported articles
+
+After a migration, old Digital Commons links keep pointing at URLs such as:
+ - /cgi/viewcontent.cgi?article=1234&context=foo
+ - /foo/vol3/iss2/5/
+The LegacyURLIndex maps those URLs to the imported articles from an
+in-memory index built from ImportedArticle (and ImportedChapter) records,
+so that resolving a URL doesn't require a database query. Each journal has
+its own index, loaded on the first legacy URL requested from the journal,
+so that URLs only resolve to the articles of the journal they are requested
+from. Indexes are refreshed incrementally as new imports land, and rebuilt
+periodically in the background.
+
+To enable the redirects, add the middleware to your settings:
+    MIDDLEWARE += ("plugins.bepress.legacy.LegacyRedirectMiddleware",)
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponsePermanentRedirect
+from django.urls import NoReverseMatch, reverse
+
+from journal.models import Journal
+from utils.logger import get_logger
+
+from plugins.bepress import models
+
+logger = get_logger(__name__)
+
+# Seconds between checks for newly imported articles
+REFRESH_INTERVAL = getattr(settings, "BEPRESS_LEGACY_REFRESH_INTERVAL", 60)
+# Seconds between full rebuilds of the index, which pick up updated records
+REBUILD_INTERVAL = getattr(settings, "BEPRESS_LEGACY_REBUILD_INTERVAL", 3600)
+CHAPTER_URL_NAME = getattr(
+    settings, "BEPRESS_LEGACY_CHAPTER_URL_NAME", "books_book")
+
+VIEWCONTENT = "viewcontent.cgi"
+
+# Marks keys shared by more than one target, which can't be resolved
+AMBIGUOUS = object()
+
+ARTICLE = 0
+CHAPTER = 1
+
+
+class LegacyURLIndex:
+    def __init__(self, journal_id=None):
+        """
+        :param journal_id: Only index the articles of the given journal. An
+            index without a journal holds the articles of all the journals
+            and the imported chapters, for requests made outside a journal
+        """
+        self.journal_id = journal_id
+        # (context, bepress_id) -> target and bepress_id -> target
+        self.by_context_id = {}
+        self.by_id = {}
+        # submission path -> target, with and without the context
+        self.by_path = {}
+        # A target is a tuple of (kind, object id, journal id)
+        self.urls = {}
+        self.journals = {}
+        self.watermark = 0
+        self.pending = set()
+        self.refreshed_at = None
+        self.rebuilt_at = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    def resolve(self, path, query=None):
+        """ Resolves a legacy URL into the URL of the imported object
+        :param path: The path of the requested URL
+        :param query: A dict like object with the querystring parameters
+        :return: The URL of the imported object or None
+        """
+        self.maybe_refresh()
+        path = path.strip("/")
+        if path.endswith(VIEWCONTENT):
+            target = self.resolve_viewcontent(query or {})
+        else:
+            target = self.by_path.get(path)
+        if target is None or target is AMBIGUOUS:
+            return None
+        return self.get_url(target)
+
+    def resolve_viewcontent(self, query):
+        bepress_id = query.get("article", "")
+        if not bepress_id.isdigit():
+            return None
+        bepress_id = int(bepress_id)
+        context = query.get("context")
+        if context:
+            target = self.by_context_id.get((context, bepress_id))
+            if target is not None:
+                return target
+        return self.by_id.get(bepress_id)
+
+    def get_url(self, target):
+        if target not in self.urls:
+            kind, object_id, journal_id = target
+            try:
+                if kind == ARTICLE:
+                    path = reverse(
+                        "article_view",
+                        kwargs={"identifier_type": "id", "identifier": object_id},
+                    )
+                    journal = self.journals.get(journal_id)
+                    url = journal.site_url(path) if journal else path
+                else:
+                    url = reverse(CHAPTER_URL_NAME, kwargs={"book_id": object_id})
+            except NoReverseMatch as e:
+                logger.warning("Can't resolve legacy target %s: %s", target, e)
+                url = None
+            self.urls[target] = url
+        return self.urls[target]
+
+    def maybe_refresh(self):
+        now = time.monotonic()
+        if self.rebuilt_at is None:
+            self.rebuild()
+        elif now - self.rebuilt_at > REBUILD_INTERVAL:
+            self.rebuild_in_background()
+        elif now - self.refreshed_at > REFRESH_INTERVAL:
+            self.refresh()
+
+    def rebuild_in_background(self):
+        """ Rebuilds the index in a separate thread, so that requests keep
+        being served from the current index in the meantime
+        """
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        thread = threading.Thread(
+            target=self._background_rebuild,
+            name="legacy-index-%s" % self.journal_id,
+            daemon=True,
+        )
+        thread.start()
+
+    def _background_rebuild(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+    def rebuild(self):
+        """ Builds the index from scratch"""
+        index = LegacyURLIndex(self.journal_id)
+        index._load_articles()
+        if self.journal_id is None:
+            index._load_chapters()
+        with self._lock:
+            self.by_context_id = index.by_context_id
+            self.by_id = index.by_id
+            self.by_path = index.by_path
+            self.journals = index.journals
+            self.urls = {}
+            self.watermark = index.watermark
+            self.pending = index.pending
+            self.rebuilt_at = self.refreshed_at = time.monotonic()
+        logger.info("Built legacy URL index with %d entries", len(self.by_id))
+
+    def refresh(self):
+        """ Adds the articles imported since the last refresh to the index"""
+        if not self._lock.acquire(blocking=False):
+            # Another thread is already refreshing the index
+            return
+        try:
+            self._load_articles()
+            self.refreshed_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def _load_articles(self):
+        pending = self.pending
+        imported = models.ImportedArticle.objects.filter(
+            pk__gt=self.watermark,
+        )
+        if pending:
+            imported = imported | models.ImportedArticle.objects.filter(
+                pk__in=pending,
+            )
+        if self.journal_id is not None:
+            imported = imported.filter(journal_id=self.journal_id)
+        rows = imported.values_list(
+            "pk", "bepress_id", "article_id", "journal_id", "submission_path",
+        )
+        self.pending = set()
+        for pk, bepress_id, article_id, journal_id, path in rows.iterator():
+            self.watermark = max(self.watermark, pk)
+            if article_id is None:
+                # The article is still being imported
+                self.pending.add(pk)
+                continue
+            target = (ARTICLE, article_id, journal_id)
+            self.add(target, bepress_id, path)
+            if journal_id not in self.journals:
+                self.journals[journal_id] = None
+        missing = [
+            journal_id for journal_id, journal in self.journals.items()
+            if journal is None
+        ]
+        if missing:
+            self.journals.update(Journal.objects.in_bulk(missing))
+
+    def _load_chapters(self):
+        if not hasattr(models, "ImportedChapter"):
+            return
+        rows = models.ImportedChapter.objects.filter(
+            book__isnull=False,
+        ).values_list("bepress_id", "book_id")
+        for bepress_id, book_id in rows.iterator():
+            self.add((CHAPTER, book_id, None), bepress_id)
+
+    def add(self, target, bepress_id, path=None):
+        add_unique(self.by_id, bepress_id, target)
+        if path:
+            context, _, relative_path = path.partition("/")
+            add_unique(self.by_context_id, (context, bepress_id), target)
+            add_unique(self.by_path, path, target)
+            if relative_path:
+                add_unique(self.by_path, relative_path, target)
+
+
+def add_unique(index, key, target):
+    """ Adds the target to the index, marking keys with many targets"""
+    existing = index.get(key)
+    if existing is None or existing == target:
+        index[key] = target
+    else:
+        index[key] = AMBIGUOUS
+
+
+class LegacyURLIndexes:
+    """ Holds the LegacyURLIndex of each journal, loaded on first use"""
+
+    def __init__(self):
+        self.indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, journal_id):
+        index = self.indexes.get(journal_id)
+        if index is None:
+            with self._lock:
+                index = self.indexes.setdefault(
+                    journal_id, LegacyURLIndex(journal_id))
+        return index
+
+    def resolve(self, journal, path, query=None):
+        """ Resolves a legacy URL requested from the given journal
+        :param journal: The journal.Journal of the request or None
+        """
+        index = self.get(journal.pk if journal else None)
+        return index.resolve(path, query)
+
+
+legacy_indexes = LegacyURLIndexes()
+
+
+class LegacyRedirectMiddleware:
+    """ Redirects requests for legacy bepress URLs that would otherwise 404
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.status_code == 404:
+            url = legacy_indexes.resolve(
+                getattr(request, "journal", None), request.path, request.GET)
+            if url:
+                return HttpResponsePermanentRedirect(url)
+        return response
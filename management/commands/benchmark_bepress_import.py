@@ -0,0 +1,113 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from journal import models as journal_models
+
+from plugins.bepress import const, etl, utils
+
+ENGINES = ("orm", "etl")
+
+
+class Rollback(Exception):
+    """ Raised to roll back the import of a benchmark run"""
+
+
+class Command(BaseCommand):
+    """Times the ORM and ETL imports of the same bepress export"""
+
+    help = (
+        "Imports a bepress export with the ORM import (with deferred files)"
+        " and with --etl, rolling back each run, and reports the time taken"
+        " by each engine"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('site_code')
+        parser.add_argument(
+            'archive_name',
+            help="The name of the folder or archive in BEPRESS_PATH",
+        )
+        parser.add_argument(
+            '--structure',
+            choices=(
+                const.JOURNAL_STRUCTURE, const.SERIES_STRUCTURE,
+                const.EVENTS_STRUCTURE,
+            ),
+            default=const.JOURNAL_STRUCTURE,
+        )
+        parser.add_argument('--stamped', action="store_true", default=False)
+        parser.add_argument(
+            '--path',
+            help="Only import articles found under the given bepress path",
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int, default=etl.CHUNK_SIZE,
+            help="Number of documents merged at a time by the ETL import",
+        )
+        parser.add_argument(
+            '--runs',
+            type=int, default=1,
+            help="Number of runs of each engine, the fastest is reported",
+        )
+        parser.add_argument(
+            '--engine',
+            choices=ENGINES, action="append",
+            help="Only run the given engine, can be given more than once",
+        )
+
+    def handle(self, *args, **options):
+        if not etl.is_supported():
+            raise CommandError(
+                "The ETL import requires PostgreSQL, there is nothing to"
+                " compare against"
+            )
+        site = journal_models.Journal.objects.get(code=options["site_code"])
+        import_kwargs = dict(
+            folder=options["archive_name"],
+            stamped=options["stamped"],
+            site=site,
+            struct=options["structure"],
+            import_path=options["path"],
+            # Every run imports the whole export from the same state
+            force=True,
+        )
+        engines = options["engine"] or ENGINES
+        timings = {engine: [] for engine in engines}
+        imported = {}
+        # Runs of each engine are interleaved, so that they share the
+        # state of the caches of the database and the filesystem
+        for run in range(options["runs"]):
+            for engine in engines:
+                elapsed, summary = self.run_engine(
+                    engine, import_kwargs, options["chunk_size"])
+                timings[engine].append(elapsed)
+                imported[engine] = summary.imported
+                self.stdout.write("Run %d of %s: %.2fs, %s" % (
+                    run + 1, engine, elapsed, summary))
+        for engine, elapsed in timings.items():
+            self.stdout.write("%s: %.2fs (%.1f documents/s)" % (
+                engine, min(elapsed), imported[engine] / min(elapsed),
+            ))
+
+    def run_engine(self, engine, import_kwargs, chunk_size):
+        """ Imports the export with the given engine and rolls it back
+        :return: A tuple of the seconds taken and the utils.ImportSummary
+        """
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                if engine == "etl":
+                    summary = etl.import_archive_etl(
+                        chunk_size=chunk_size, **import_kwargs)
+                else:
+                    # The ETL import always defers the files
+                    summary = utils.import_archive(
+                        defer_files=True, **import_kwargs)
+                elapsed = time.perf_counter() - start
+                raise Rollback
+        except Rollback:
+            pass
+        return elapsed, summary
@@ -1,24 +1,60 @@
-import csv
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-from plugins.bepress.csv_handler import csv_to_xml
+from plugins.bepress import profiling
+from plugins.bepress.csv_handler import (
+    WORKERS,
+    convert_csv_files,
+    find_csv_files,
+)
 
 
 class Command(BaseCommand):
-    """Converts a Bepress export in CSV format into XML"""
+    """Converts Bepress exports in CSV format into XML"""
 
-    help = "Converts a Bepress export in CSV format into XML"
+    help = "Converts Bepress exports in CSV format into XML"
 
     def add_arguments(self, parser):
-        parser.add_argument('csv_path')
+        parser.add_argument(
+            'csv_paths',
+            nargs="+",
+            help=(
+                "CSV files to convert, directories containing CSV files or"
+                " glob patterns e.g: 'exports/*.csv'"
+            ),
+        )
         parser.add_argument('--dry-run', action="store_true", default=False)
+        parser.add_argument(
+            '--workers',
+            type=int, default=WORKERS,
+            help="Number of processes converting files at the same time",
+        )
+        profiling.add_profiling_arguments(parser)
 
     def handle(self, *args, **options):
-        with open(options["csv_path"], "r", encoding="utf-8-sig") as csv_file:
-            reader = csv.DictReader(csv_file)
-            iterator = csv_to_xml( reader, commit=options["dry_run"])
-            for xml, path in iterator:
+        profiler = profiling.get_profiler_from_options(options)
+        try:
+            csv_paths = find_csv_files(options["csv_paths"])
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        workers = options["workers"]
+        if options["profile"] and workers > 1 and len(csv_paths) > 1:
+            raise CommandError("--profile requires --workers 1")
+
+        def on_file(csv_path, file_summary):
+            for xml, path in file_summary.documents:
                 if path:
                     print("Written XML to %s" % path)
                 else:
                     print("Parsed XML: %s" % xml)
+            if len(csv_paths) > 1:
+                print("Converted %d rows of %s" % (
+                    file_summary.converted, csv_path))
+
+        summary = convert_csv_files(
+            csv_paths,
+            commit=not options["dry_run"],
+            workers=workers,
+            profiler=profiler,
+            on_file=on_file,
+        )
+        self.stdout.write(str(summary))
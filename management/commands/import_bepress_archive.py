@@ -1,13 +1,33 @@
-import csv
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 from journal import models as journal_models
 from press.models import Press
 from submission import models as sub_models
 
-from plugins.bepress import utils
+from plugins.bepress import (
+    etl,
+    leases,
+    memory,
+    models,
+    pipeline,
+    profiling,
+    utils,
+)
+from plugins.bepress.custom_fields import validate_custom_fields
 
 STRUCTURE_CHOICES = {"journal", "series", "events", "books"}
+# Options of the import, none of which apply when registering units of work
+IMPORT_OPTIONS = (
+    "stamped", "default_section", "section_field", "path", "custom_fields",
+    "max_rss", "defer_files", "defer_signals", "pipeline", "parse_workers",
+    "fetch_workers", "etl", "chunk_size", "retry_failed", "force", "worker",
+    "profile", "profile_memory",
+)
+# Options of the other import engines, which workers don't run
+NON_WORKER_OPTIONS = (
+    "max_rss", "path", "retry_failed", "etl", "pipeline", "parse_workers",
+    "fetch_workers", "chunk_size",
+)
 
 
 class Command(BaseCommand):
@@ -49,19 +69,131 @@ class Command(BaseCommand):
             ),
         )
         parser.add_argument('--dry-run', action="store_true", default=False)
+        parser.add_argument(
+            '--max-rss',
+            type=int, default=None, metavar="MB",
+            help=(
+                "Recycle the import worker process once its memory usage"
+                " grows past the given number of megabytes"
+            ),
+        )
+        parser.add_argument(
+            '--defer-files',
+            action="store_true", default=False,
+            help=(
+                "Only import the metadata of the articles and queue their"
+                " files, to be fetched later by ingest_bepress_files"
+            ),
+        )
+        parser.add_argument(
+            '--defer-signals',
+            action="store_true", default=False,
+            help=(
+                "Defer the signals fired when saving articles, issues and"
+                " galleys, and send them once per object after each batch"
+            ),
+        )
+        parser.add_argument(
+            '--pipeline',
+            action="store_true", default=False,
+            help=(
+                "Parse, persist and fetch the files of the articles"
+                " concurrently, in separate stages of a pipeline"
+            ),
+        )
+        parser.add_argument(
+            '--parse-workers',
+            type=int, default=None,
+            help="Number of threads parsing documents with --pipeline",
+        )
+        parser.add_argument(
+            '--fetch-workers',
+            type=int, default=None,
+            help="Number of threads fetching files with --pipeline",
+        )
+        parser.add_argument(
+            '--etl',
+            action="store_true", default=False,
+            help=(
+                "Import the metadata through staging tables and set-based"
+                " merges (PostgreSQL only). Files are queued as with"
+                " --defer-files"
+            ),
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int, default=None,
+            help="Number of documents merged at a time with --etl",
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action="store_true", default=False,
+            help=(
+                "Only import the documents that failed to import in"
+                " previous runs"
+            ),
+        )
+        parser.add_argument(
+            '--force',
+            action="store_true", default=False,
+            help=(
+                "Import the documents whose metadata, files and import"
+                " options are unchanged since they were last imported, from"
+                " this or any other archive"
+            ),
+        )
+        parser.add_argument(
+            '--list-failed',
+            action="store_true", default=False,
+            help="List the documents that failed to import in previous runs",
+        )
+        parser.add_argument(
+            '--register',
+            action="store_true", default=False,
+            help=(
+                "Register the issues of the archive as units of work to be"
+                " imported by one or more --worker processes"
+            ),
+        )
+        parser.add_argument(
+            '--worker',
+            action="store_true", default=False,
+            help=(
+                "Import the units of work registered with --register until"
+                " there are none left. Many workers can run on different"
+                " hosts against the same database"
+            ),
+        )
+        profiling.add_profiling_arguments(parser)
 
     def handle(self, *args, **options):
+        profiler = profiling.get_profiler_from_options(options)
         if options["structure_type"] == "books":
+            if options["defer_files"]:
+                raise CommandError("Books can't be imported with deferred files")
+            if options["register"] or options["worker"]:
+                raise CommandError("Books can't be imported by workers")
+            if options["pipeline"]:
+                raise CommandError("Books can't be imported with --pipeline")
+            if options["etl"]:
+                raise CommandError("Books can't be imported with --etl")
             site = Press.objects.first()
-            utils.import_archive(
-                options["archive_name"], options["stamped"],
-                site, options["structure_type"],
+            import_kwargs = dict(
+                folder=options["archive_name"],
+                stamped=options["stamped"],
+                site=site,
+                struct=options["structure_type"],
                 import_path=options["path"],
+                profiler=profiler,
+                defer_signals=options["defer_signals"],
+                retry_failed=options["retry_failed"],
             )
         else:
-            custom_fields = {}
-            if options.get("custom_fields"):
-                custom_fields = dict(options["custom_fields"])
+            try:
+                custom_fields = validate_custom_fields(
+                    options.get("custom_fields") or [])
+            except ValueError as e:
+                raise CommandError(str(e))
             site = journal_models.Journal.objects.get(code=options["site_code"])
             section = None
             if options.get("default_section"):
@@ -69,9 +201,90 @@ class Command(BaseCommand):
                     id=options["default_section"],
                     journal=site,
                 )
-            utils.import_archive(
-                options["archive_name"], options["stamped"], site,
-                options["structure_type"], section, options["section_field"],
+            import_kwargs = dict(
+                folder=options["archive_name"],
+                stamped=options["stamped"],
+                site=site,
+                struct=options["structure_type"],
+                default_section=section,
+                section_key=options["section_field"],
                 import_path=options["path"],
                 custom_fields=custom_fields,
+                profiler=profiler,
+                defer_files=options["defer_files"],
+                defer_signals=options["defer_signals"],
+                retry_failed=options["retry_failed"],
+                force=options["force"],
+            )
+
+        if options["list_failed"]:
+            failed_imports = models.FailedImport.objects.filter(
+                journal=None if options["structure_type"] == "books" else site,
+                dump_name=options["archive_name"],
+            ).order_by("path")
+            for failed in failed_imports:
+                self.stdout.write("%s [%s] %s: %s" % (
+                    failed.path, failed.stage,
+                    failed.exception, failed.message,
+                ))
+            return
+        elif options["register"]:
+            check_unsupported(options, IMPORT_OPTIONS, "--register")
+            units = leases.register_work_units(site, options["archive_name"])
+            self.stdout.write("Registered %d units of work" % units)
+            return
+        elif options["worker"]:
+            check_unsupported(options, NON_WORKER_OPTIONS, "--worker")
+            summary = leases.run_worker(**import_kwargs)
+        elif options["etl"]:
+            if any(options[option] for option in (
+                "max_rss", "defer_signals", "pipeline", "profile",
+            )):
+                raise CommandError(
+                    "--max-rss, --defer-signals, --pipeline and --profile"
+                    " can't be used with --etl"
+                )
+            for option in ("profiler", "defer_files", "defer_signals"):
+                import_kwargs.pop(option)
+            if options["chunk_size"]:
+                import_kwargs["chunk_size"] = options["chunk_size"]
+            summary = etl.import_archive_etl(**import_kwargs)
+        elif options["pipeline"]:
+            if any(options[option] for option in (
+                "max_rss", "defer_files", "defer_signals", "profile",
+            )):
+                raise CommandError(
+                    "--max-rss, --defer-files, --defer-signals and --profile"
+                    " can't be used with --pipeline"
+                )
+            for option in ("profiler", "defer_files", "defer_signals"):
+                import_kwargs.pop(option)
+            for option in ("parse_workers", "fetch_workers"):
+                if options[option]:
+                    import_kwargs[option] = options[option]
+            summary = pipeline.import_archive_pipelined(**import_kwargs)
+        elif options["max_rss"]:
+            if options["profile"]:
+                # Each worker process would overwrite the profiles of the last
+                raise CommandError("--profile can't be used with --max-rss")
+            summary = memory.run_recycled(
+                utils.import_archive,
+                rss_ceiling=options["max_rss"],
+                **import_kwargs
             )
+        else:
+            summary = utils.import_archive(**import_kwargs)
+        self.stdout.write(str(summary))
+
+
+def check_unsupported(options, names, option):
+    """ Raises a CommandError when any of the given options is set
+    :param names: The names of the options that can't be used
+    :param option: The option they can't be used with, e.g. "--worker"
+    """
+    used = [
+        "--%s" % name.replace("_", "-") for name in names if options.get(name)
+    ]
+    if used:
+        raise CommandError(
+            "%s can't be used with %s" % (", ".join(used), option))
@@ -0,0 +1,115 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from journal import models as journal_models
+from submission import models as sub_models
+
+from plugins.bepress import csv_handler, profiling, utils
+from plugins.bepress.custom_fields import validate_custom_fields
+
+STRUCTURE_CHOICES = {"journal", "series", "events"}
+
+
+class Command(BaseCommand):
+    """Imports Bepress CSV batches into a journal, without converting them"""
+
+    help = (
+        "Imports Bepress exports in CSV format into a journal directly,"
+        " without writing and parsing their XML"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('site_code')
+        parser.add_argument('structure_type',
+            choices=STRUCTURE_CHOICES,
+            help="The Digital Commons structure type used in the exports",
+        )
+        parser.add_argument(
+            'csv_paths',
+            nargs="+",
+            help=(
+                "CSV files to import, directories containing CSV files or"
+                " glob patterns e.g: 'exports/*.csv'"
+            ),
+        )
+        parser.add_argument('--stamped', action="store_true", default=False)
+        parser.add_argument(
+            '--default-section',
+            help="The ID of the section to use when one can't be found",
+        )
+        parser.add_argument(
+            '--section-field',
+            help="Custom field used for denoting the section name",
+        )
+        parser.add_argument(
+            '--custom-fields', '-c',
+            nargs=2, action="append",
+            help=(
+                "A key value pair of fields to map from bepress to Janeway"
+                " e.g: -c location Location -c data_availability "
+                " 'Data availability'"
+            ),
+        )
+        parser.add_argument(
+            '--defer-files',
+            action="store_true", default=False,
+            help=(
+                "Only import the metadata of the articles and queue their"
+                " files, to be fetched later by ingest_bepress_files"
+            ),
+        )
+        parser.add_argument(
+            '--emit-xml',
+            action="store_true", default=False,
+            help=(
+                "Also write the XML of the articles under"
+                " files/plugins/bepress, as convert_bepress_csv does"
+            ),
+        )
+        parser.add_argument(
+            '--force',
+            action="store_true", default=False,
+            help=(
+                "Import the articles whose metadata and import options are"
+                " unchanged since they were last imported"
+            ),
+        )
+        profiling.add_profiling_arguments(parser)
+
+    def handle(self, *args, **options):
+        try:
+            custom_fields = validate_custom_fields(
+                options.get("custom_fields") or [])
+            csv_paths = csv_handler.find_csv_files(options["csv_paths"])
+        except (ValueError, FileNotFoundError) as e:
+            raise CommandError(str(e))
+        site = journal_models.Journal.objects.get(code=options["site_code"])
+        section = None
+        if options.get("default_section"):
+            section = sub_models.Section.objects.get(
+                id=options["default_section"],
+                journal=site,
+            )
+        import_kwargs = dict(
+            stamped=options["stamped"],
+            site=site,
+            struct=options["structure_type"],
+            default_section=section,
+            section_key=options["section_field"],
+            custom_fields=custom_fields,
+            profiler=profiling.get_profiler_from_options(options),
+            defer_files=options["defer_files"],
+            force=options["force"],
+        )
+
+        summary = utils.ImportSummary()
+        for csv_path in csv_paths:
+            with open(csv_path, "r", encoding="utf-8-sig") as csv_file:
+                reader = csv.DictReader(csv_file)
+                file_summary = csv_handler.import_csv(
+                    reader, emit_xml=options["emit_xml"], **import_kwargs)
+            if len(csv_paths) > 1:
+                self.stdout.write("%s:\n%s" % (csv_path, file_summary))
+            summary.merge(file_summary)
+        self.stdout.write(str(summary))
@@ -1,8 +1,8 @@
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from sickle import Sickle
 
-from plugins.bepress.oai import import_from_oai
+from plugins.bepress.oai import RECORD_WORKERS, import_from_oai
 
 
 class Command(BaseCommand):
@@ -19,16 +19,49 @@ class Command(BaseCommand):
         )
         parser.add_argument(
             '--identifier', '-i',
+            action="append", dest="identifiers", default=[],
+            help=(
+                "URI identifier for retrieving a single document from the"
+                " OAI. Can be given many times"
+            ),
+        )
+        parser.add_argument(
+            '--identifiers-file',
             default=None,
-            help="URI identifier for retrieving a single document from the OAI",
+            help=(
+                "A file listing the URI identifiers of the documents to"
+                " retrieve from the OAI, one per line"
+            ),
+        )
+        parser.add_argument(
+            '--workers',
+            type=int, default=RECORD_WORKERS,
+            help="Number of documents retrieved by identifier at the same time",
         )
 
     def handle(self, *args, **options):
+        identifiers = list(options["identifiers"])
+        if options["identifiers_file"]:
+            try:
+                with open(options["identifiers_file"]) as identifiers_file:
+                    identifiers.extend(
+                        line.strip() for line in identifiers_file
+                        if line.strip()
+                    )
+            except OSError as e:
+                raise CommandError(str(e))
+        if identifiers and options.get("set"):
+            raise CommandError("--set can't be used with identifiers")
         client = Sickle(options["oai-url"])
-        import_from_oai(client, set_=options.get("set"))
+        summary = import_from_oai(
+            client,
+            set_=options.get("set"),
+            identifiers=identifiers,
+            workers=options["workers"],
+        )
+        print(summary)
         print("Done.")
         print(
             "You can now import the loaded archives with "
             "python src/manage.py import_bepress_archive.py"
         )
-
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from journal import models as journal_models
+
+from plugins.bepress import ingest
+
+
+class Command(BaseCommand):
+    """Fetches the files queued by an import with deferred files"""
+
+    help = (
+        "Fetches and attaches the galleys and supplementary files queued by"
+        " import_bepress_archive --defer-files"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--journal',
+            help="Only ingest the files of the journal with the given code",
+        )
+        parser.add_argument(
+            '--workers',
+            type=int, default=ingest.FILE_WORKERS,
+            help="Number of files fetched concurrently",
+        )
+        parser.add_argument(
+            '--claim-size',
+            type=int, default=ingest.CLAIM_SIZE,
+            help="Number of files claimed from the queue at a time",
+        )
+
+    def handle(self, *args, **options):
+        journal = None
+        if options["journal"]:
+            journal = journal_models.Journal.objects.get(
+                code=options["journal"])
+        summary = ingest.ingest_files(
+            journal=journal,
+            workers=options["workers"],
+            claim_size=options["claim_size"],
+        )
+        self.stdout.write(str(summary))
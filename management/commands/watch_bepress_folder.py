@@ -0,0 +1,101 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from journal import models as journal_models
+from submission import models as sub_models
+
+from plugins.bepress import watch
+from plugins.bepress.custom_fields import validate_custom_fields
+
+STRUCTURE_CHOICES = {"journal", "series", "events"}
+
+
+class Command(BaseCommand):
+    """Imports the documents written under BEPRESS_PATH as they change"""
+
+    help = (
+        "Watches files/plugins/bepress and imports new or changed documents"
+        " into a journal shortly after they are written"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('site_code')
+        parser.add_argument('structure_type',
+            choices=STRUCTURE_CHOICES,
+            help="The Digital Commons structure type used in the archives",
+        )
+        parser.add_argument('--stamped', action="store_true", default=False)
+        parser.add_argument(
+            '--default-section',
+            help="The ID of the section to use when one can't be found",
+        )
+        parser.add_argument(
+            '--section-field',
+            help="Custom field used for denoting the section name",
+        )
+        parser.add_argument(
+            '--custom-fields', '-c',
+            nargs=2, action="append",
+            help=(
+                "A key value pair of fields to map from bepress to Janeway"
+                " e.g: -c location Location -c data_availability "
+                " 'Data availability'"
+            ),
+        )
+        parser.add_argument(
+            '--defer-files',
+            action="store_true", default=False,
+            help=(
+                "Only import the metadata of the articles and queue their"
+                " files, to be fetched later by ingest_bepress_files"
+            ),
+        )
+        parser.add_argument(
+            '--debounce',
+            type=float, default=watch.DEBOUNCE,
+            help="Seconds without writes after which a document is imported",
+        )
+        parser.add_argument(
+            '--polling',
+            action="store_true", default=False,
+            help="Poll the folder for changes instead of using inotify",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            custom_fields = validate_custom_fields(
+                options.get("custom_fields") or [])
+        except ValueError as e:
+            raise CommandError(str(e))
+        site = journal_models.Journal.objects.get(code=options["site_code"])
+        section = None
+        if options.get("default_section"):
+            section = sub_models.Section.objects.get(
+                id=options["default_section"],
+                journal=site,
+            )
+        import_kwargs = dict(
+            stamped=options["stamped"],
+            site=site,
+            struct=options["structure_type"],
+            default_section=section,
+            section_key=options["section_field"],
+            custom_fields=custom_fields,
+            defer_files=options["defer_files"],
+            # Only documents that were written to are imported, and their
+            # files may have changed even if their metadata didn't
+            force=True,
+        )
+
+        def on_import(folder, summary):
+            self.stdout.write("%s:\n%s" % (folder, summary))
+
+        watcher = watch.FolderWatcher(
+            import_kwargs,
+            debounce=options["debounce"],
+            polling=options["polling"],
+            on_import=on_import,
+        )
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped watching")
@@ -0,0 +1,166 @@
+"""
+Memory bookkeeping for long running imports
+
+Imports of large archives can run for days. The MemoryMonitor records the
+peak RSS for every N articles so it can be reported in the import summary,
+and tells the import loop when the process has grown past a configurable
+ceiling. When that happens, run_recycled hands the rest of the import over
+to a fresh worker process, which is the only reliable way of returning
+memory fragmented by the parsers back to the OS.
+"""
+import multiprocessing
+import os
+import resource
+import sys
+
+from django.db import connections
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError):
+    PAGE_SIZE = 4096
+
+MB = 1024 * 1024
+# Seconds between checks that a worker process is still alive while waiting
+# for its summary
+RESULT_POLL_INTERVAL = 5
+
+
+class WorkerExited(Exception):
+    """ Raised when a worker process exits without reporting its summary
+    e.g. when it is killed by the OOM killer
+    """
+
+
+def current_rss():
+    """ Returns the resident set size of the current process in bytes"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        # Not available outside Linux, fall back to the peak RSS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class MemoryMonitor:
+    def __init__(self, report_every=100, rss_ceiling=None):
+        """
+        :param report_every: Number of articles covered by each peak report
+        :param rss_ceiling: RSS in MB past which the worker is recycled
+        """
+        self.report_every = report_every
+        self.rss_ceiling = rss_ceiling * MB if rss_ceiling else None
+        self.count = 0
+        self.rss = 0
+        self.window_peak = 0
+        self.reports = []
+
+    def record(self):
+        """ Records the memory usage after an article has been imported"""
+        self.rss = current_rss()
+        self.count += 1
+        self.window_peak = max(self.window_peak, self.rss)
+        if self.count % self.report_every == 0:
+            self._report()
+        return self.rss
+
+    def over_ceiling(self):
+        return bool(self.rss_ceiling) and self.rss > self.rss_ceiling
+
+    def finish(self):
+        if self.window_peak:
+            self._report()
+        return self.reports
+
+    def _report(self):
+        logger.info(
+            "Peak RSS after %d articles: %.1f MB",
+            self.count, self.window_peak / MB,
+        )
+        self.reports.append((self.count, self.window_peak))
+        self.window_peak = 0
+
+
+def run_recycled(func, **kwargs):
+    """ Runs an import in worker processes recycled on hitting the ceiling
+    :param func: A callable returning an ImportSummary, which is called with
+        the given kwargs plus `resume_from`, the metadata root at which the
+        previous worker stopped.
+    :return: The merged ImportSummary of all the workers
+    :raises WorkerExited: If a worker dies without reporting its summary
+    """
+    context = multiprocessing.get_context("fork")
+    summary = None
+    resume_from = None
+    while True:
+        # Children must not share the parent's database connections
+        connections.close_all()
+        results, sender = context.Pipe(duplex=False)
+        worker = context.Process(
+            target=_run_worker,
+            args=(sender, func, kwargs, resume_from),
+        )
+        worker.start()
+        # Only the worker writes to the pipe, so that its exit closes it
+        sender.close()
+        try:
+            worker_summary = wait_for_result(
+                worker, results, RESULT_POLL_INTERVAL)
+        finally:
+            results.close()
+            worker.join()
+        if isinstance(worker_summary, BaseException):
+            raise worker_summary
+        if summary is None:
+            summary = worker_summary
+        else:
+            summary.merge(worker_summary)
+        resume_from = worker_summary.resume_from
+        if not resume_from:
+            return summary
+        logger.info(
+            "Worker %s reached the RSS ceiling, resuming from %s",
+            worker.pid, resume_from,
+        )
+
+
+def wait_for_result(worker, results, poll_interval=RESULT_POLL_INTERVAL):
+    """ Waits for a worker process to send its result
+    :param worker: A started multiprocessing.Process
+    :param results: The receiving end of the pipe the worker sends its
+        result through
+    :param poll_interval: Seconds between checks that the worker is alive
+    :return: The object sent by the worker
+    :raises WorkerExited: If the worker exits without sending a result
+    """
+    while not results.poll(poll_interval):
+        if not worker.is_alive() and not results.poll():
+            break
+    else:
+        try:
+            return results.recv()
+        except EOFError:
+            # The worker exited and its end of the pipe was closed
+            pass
+    worker.join()
+    raise WorkerExited(
+        "Worker %s exited with code %s without reporting a summary" % (
+            worker.pid, worker.exitcode,
+        )
+    )
+
+
+def _run_worker(results, func, kwargs, resume_from):
+    try:
+        results.send(func(resume_from=resume_from, **kwargs))
+    except Exception as e:
+        logger.exception(e)
+        results.send(e)
+    finally:
+        connections.close_all()
+        results.close()
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.20 on 2026-10-19 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bepress', '0005_auto_20220725_1725'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importedarticle',
+            name='submission_path',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
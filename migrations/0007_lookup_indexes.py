@@ -0,0 +1,22 @@
+# Generated by Django 3.2.20 on 2026-10-19 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bepress', '0006_importedarticle_submission_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='importedarticle',
+            index=models.Index(fields=['journal', 'dump_name', 'bepress_id'], name='bepress_importedarticle_dump'),
+        ),
+        migrations.AlterField(
+            model_name='importedchapter',
+            name='bepress_id',
+            field=models.PositiveIntegerField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.20 on 2026-10-19 12:40
+
+import hashlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def index_existing_notes(apps, schema_editor):
+    """ Indexes the notes of the articles imported before this migration"""
+    Article = apps.get_model("submission", "Article")
+    ImportedArticle = apps.get_model("bepress", "ImportedArticle")
+    ImportedNote = apps.get_model("bepress", "ImportedNote")
+    Note = apps.get_model("submission", "Note")
+    PublisherNote = apps.get_model("submission", "PublisherNote")
+
+    article_ids = ImportedArticle.objects.filter(
+        article__isnull=False,
+    ).values("article_id")
+    imported_notes = [
+        ImportedNote(digest=digest(text), note_id=pk, article_id=article_id)
+        for pk, article_id, text in Note.objects.filter(
+            article_id__in=article_ids,
+        ).values_list("pk", "article_id", "text").iterator()
+    ]
+    publisher_note_ids = Article.publisher_notes.through.objects.filter(
+        article_id__in=article_ids,
+    ).values("publishernote_id")
+    imported_notes.extend(
+        ImportedNote(digest=digest(text), publisher_note_id=pk)
+        for pk, text in PublisherNote.objects.filter(
+            pk__in=publisher_note_ids,
+        ).values_list("pk", "text").iterator()
+    )
+    ImportedNote.objects.bulk_create(imported_notes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submission', '0032_auto_20190304_0916'),
+        ('bepress', '0007_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedNote',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(db_index=True, max_length=64)),
+                ('article', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='submission.article')),
+                ('note', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='submission.note')),
+                ('publisher_note', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='submission.publishernote')),
+            ],
+        ),
+        migrations.RunPython(
+            index_existing_notes,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.20 on 2026-10-19 14:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submission', '0032_auto_20190304_0916'),
+        ('bepress', '0008_importednote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('pdf', 'PDF galley'), ('supp', 'Supplementary file'), ('relation', 'HTML galley from relation field'), ('image', 'Image galley from native URL')], max_length=16)),
+                ('url', models.TextField(blank=True)),
+                ('path', models.TextField(blank=True)),
+                ('mime_type', models.CharField(blank=True, max_length=255)),
+                ('label', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('claimed', 'Claimed'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='submission.article')),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.20 on 2026-10-19 15:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0001_initial'),
+        ('bepress', '0009_pendingfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkUnit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dump_name', models.CharField(max_length=255)),
+                ('path', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('leased', 'Leased'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16)),
+                ('owner', models.CharField(blank=True, max_length=255)),
+                ('lease_expires', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('imported', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('journal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='journal.journal')),
+            ],
+            options={
+                'unique_together': {('journal', 'dump_name', 'path')},
+            },
+        ),
+    ]
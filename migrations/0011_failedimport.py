@@ -0,0 +1,34 @@
+# Generated by Django 3.2.20 on 2026-10-19 16:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0001_initial'),
+        ('bepress', '0010_workunit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FailedImport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dump_name', models.CharField(max_length=255)),
+                ('path', models.CharField(max_length=255)),
+                ('stage', models.CharField(blank=True, max_length=64)),
+                ('exception', models.CharField(max_length=255)),
+                ('message', models.TextField(blank=True)),
+                ('traceback', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=1)),
+                ('last_failed', models.DateTimeField(default=django.utils.timezone.now)),
+                ('journal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='journal.journal')),
+            ],
+            options={
+                'unique_together': {('journal', 'dump_name', 'path')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.20 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bepress', '0011_failedimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importedarticle',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='importedarticle',
+            index=models.Index(fields=['journal', 'bepress_id'], name='bepress_importedarticle_id'),
+        ),
+        migrations.AddIndex(
+            model_name='importedarticle',
+            index=models.Index(fields=['journal', 'submission_path'], name='bepress_importedarticle_path'),
+        ),
+    ]
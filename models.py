@@ -18,11 +18,28 @@ class ImportedArticle(models.Model):
         on_delete=models.CASCADE,
     )
     started = models.DateTimeField(default=timezone.now)
+    submission_path = models.CharField(max_length=255, blank=True, null=True)
+    # SHA-256 of the metadata.xml last imported (See identity.IdentityIndex)
+    content_hash = models.CharField(max_length=64, blank=True, default="")
 
     class Meta:
         unique_together = (
                 ("article", "bepress_id", "dump_name"),
         )
+        indexes = [
+            models.Index(
+                fields=["journal", "dump_name", "bepress_id"],
+                name="bepress_importedarticle_dump",
+            ),
+            models.Index(
+                fields=["journal", "bepress_id"],
+                name="bepress_importedarticle_id",
+            ),
+            models.Index(
+                fields=["journal", "submission_path"],
+                name="bepress_importedarticle_path",
+            ),
+        ]
 
 
 class ImportedArticleAuthor(models.Model):
@@ -39,6 +56,127 @@ class ImportedArticleAuthor(models.Model):
         unique_together = (("article", "author"),)
 
 
+class ImportedNote(models.Model):
+    """ SHA-256 digest of the text of a note created by an import
+    Allows deduplicating notes without matching on their full text
+    """
+    digest = models.CharField(max_length=64, db_index=True)
+    article = models.ForeignKey(
+        "submission.Article", blank=True, null=True,
+        on_delete=models.CASCADE,
+    )
+    note = models.ForeignKey(
+        "submission.Note", blank=True, null=True,
+        on_delete=models.CASCADE,
+    )
+    publisher_note = models.ForeignKey(
+        "submission.PublisherNote", blank=True, null=True,
+        on_delete=models.CASCADE,
+    )
+
+
+class PendingFile(models.Model):
+    """ A file of an imported article waiting to be fetched and attached
+    Queued when importing with deferred files (See ingest.py)
+    """
+    PDF_GALLEY = "pdf"
+    SUPP_FILE = "supp"
+    RELATION_GALLEY = "relation"
+    IMAGE_GALLEY = "image"
+    KINDS = (
+        (PDF_GALLEY, "PDF galley"),
+        (SUPP_FILE, "Supplementary file"),
+        (RELATION_GALLEY, "HTML galley from relation field"),
+        (IMAGE_GALLEY, "Image galley from native URL"),
+    )
+    PENDING = "pending"
+    CLAIMED = "claimed"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, "Pending"),
+        (CLAIMED, "Claimed"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    article = models.ForeignKey(
+        "submission.Article",
+        on_delete=models.CASCADE,
+    )
+    kind = models.CharField(max_length=16, choices=KINDS)
+    url = models.TextField(blank=True)
+    path = models.TextField(blank=True)
+    mime_type = models.CharField(max_length=255, blank=True)
+    label = models.CharField(max_length=255, blank=True)
+    status = models.CharField(
+        max_length=16, choices=STATUSES, default=PENDING, db_index=True,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    created = models.DateTimeField(default=timezone.now)
+
+
+class WorkUnit(models.Model):
+    """ A directory of a bepress export, imported by one of many workers
+    Workers lease the units and keep renewing their lease while importing
+    them, so that the units of a worker that died can be reclaimed.
+    (See leases.py)
+    """
+    PENDING = "pending"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, "Pending"),
+        (LEASED, "Leased"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    journal = models.ForeignKey(
+        'journal.Journal',
+        on_delete=models.CASCADE,
+    )
+    dump_name = models.CharField(max_length=255)
+    path = models.CharField(max_length=255, blank=True)
+    status = models.CharField(
+        max_length=16, choices=STATUSES, default=PENDING, db_index=True,
+    )
+    owner = models.CharField(max_length=255, blank=True)
+    lease_expires = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = (("journal", "dump_name", "path"),)
+
+
+class FailedImport(models.Model):
+    """ A document of a bepress export that failed to import
+    Documents are removed from this table once they are imported, so that
+    an import can be retried only for the documents that failed.
+    """
+    journal = models.ForeignKey(
+        'journal.Journal', blank=True, null=True,
+        on_delete=models.CASCADE,
+    )
+    dump_name = models.CharField(max_length=255)
+    path = models.CharField(max_length=255)
+    stage = models.CharField(max_length=64, blank=True)
+    exception = models.CharField(max_length=255)
+    message = models.TextField(blank=True)
+    traceback = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=1)
+    last_failed = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = (("journal", "dump_name", "path"),)
+
+
 if books:
     class ImportedChapter(models.Model):
         book = models.ForeignKey(
@@ -51,7 +189,7 @@ if books:
             null=True, blank=True,
             on_delete=models.SET_NULL,
         )
-        bepress_id = models.PositiveIntegerField()
+        bepress_id = models.PositiveIntegerField(db_index=True)
 
         class Meta:
             unique_together = ("book", "chapter", "bepress_id")
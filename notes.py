@@ -0,0 +1,125 @@
+"""
+Deduplication of the notes created by bepress imports
+
+Notes and publisher notes (comments, errata...) used to be deduplicated by
+matching on their full text, which is an unindexed sequential scan. The
+NoteRegistry keeps the SHA-256 digest of the text of every note created by
+an import (See models.ImportedNote). The notes queued for a batch are
+deduplicated in memory, checked against the digests already imported for
+the articles of the batch with a single indexed query, and created in bulk.
+"""
+import hashlib
+
+from core.models import Account
+from submission import models as submission_models
+from utils.logger import get_logger
+
+from plugins.bepress import batch
+from plugins.bepress import models
+
+logger = get_logger(__name__)
+
+
+def note_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_note_creator():
+    return Account.objects.filter(is_superuser=True).first()
+
+
+class NoteRegistry:
+    def __init__(self):
+        self.creator = get_note_creator()
+        # digest -> PublisherNote id, of the publisher notes seen so far
+        self.publisher_notes = {}
+        # (digest, article id) of the notes queued since the last flush
+        self.notes = set()
+        self.new_publisher_notes = {}
+        self.new_notes = []
+        self.publisher_note_links = []
+
+    def add_note(self, article, text):
+        """ Queues a private editorial note for the article"""
+        key = (note_digest(text), article.pk)
+        if key in self.notes:
+            return
+        self.notes.add(key)
+        self.new_notes.append((key[0], submission_models.Note(
+            creator=self.creator,
+            article=article,
+            text=text,
+        )))
+
+    def add_publisher_note(self, article, text):
+        """ Queues a publisher note to be linked to the article"""
+        digest = note_digest(text)
+        if (
+            digest not in self.publisher_notes
+            and digest not in self.new_publisher_notes
+        ):
+            self.new_publisher_notes[digest] = submission_models.PublisherNote(
+                text=text,
+                creator=self.creator,
+            )
+        self.publisher_note_links.append((digest, article.pk))
+
+    def flush(self):
+        self._flush_publisher_notes()
+        self._flush_notes()
+
+    def _flush_publisher_notes(self):
+        imported_notes = models.ImportedNote.objects.filter(
+            digest__in=list(self.new_publisher_notes),
+            publisher_note__isnull=False,
+        ).values_list("digest", "publisher_note_id")
+        for digest, publisher_note_id in imported_notes:
+            self.publisher_notes[digest] = publisher_note_id
+            self.new_publisher_notes.pop(digest, None)
+
+        new_notes = batch.bulk_create(
+            submission_models.PublisherNote,
+            list(self.new_publisher_notes.values()),
+        )
+        models.ImportedNote.objects.bulk_create([
+            models.ImportedNote(digest=digest, publisher_note=note)
+            for digest, note in zip(self.new_publisher_notes, new_notes)
+        ])
+        for digest, note in zip(self.new_publisher_notes, new_notes):
+            self.publisher_notes[digest] = note.pk
+        self.new_publisher_notes = {}
+
+        through = submission_models.Article.publisher_notes.through
+        through.objects.bulk_create(
+            [
+                through(
+                    article_id=article_id,
+                    publishernote_id=self.publisher_notes[digest],
+                )
+                for digest, article_id in self.publisher_note_links
+            ],
+            ignore_conflicts=True,
+        )
+        self.publisher_note_links = []
+
+    def _flush_notes(self):
+        existing = set(models.ImportedNote.objects.filter(
+            article_id__in={article_id for _, article_id in self.notes},
+            note__isnull=False,
+        ).values_list("digest", "article_id"))
+        new_notes = [
+            (digest, note) for digest, note in self.new_notes
+            if (digest, note.article_id) not in existing
+        ]
+        created = batch.bulk_create(
+            submission_models.Note,
+            [note for _, note in new_notes],
+        )
+        models.ImportedNote.objects.bulk_create([
+            models.ImportedNote(
+                digest=digest, note=note, article_id=note.article_id,
+            )
+            for (digest, _), note in zip(new_notes, created)
+        ])
+        self.new_notes = []
+        self.notes = set()
@@ -1,12 +1,15 @@
 """
 A module for retrieving Bepress XML documents by traversing an OAI feed
 """
+from concurrent.futures import ThreadPoolExecutor
 from lxml import etree as et
 import pathlib
 
+from django.conf import settings
 from django.template.loader import render_to_string
 from utils.logger import get_logger
 
+from plugins.bepress import http_client
 from plugins.bepress.plugin_settings import BEPRESS_PATH
 
 logger = get_logger(__name__)
@@ -14,40 +17,196 @@ logger = get_logger(__name__)
 
 # An undocumented prefix that fromats the XML records in bepress custom format
 METADATA_PREFIX = "document-export"
+OAI_NAMESPACE = "http://www.openarchives.org/OAI/2.0/"
+OAI = "{%s}" % OAI_NAMESPACE
+# Number of GetRecord requests made at the same time when fetching records
+# by identifier. The requests are further throttled per host by http_client
+RECORD_WORKERS = getattr(settings, "BEPRESS_OAI_RECORD_WORKERS", 8)
 
 
-def import_from_oai(client, set_=None, identifier=None):
+class OAIError(Exception):
+    """ An error reported by the OAI-PMH endpoint (e.g. idDoesNotExist)"""
+
+
+class OAISummary:
+    """ Counters of the records fetched from an OAI feed"""
+
+    def __init__(self):
+        self.written = 0
+        # (identifier, error) of the records that couldn't be written
+        self.failed = []
+
+    def __str__(self):
+        lines = [
+            "Written: %d" % self.written,
+            "Failed: %d" % len(self.failed),
+        ]
+        for identifier, error in self.failed:
+            lines.append("  %s: %s" % (identifier, error))
+        return "\n".join(lines)
+
+
+def import_from_oai(
+    client, set_=None, identifiers=None, workers=RECORD_WORKERS,
+):
     """ Imports bepress metadata from a given OAI client
     Metadata is written as XML to the location defined in settings as
     BEPRESS_PATH
     :param client: an instance of sicle.app.Sickle
+    :param set_: Only harvest the records of the given set
+    :param identifiers: Only fetch the records of the given OAI identifiers,
+        with concurrent GetRecord requests (See fetch_records)
+    :param workers: Number of GetRecord requests made at the same time
+    :return: An OAISummary
+    """
+    if identifiers:
+        return fetch_records(client.endpoint, identifiers, workers)
+
+    summary = OAISummary()
+    for identifier, documents in list_records(client.endpoint, set_):
+        logger.info("Processing %s", identifier)
+        if documents is None:
+            # Deleted records have no metadata
+            continue
+        try:
+            if write_metadata(documents):
+                summary.written += 1
+            else:
+                summary.failed.append((identifier, "No document found"))
+        except Exception as e:
+            logger.error("Unable to write record %s: %s", identifier, e)
+            summary.failed.append((identifier, str(e)))
+    return summary
+
+
+def list_records(endpoint, set_=None):
+    """ Harvests the records of an OAI-PMH endpoint, page by page
+    Each ListRecords response is parsed incrementally as it is downloaded
+    and each record is freed once processed, so that memory stays flat
+    regardless of the size of the pages served by the endpoint.
+    :param endpoint: The URL of the OAI-PMH endpoint
+    :param set_: Only harvest the records of the given set
+    :return: A generator of tuples of the OAI identifier of each record and
+        its <documents> element, or None for records without one. The
+        element is cleared once the next record is requested.
+    """
+    params = {"verb": "ListRecords", "metadataPrefix": METADATA_PREFIX}
+    if set_:
+        params["set"] = set_
+    while params:
+        response = http_client.get(endpoint, params=params, stream=True)
+        try:
+            response.raise_for_status()
+            # Let urllib3 decompress gzipped responses
+            response.raw.decode_content = True
+            token = yield from iter_page(response.raw)
+        finally:
+            response.close()
+        params = None
+        if token:
+            logger.info("Resuming the harvest from token %s", token)
+            params = {"verb": "ListRecords", "resumptionToken": token}
+
+
+def iter_page(source):
+    """ Parses a ListRecords response incrementally
+    :param source: A file-like object reading the response
+    :return: A generator of tuples of the identifier and <documents> element
+        of each record (See list_records), which returns the resumption
+        token of the next page, if any
+    :raises OAIError: When the endpoint replies with an OAI-PMH error
+    """
+    token = None
+    events = et.iterparse(
+        source,
+        events=("end",),
+        tag=(OAI + "record", OAI + "resumptionToken", OAI + "error"),
+    )
+    for _, element in events:
+        if element.tag == OAI + "record":
+            identifier = element.findtext(
+                "%sheader/%sidentifier" % (OAI, OAI))
+            yield identifier, next(element.iter("documents"), None)
+            release_element(element)
+        elif element.tag == OAI + "resumptionToken":
+            token = (element.text or "").strip() or None
+        elif element.get("code") == "noRecordsMatch":
+            logger.info("No records to harvest")
+        else:
+            raise OAIError("%s: %s" % (element.get("code"), element.text))
+    return token
+
+
+def release_element(element):
+    """ Frees an element built by iterparse, along with its preceding
+    siblings, which lxml would otherwise keep in the tree
+    """
+    element.clear(keep_tail=True)
+    parent = element.getparent()
+    while element.getprevious() is not None:
+        del parent[0]
+
+
+def fetch_records(endpoint, identifiers, workers=RECORD_WORKERS):
+    """ Fetches and writes the records of the given identifiers
+    The records are requested concurrently over the pooled http_client
+    session, which backs off if the endpoint starts throttling.
+    :param endpoint: The URL of the OAI-PMH endpoint
+    :param identifiers: An iterable of OAI identifiers
+        e.g: oai:digitalcommons.example.edu:journal-1001
+    :param workers: Number of requests made at the same time
+    :return: An OAISummary
+    """
+    summary = OAISummary()
+    identifiers = list(dict.fromkeys(identifiers))
+
+    def fetch(identifier):
+        try:
+            tree = get_record(endpoint, identifier)
+            return identifier, write_metadata(tree), None
+        except Exception as e:
+            logger.error("Unable to fetch record %s: %s", identifier, e)
+            return identifier, None, e
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for identifier, file_path, error in executor.map(fetch, identifiers):
+            if file_path:
+                summary.written += 1
+            elif error is not None:
+                summary.failed.append((identifier, str(error)))
+            else:
+                summary.failed.append((identifier, "No document found"))
+    return summary
+
+
+def get_record(endpoint, identifier):
+    """ Requests a single record from an OAI-PMH endpoint
+    :param endpoint: The URL of the OAI-PMH endpoint
+    :param identifier: The OAI identifier of the record
+    :return: The root element of the parsed GetRecord response
+    :raises OAIError: When the endpoint replies with an OAI-PMH error
+    """
+    response = http_client.get(endpoint, params={
+        "verb": "GetRecord",
+        "metadataPrefix": METADATA_PREFIX,
+        "identifier": identifier,
+    })
+    response.raise_for_status()
+    tree = et.fromstring(response.content)
+    error = tree.find("{%s}error" % OAI_NAMESPACE)
+    if error is not None:
+        raise OAIError("%s: %s" % (error.get("code"), error.text))
+    return tree
+
+
+def write_metadata(tree):
+    """ Writes the bepress document found in an OAI response or record
+    :param tree: A <documents> lxml element, or an element containing one
+    :return: The path of the metadata.xml written or None
     """
-    if identifier:
-        record = client.ListRecords(
-            metadataPrefix=METADATA_PREFIX,
-            identifier="identifier",
-        )
-        generate_metadata_from_oai_record(record.raw)
-    else:
-        list_records_kwargs = {}
-        if set_:
-            list_records_kwargs["set"] = set_
-
-        record_iterator = client.ListRecords(
-            metadataPrefix=METADATA_PREFIX,
-            **list_records_kwargs,
-        )
-        for record in record_iterator:
-            logger.info("Processing %s", record.header)
-            generate_metadata_from_oai_record(record.raw)
-
-
-def generate_metadata_from_oai_record(record):
-    tree = et.fromstring(record)
-    documents = tree.xpath("//documents")
-    if documents:
-        document = documents[0]
-        path = document.xpath("//submission-path/text()")
+    document = next(tree.iter("documents"), None)
+    if document is not None:
+        path = document.xpath(".//submission-path/text()")
         if path:
             parsed = et.tostring(document, encoding="unicode", pretty_print=True)
             xml = render_xml(parsed)
@@ -56,8 +215,10 @@ def generate_metadata_from_oai_record(record):
             file_path.parent.mkdir(parents=True, exist_ok=True)
             with open(str(file_path), "w") as xml_file:
                 xml_file.write(xml)
+            return file_path
         else:
             logger.warning("No submission-path found")
+    return None
 
 
 def render_xml(parsed):
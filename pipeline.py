@@ -0,0 +1,395 @@
+"""
+Import of a bepress export as a pipeline of concurrent stages
+
+The import is split in stages connected by bounded queues:
+
+    discover -> parse -> persist -> fetch -> attach
+
+Each stage runs in its own threads, so that parsing the XML, writing to the
+database and downloading files overlap, and the throughput of the import is
+set by its slowest stage rather than by the sum of all of them. When a stage
+falls behind, the queue feeding it fills up and blocks the stages upstream.
+
+Persisting and attaching are database writes that rely on the import batch,
+so they run in a single thread each. A document is only cleared from the
+failure log, and its article stamped with its digest, once its batch was
+flushed and all of its files were attached (See DocumentTracker).
+"""
+from collections import defaultdict
+import os
+import queue
+import threading
+import time
+
+from django import db
+from django.conf import settings
+
+from utils.logger import get_logger
+
+from plugins.bepress import (
+    failures, identity, ingest, issues, profiling, records, utils,
+)
+from plugins.bepress.batch import ImportBatch
+from plugins.bepress.custom_fields import CustomFieldMapping
+from plugins.bepress.keywords import KeywordRegistry
+from plugins.bepress.notes import NoteRegistry
+from plugins.bepress.plugin_settings import BEPRESS_PATH
+
+logger = get_logger(__name__)
+
+# Number of items each queue holds before blocking the stage feeding it
+QUEUE_SIZE = getattr(settings, "BEPRESS_PIPELINE_QUEUE_SIZE", 50)
+# Number of threads parsing metadata.xml documents
+PARSE_WORKERS = getattr(settings, "BEPRESS_PIPELINE_PARSE_WORKERS", 2)
+# Number of threads downloading files
+FETCH_WORKERS = getattr(settings, "BEPRESS_PIPELINE_FETCH_WORKERS", 8)
+
+# Sent down a queue once all the items of the stage feeding it were sent
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, name, func, workers=1, on_done=None):
+        """
+        :param name: The name of the stage, for reporting
+        :param func: A callable taking an item and a function through which
+            it sends items to the next stage
+        :param workers: The number of threads running the stage
+        :param on_done: An optional callable run once all the items were
+            processed, taking the same function to send items downstream
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.on_done = on_done
+        self.input = None
+        self.next = None
+        self.items = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.running = workers
+        self.lock = threading.Lock()
+
+    def emit(self, item):
+        if self.next is not None:
+            self.next.input.put(item)
+
+    def work(self):
+        try:
+            while True:
+                item = self.input.get()
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                try:
+                    self.func(item, self.emit)
+                except Exception as e:
+                    logger.error("Stage %s failed: %s", self.name, e)
+                    logger.exception(e)
+                    with self.lock:
+                        self.failed += 1
+                finally:
+                    with self.lock:
+                        self.items += 1
+                        self.busy += time.perf_counter() - start
+        finally:
+            with self.lock:
+                self.running -= 1
+                last = self.running == 0
+            if last:
+                self.finish()
+            # Connections are per thread
+            db.connections.close_all()
+
+    def finish(self):
+        try:
+            if self.on_done:
+                self.on_done(self.emit)
+        finally:
+            if self.next is not None:
+                for _ in range(self.next.workers):
+                    self.next.input.put(_DONE)
+
+    def report(self):
+        return (self.name, self.workers, self.items, self.failed, self.busy)
+
+
+class Pipeline:
+    def __init__(self, stages, queue_size=QUEUE_SIZE):
+        """
+        :param stages: The list of Stage to run, in order
+        :param queue_size: The number of items each queue holds at most
+        """
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:] + [None]):
+            stage.input = queue.Queue(maxsize=queue_size)
+            stage.next = next_stage
+
+    def run(self, items):
+        """ Feeds the given items to the first stage and waits for all the
+        stages to complete
+        """
+        threads = [
+            threading.Thread(
+                target=stage.work,
+                name="%s-%d" % (stage.name, i),
+                daemon=True,
+            )
+            for stage in self.stages
+            for i in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        first = self.stages[0]
+        try:
+            for item in items:
+                first.input.put(item)
+        finally:
+            for _ in range(first.workers):
+                first.input.put(_DONE)
+        for thread in threads:
+            thread.join()
+
+
+class DocumentTracker:
+    """ Follows the documents through the persist, fetch and attach stages
+    A document is imported once its batch was flushed and all of its files
+    were attached, at which point its article is stamped with the digest of
+    the document. A failure at any of those steps is recorded against the
+    document in the failure log, so it can be retried.
+    """
+
+    def __init__(self, failure_log, content_hashes=None):
+        """
+        :param failure_log: The failures.FailureLog of the import
+        :param content_hashes: An optional identity.ContentHashes stamping
+            the articles of the imported documents
+        """
+        self.failure_log = failure_log
+        self.content_hashes = content_hashes
+        # root -> number of files emitted and not yet attached
+        self.files = defaultdict(int)
+        # root -> (article id, digest of the document)
+        self.digests = {}
+        self.persisted = set()
+        self.flushed = set()
+        self.failed = set()
+        self.lock = threading.Lock()
+
+    def add_file(self, root):
+        with self.lock:
+            self.files[root] += 1
+
+    def file_done(self, root):
+        with self.lock:
+            self.files[root] -= 1
+            ready = self._ready(root)
+        if ready:
+            self._resolve(root)
+
+    def persist_done(self, root, article_id=None, digest=None):
+        with self.lock:
+            self.persisted.add(root)
+            self.digests[root] = (article_id, digest)
+
+    def flush_done(self, root):
+        with self.lock:
+            self.flushed.add(root)
+            ready = self._ready(root)
+        if ready:
+            self._resolve(root)
+
+    def fail(self, root, stage, exception):
+        """ Records the failure of a document, unless it already failed"""
+        with self.lock:
+            if root in self.failed:
+                return
+            self.failed.add(root)
+        self.failure_log.record(root, stage, exception)
+
+    @property
+    def imported(self):
+        return len(self.persisted - self.failed)
+
+    def _resolve(self, root):
+        self.failure_log.resolve(root)
+        with self.lock:
+            article_id, digest = self.digests.pop(root, (None, None))
+        if self.content_hashes is not None:
+            self.content_hashes.stamp(article_id, digest)
+
+    def _ready(self, root):
+        return (
+            root in self.flushed
+            and not self.files[root]
+            and root not in self.failed
+        )
+
+
+class FileEmitter:
+    """ Stands in for the FileQueue of an ImportBatch, sending the files of
+    the persisted articles down the pipeline instead of queueing them in the
+    database
+    """
+
+    def __init__(self, documents):
+        """
+        :param documents: The DocumentTracker of the import
+        """
+        self.documents = documents
+        self.emit = None
+        # The document being persisted
+        self.root = None
+
+    def add(self, pending_files):
+        for pending in pending_files:
+            self.documents.add_file(self.root)
+            self.emit((self.root, pending))
+
+    def flush(self):
+        pass
+
+
+def import_archive_pipelined(
+    folder, stamped, site, struct,
+    default_section=None, section_key=None, import_path=None,
+    custom_fields=None, parse_workers=PARSE_WORKERS,
+    fetch_workers=FETCH_WORKERS, queue_size=QUEUE_SIZE, retry_failed=False,
+    force=False,
+):
+    """ Imports the articles of an export through a pipeline of stages
+    Takes the same arguments as utils.import_archive, other than:
+    :param parse_workers: Number of threads parsing documents
+    :param fetch_workers: Number of threads downloading files
+    :param queue_size: Number of items each queue holds at most
+    :return: A utils.ImportSummary
+    """
+    logger.set_prefix(site.code)
+    path = os.path.join(BEPRESS_PATH, folder)
+    imported_articles = utils.preload_imported_articles(folder, site)
+    identities = identity.IdentityIndex(site)
+    skipped = []
+    failure_log = failures.FailureLog(site, folder, path)
+    record_cache = records.RecordCache()
+    record_cache.prune()
+    # Tracks the stage at which the persist stage fails
+    tracker = profiling.StageTracker(profiling.NullProfiler())
+    progress = DocumentTracker(
+        failure_log, identity.ContentHashes(identities))
+    options = utils.import_options(
+        stamped, default_section, section_key, custom_fields)
+    files = FileEmitter(progress)
+    import_batch = ImportBatch(
+        issues=issues.IssuePlanner(site, struct, path),
+        notes=NoteRegistry(),
+        keywords=KeywordRegistry(),
+        files=files,
+    )
+    if custom_fields:
+        import_batch.custom_fields = CustomFieldMapping(site, custom_fields)
+    # The documents persisted since the import batch was last flushed
+    batch_roots = []
+
+    def discover(path, emit):
+        if retry_failed:
+            documents = list(failure_log.documents())
+        else:
+            documents = list(utils.iter_metadata_roots(path, import_path))
+        # Planned from lxml rather than the record cache, so that souping
+        # the documents on a cold cache is left to the parse workers
+        import_batch.issues.plan(root for root, _ in documents)
+        for document in documents:
+            emit(document)
+
+    def parse(document, emit):
+        root, files_ = document
+        try:
+            record = record_cache.load(os.path.join(root, "metadata.xml"))
+        except Exception as e:
+            failure_log.record(root, "load_record", e)
+            raise
+        emit((root, files_, record))
+
+    def persist(parsed, emit):
+        root, files_, record = parsed
+        digest = identity.document_digest(record, root, files_, options)
+        if not force and utils.is_unchanged(
+            record, digest, root, identities, failure_log,
+        ):
+            skipped.append(root)
+            return
+        files.emit = emit
+        files.root = root
+        try:
+            tracker.start_item()
+            article = utils.import_article(
+                record, root, files_, folder, stamped, site,
+                struct, default_section, section_key,
+                custom_fields=custom_fields,
+                profiler=tracker,
+                imported_articles=imported_articles,
+                batch=import_batch,
+                identities=identities,
+            )
+        except Exception as e:
+            progress.fail(root, tracker.current, e)
+            raise
+        else:
+            progress.persist_done(root, article.pk, digest)
+            batch_roots.append(root)
+        finally:
+            db.reset_queries()
+        if len(batch_roots) >= import_batch.size:
+            flush(emit)
+
+    def flush(emit):
+        files.emit = emit
+        roots = list(batch_roots)
+        batch_roots.clear()
+        try:
+            import_batch.flush()
+        except Exception as e:
+            logger.error("Failed to flush the import batch: %s", e)
+            logger.exception(e)
+            for root in roots:
+                progress.fail(root, "flush", e)
+        else:
+            for root in roots:
+                progress.flush_done(root)
+
+    def fetch(item, emit):
+        root, pending = item
+        try:
+            django_file = ingest.fetch_pending_file(pending)
+        except Exception as e:
+            progress.fail(root, "fetch", e)
+            progress.file_done(root)
+            raise
+        emit((root, pending, django_file))
+
+    def attach(fetched, emit):
+        root, pending, django_file = fetched
+        try:
+            ingest.attach_pending_file(pending, django_file)
+        except Exception as e:
+            progress.fail(root, "attach", e)
+            raise
+        finally:
+            progress.file_done(root)
+
+    stages = [
+        Stage("discover", discover),
+        Stage("parse", parse, workers=parse_workers),
+        Stage("persist", persist, on_done=flush),
+        Stage("fetch", fetch, workers=fetch_workers),
+        Stage("attach", attach),
+    ]
+    Pipeline(stages, queue_size).run([path])
+
+    summary = utils.ImportSummary()
+    summary.skipped = len(skipped)
+    summary.imported = progress.imported
+    summary.failed = stages[1].failed + len(progress.failed)
+    summary.stage_reports = [stage.report() for stage in stages]
+    summary.add_records(record_cache)
+    return summary
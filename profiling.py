@@ -0,0 +1,207 @@
+"""
+Profiling hooks for the bepress import commands
+
+An ImportProfiler keeps a separate cProfile.Profile per import stage (e.g.
+each step of utils.import_article) and can either profile every item of
+the run or a sample of 1 in N items. When dumped, each stage produces:
+ - <stage>.pstats: Loadable with pstats, snakeviz, gprof2dot, etc.
+ - <stage>.collapsed: Collapsed stacks for flamegraph.pl/speedscope
+ - memory.tracemalloc: A tracemalloc snapshot taken at the end of the last
+   profiled item (only with trace_memory)
+"""
+import cProfile
+from contextlib import contextmanager
+import os
+import pstats
+import tracemalloc
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class NullProfiler:
+    """ Profiler interface that does nothing, used when profiling is off"""
+
+    def start_item(self):
+        return False
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def take_snapshot(self):
+        pass
+
+    def dump(self):
+        pass
+
+
+class ImportProfiler(NullProfiler):
+    def __init__(self, output_dir, sample_every=1, trace_memory=False):
+        """
+        :param output_dir: Directory where the profiling output is written
+        :param sample_every: Profile one in every N items (1 profiles all)
+        :param trace_memory: Take a tracemalloc snapshot at the end of each
+            profiled item
+        """
+        self.output_dir = output_dir
+        self.sample_every = max(1, sample_every)
+        self.trace_memory = trace_memory
+        self.profiles = {}
+        self.snapshot = None
+        self.items = 0
+        self.sampled = False
+        self._active = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start_item(self):
+        """ Marks the beginning of a new item (article, CSV row...)
+        :return: True if the item will be profiled
+        """
+        if self.sampled:
+            # Snapshots are taken between items rather than on every stage
+            # exit, so that they aren't accounted to the timings of stages
+            self.take_snapshot()
+        self.sampled = self.items % self.sample_every == 0
+        self.items += 1
+        return self.sampled
+
+    @contextmanager
+    def stage(self, name):
+        # cProfile can't nest profilers, inner stages are accounted to the
+        # outermost one
+        if not self.sampled or self._active:
+            yield
+            return
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        self._active = True
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._active = False
+
+    def take_snapshot(self):
+        """ Takes a tracemalloc snapshot, written by dump, if tracing memory
+        """
+        if self.trace_memory:
+            self.snapshot = tracemalloc.take_snapshot()
+
+    def dump(self):
+        if self.sampled:
+            self.take_snapshot()
+            self.sampled = False
+        os.makedirs(self.output_dir, exist_ok=True)
+        for name, profile in self.profiles.items():
+            stats = pstats.Stats(profile)
+            stats_path = os.path.join(self.output_dir, "%s.pstats" % name)
+            stats.dump_stats(stats_path)
+            collapsed_path = os.path.join(
+                self.output_dir, "%s.collapsed" % name)
+            write_collapsed_stacks(stats, collapsed_path)
+            logger.info("Written profile for stage %s to %s", name, stats_path)
+        if self.snapshot is not None:
+            self.snapshot.dump(
+                os.path.join(self.output_dir, "memory.tracemalloc"))
+
+
+class StageTracker:
+    """ Wraps a profiler, remembering the last stage entered by an item
+    Allows reporting the stage at which the import of a document failed
+    """
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.current = None
+
+    def start_item(self):
+        self.current = None
+        return self.profiler.start_item()
+
+    @contextmanager
+    def stage(self, name):
+        self.current = name
+        with self.profiler.stage(name):
+            yield
+
+    def take_snapshot(self):
+        self.profiler.take_snapshot()
+
+    def dump(self):
+        self.profiler.dump()
+
+
+def get_profiler(output_dir=None, sample_every=1, trace_memory=False):
+    if output_dir:
+        return ImportProfiler(output_dir, sample_every, trace_memory)
+    return NullProfiler()
+
+
+def add_profiling_arguments(parser):
+    """ Adds the profiling options to a management command parser"""
+    parser.add_argument(
+        '--profile',
+        metavar="OUTPUT_DIR",
+        help="Profile the run and write the results to the given directory",
+    )
+    parser.add_argument(
+        '--profile-sample',
+        type=int, default=1, metavar="N",
+        help="Only profile 1 in every N items (default: profile all)",
+    )
+    parser.add_argument(
+        '--profile-memory',
+        action="store_true", default=False,
+        help="Take a tracemalloc snapshot at the end of each profiled item",
+    )
+
+
+def get_profiler_from_options(options):
+    return get_profiler(
+        options.get("profile"),
+        options.get("profile_sample") or 1,
+        options.get("profile_memory", False),
+    )
+
+
+def write_collapsed_stacks(stats, path):
+    """ Writes the given stats in the collapsed stack format
+    cProfile only records caller/callee pairs rather than full stacks, so the
+    own time of each function is attributed to the chain of its heaviest
+    callers, which is the usual approximation for deterministic profilers.
+    :param stats: A pstats.Stats instance
+    :param path: The path where the collapsed stacks are written
+    """
+    entries = stats.stats
+    with open(path, "w") as collapsed_file:
+        for func, (_, _, own_time, _, _) in entries.items():
+            microseconds = int(own_time * 1e6)
+            if not microseconds:
+                continue
+            frames = ";".join(
+                frame_label(frame) for frame in heaviest_stack(entries, func)
+            )
+            collapsed_file.write("%s %d\n" % (frames, microseconds))
+
+
+def heaviest_stack(entries, func):
+    stack = [func]
+    seen = {func}
+    while True:
+        callers = entries[func][4]
+        candidates = [c for c in callers if c in entries and c not in seen]
+        if not candidates:
+            break
+        # Each caller maps to (cc, nc, tt, ct) for that edge
+        func = max(candidates, key=lambda c: callers[c][3])
+        stack.append(func)
+        seen.add(func)
+    return reversed(stack)
+
+
+def frame_label(func):
+    filename, line, name = func
+    return "%s:%d:%s" % (os.path.basename(filename), line, name)
@@ -0,0 +1,228 @@
+"""
+Cache of the article records extracted from metadata.xml documents
+
+Souping a metadata.xml is the most expensive step of importing the metadata
+of an article, and re-runs of an import soup the very same documents again.
+The metadata read by the article import is extracted from the soup into a
+record of plain python types, which is cached on disk keyed by the hash of
+the metadata.xml content. Later imports (and the planning of issues) load
+the cached record instead of souping the document again.
+
+Records are stored in a directory per parser version, so that upgrading
+beautifulsoup, lxml or python, or changing what extract_record extracts
+(bump RECORD_VERSION), invalidates all the cached records.
+"""
+import hashlib
+import json
+import marshal
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import zlib
+
+import bs4
+from bs4 import BeautifulSoup
+from django.conf import settings
+from lxml import etree
+
+from utils.logger import get_logger
+
+from plugins.bepress import archives
+from plugins.bepress.plugin_settings import BEPRESS_PATH
+
+logger = get_logger(__name__)
+
+# Bump whenever extract_record changes what it extracts
+RECORD_VERSION = 1
+PARSER_VERSION = "v%d-bs4_%s-lxml_%s-py%d.%d" % (
+    RECORD_VERSION,
+    bs4.__version__,
+    ".".join(str(part) for part in etree.LXML_VERSION),
+    *sys.version_info[:2]
+)
+# Set to None to disable the cache
+CACHE_DIR = getattr(
+    settings, "BEPRESS_RECORD_CACHE_DIR", os.path.join(BEPRESS_PATH, ".records"))
+
+# Elements of the document extracted as record[name], with dashes as
+# underscores (e.g. record["publication_date"])
+TAGS = (
+    "articleid", "title", "abstract", "publication-date", "submission-date",
+    "submission-path", "document-type", "publication-title", "fpage",
+    "lpage", "fulltext-url", "native-url",
+)
+AUTHOR_TAGS = (
+    "organization", "fname", "mname", "lname", "suffix", "institution",
+    "email",
+)
+
+
+def get_string(tag):
+    """ Gets the string of an element as stored in a record
+    :return: None when the element is missing, its string otherwise
+    """
+    if tag is None:
+        return None
+    if tag.string is None:
+        return ""
+    return str(tag.string)
+
+
+def extract_record(soup):
+    """ Extracts the metadata read by the import of an article
+    :param soup: An instance of bs4.BeautifulSoup of the article XML
+    :return: A dict of plain python types
+    """
+    record = {
+        name.replace("-", "_"): get_string(soup.find(name)) for name in TAGS
+    }
+    # Fields by name, with the string of their value or None without one
+    fields = {}
+    if soup.fields is not None:
+        for field in soup.fields.find_all(attrs={"name": True}):
+            fields.setdefault(field["name"], get_string(field.value))
+    record["fields"] = fields
+
+    authors = []
+    if soup.authors is not None:
+        for author in soup.authors.find_all(recursive=False):
+            authors.append({
+                name: get_string(author.find(name)) for name in AUTHOR_TAGS
+            })
+    record["authors"] = authors
+
+    record["keywords"] = [
+        str(keyword.string) for keyword in soup.find_all("keyword")
+        if keyword.string
+    ]
+
+    supp_files = []
+    supp_files_soup = soup.find("supplemental-files")
+    if supp_files_soup is not None:
+        for file_soup in supp_files_soup.find_all("file"):
+            supp_files.append({
+                "url": get_string(file_soup.url),
+                "mime_type": get_string(file_soup.find("mime-type")),
+                "description": get_string(file_soup.description),
+            })
+    record["supplemental_files"] = supp_files
+    return record
+
+
+class RecordCache:
+    def __init__(self, cache_dir=CACHE_DIR):
+        """
+        :param cache_dir: The directory of the cache, or None to extract
+            the record of every document
+        """
+        self.cache_dir = cache_dir
+        self.version_dir = None
+        if cache_dir:
+            self.version_dir = os.path.join(cache_dir, PARSER_VERSION)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def load(self, metadata_path):
+        """ Loads the record of a metadata.xml, souping it on a cache miss
+        :param metadata_path: The path of the metadata.xml
+        :return: A dict (See extract_record), along with the SHA-256 of the
+            metadata.xml under "digest"
+        """
+        with archives.open_local(metadata_path) as metadata_file:
+            content = metadata_file.read()
+        key = hashlib.sha256(content).hexdigest()
+        record = self.get(key)
+        if record is not None:
+            with self.lock:
+                self.hits += 1
+            record["digest"] = key
+            return record
+
+        logger.info('Souping article %s' % metadata_path)
+        soup = BeautifulSoup(content, "lxml")
+        try:
+            record = extract_record(soup)
+        finally:
+            soup.decompose()
+        self.set(key, record)
+        with self.lock:
+            self.misses += 1
+        record["digest"] = key
+        return record
+
+    def get_path(self, key):
+        return os.path.join(self.version_dir, key[:2], key)
+
+    def get(self, key):
+        if not self.version_dir:
+            return None
+        try:
+            with open(self.get_path(key), "rb") as record_file:
+                # The cache is only ever written by set, so unmarshalling
+                # its records is safe
+                return marshal.loads(zlib.decompress(record_file.read()))
+        except FileNotFoundError:
+            return None
+        except (EOFError, ValueError, TypeError, zlib.error) as e:
+            logger.warning("Discarding unreadable record %s: %s", key, e)
+            return None
+
+    def set(self, key, record):
+        if not self.version_dir:
+            return
+        path = self.get_path(key)
+        data = zlib.compress(marshal.dumps(record))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name so that concurrent imports
+            # never read a partial record
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as record_file:
+                record_file.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Unable to cache record %s: %s", key, e)
+
+    def prune(self):
+        """ Deletes the records cached by other versions of the parser"""
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name != PARSER_VERSION:
+                logger.info("Deleting stale records %s", name)
+                shutil.rmtree(
+                    os.path.join(self.cache_dir, name), ignore_errors=True)
+
+
+class RecordSet:
+    """ Records built in memory, loaded like a RecordCache by the import
+
+    Used to import documents that were never written as a metadata.xml, such
+    as the rows of a CSV batch (See csv_handler.import_csv).
+    """
+
+    def __init__(self):
+        # metadata.xml path -> record
+        self.records = {}
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, root, record):
+        """ Adds the record of the document in the given directory
+        :param root: The directory the document would be written to
+        :param record: A dict (See extract_record), where the "digest" key
+            defaults to the SHA-256 of the record itself
+        """
+        if not record.get("digest"):
+            content = json.dumps(record, sort_keys=True).encode("utf-8")
+            record["digest"] = hashlib.sha256(content).hexdigest()
+        self.records[os.path.join(root, "metadata.xml")] = record
+
+    def load(self, metadata_path):
+        try:
+            return self.records[metadata_path]
+        except KeyError:
+            raise FileNotFoundError(metadata_path)
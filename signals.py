@@ -0,0 +1,129 @@
+"""
+Deferral of the model signals fired while importing
+
+Janeway runs receivers (search indexing, caching...) every time an article,
+issue or galley is saved, and an import saves each of them several times.
+While DeferredSignals is active, the post_save and m2m_changed signals of
+those models are recorded instead of sent, and are replayed once per
+touched object when flushed.
+"""
+import time
+from collections import OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_save
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Models whose signals are deferred, as "app_label.ModelName"
+DEFERRED_SENDERS = getattr(
+    settings, "BEPRESS_DEFERRED_SIGNAL_SENDERS",
+    ["submission.Article", "journal.Issue", "core.Galley"],
+)
+SIGNALS = (post_save, m2m_changed)
+
+
+class DeferredSignals:
+    """ Defers the signals of the given models until flushed
+    Signals are patched globally, so this is only meant to be used by a
+    single threaded import process.
+    """
+
+    def __init__(self, senders=None):
+        self.senders = {
+            apps.get_model(label) for label in senders or DEFERRED_SENDERS
+        }
+        self.pending = OrderedDict()
+        self.deferred = 0
+        self.replayed = 0
+        self.replay_time = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        for signal in SIGNALS:
+            signal.send = self.make_send(signal)
+
+    def stop(self):
+        """ Restores the signals and replays any pending ones"""
+        for signal in SIGNALS:
+            if "send" in vars(signal):
+                del signal.send
+        self.flush()
+
+    def make_send(self, signal):
+        send = type(signal).send
+
+        def deferred_send(sender, **named):
+            instance = named.get("instance")
+            if sender in self.senders or type(instance) in self.senders:
+                self.defer(signal, sender, named)
+                return []
+            return send(signal, sender, **named)
+
+        return deferred_send
+
+    def defer(self, signal, sender, named):
+        self.deferred += 1
+        instance = named["instance"]
+        if signal is m2m_changed:
+            key = (
+                signal, sender, instance.pk,
+                named["action"], named["reverse"], named["model"],
+            )
+        else:
+            key = (signal, sender, instance.pk)
+        previous = self.pending.get(key)
+        if previous is not None:
+            named = merge_signal_arguments(previous, named)
+        self.pending[key] = named
+
+    def flush(self):
+        """ Sends each of the pending signals once"""
+        pending, self.pending = self.pending, OrderedDict()
+        start = time.perf_counter()
+        for (signal, sender, *_), named in pending.items():
+            responses = type(signal).send_robust(signal, sender, **named)
+            for receiver, response in responses:
+                if isinstance(response, Exception):
+                    logger.error(
+                        "Replaying %s for %s failed: %s",
+                        receiver, named["instance"], response,
+                    )
+            self.replayed += 1
+        self.replay_time += time.perf_counter() - start
+
+    @property
+    def reclaimed_time(self):
+        """ Estimated seconds not spent running receivers thanks to deferral
+        Assumes that every deferred signal would have taken as long as the
+        average replayed signal
+        """
+        if not self.replayed:
+            return 0.0
+        average = self.replay_time / self.replayed
+        return average * (self.deferred - self.replayed)
+
+
+def merge_signal_arguments(previous, named):
+    """ Combines the arguments of two sends of a signal for an object"""
+    named = dict(named)
+    if "created" in named:
+        named["created"] = previous["created"] or named["created"]
+    if "update_fields" in named:
+        if previous["update_fields"] is None or named["update_fields"] is None:
+            named["update_fields"] = None
+        else:
+            named["update_fields"] = (
+                previous["update_fields"] | named["update_fields"])
+    if named.get("pk_set") is not None and previous.get("pk_set") is not None:
+        named["pk_set"] = previous["pk_set"] | named["pk_set"]
+    return named
@@ -1,9 +1,16 @@
 from bs4 import BeautifulSoup
-from django.test import TestCase, override_settings
+from django.test import SimpleTestCase, TestCase, override_settings
 
 from utils.testing import helpers
 
-from plugins.bepress.utils import add_youtube_galley
+from plugins.bepress import models
+from plugins.bepress.utils import (
+    add_youtube_galley,
+    get_imported_article,
+    parse_header,
+    preload_imported_articles,
+    resume_documents,
+)
 
 class TestImportArticle(TestCase):
 
@@ -20,3 +27,59 @@ class TestImportArticle(TestCase):
         expected = f'xlink:href="{youtube_url}"'
         self.assertTrue(expected in str(galley_contents))
 
+    def test_preload_imported_articles(self):
+        article = helpers.create_article(journal=self.journal_one)
+        models.ImportedArticle.objects.create(
+            dump_name="dump", bepress_id=1001,
+            journal=self.journal_one, article=article,
+        )
+        models.ImportedArticle.objects.create(
+            dump_name="other_dump", bepress_id=1002, journal=self.journal_one,
+        )
+        with self.assertNumQueries(1):
+            imported_articles = preload_imported_articles(
+                "dump", self.journal_one)
+            self.assertEqual(imported_articles[1001].article, article)
+        self.assertNotIn(1002, imported_articles)
+
+    def test_get_imported_article_from_preloaded(self):
+        imported_articles = preload_imported_articles("dump", self.journal_one)
+        imported, created = get_imported_article(
+            "dump", 1003, self.journal_one, imported_articles)
+        self.assertTrue(created)
+        with self.assertNumQueries(0):
+            same, created = get_imported_article(
+                "dump", 1003, self.journal_one, imported_articles)
+        self.assertFalse(created)
+        self.assertEqual(imported, same)
+
+
+class TestParseHeader(SimpleTestCase):
+
+    def test_parse_header(self):
+        self.assertEqual(
+            parse_header('attachment; filename="article.pdf"'),
+            ("attachment", {"filename": "article.pdf"}),
+        )
+
+    def test_rfc2231_filename(self):
+        self.assertEqual(
+            parse_header("attachment; filename*=UTF-8''na%C3%AFve.pdf"),
+            ("attachment", {"filename": "na\u00efve.pdf"}),
+        )
+
+
+class TestResumeDocuments(SimpleTestCase):
+
+    def test_resumes_by_position(self):
+        documents = [
+            ("/dump/vol1/iss1/4", []),
+            ("/dump/vol1/iss1/5", []),
+            ("/dump/vol1/iss1-a/1", []),
+        ]
+
+        self.assertEqual(
+            list(resume_documents(documents, "/dump/vol1/iss1/5")),
+            documents[1:],
+        )
+        self.assertEqual(list(resume_documents(documents)), documents)
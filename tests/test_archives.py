@@ -0,0 +1,98 @@
+"""
+Test cases for importing from zip and tar archives
+"""
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+
+from django.test import SimpleTestCase
+
+from plugins.bepress import archives
+from plugins.bepress.utils import iter_metadata_roots
+
+MEMBERS = {
+    "vol1/iss1/1/metadata.xml": b"<documents></documents>",
+    "vol1/iss1/1/fulltext.pdf": b"%PDF-1.4",
+    "vol1/iss2/1/metadata.xml": b"<documents></documents>",
+}
+
+
+class TestArchives(SimpleTestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.zip_path = os.path.join(tmp_dir.name, "dump.zip")
+        with zipfile.ZipFile(self.zip_path, "w") as zip_file:
+            for name, content in MEMBERS.items():
+                zip_file.writestr(name, content)
+        self.tar_path = os.path.join(tmp_dir.name, "dump.tar.gz")
+        with tarfile.open(self.tar_path, "w:gz") as tar_file:
+            for name, content in MEMBERS.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar_file.addfile(info, io.BytesIO(content))
+
+    def test_walk(self):
+        for path in (self.zip_path, self.tar_path):
+            roots = [root for root, _ in iter_metadata_roots(path)]
+            self.assertEqual(
+                roots,
+                [
+                    os.path.join(path, "vol1/iss1/1"),
+                    os.path.join(path, "vol1/iss2/1"),
+                ],
+            )
+
+    def test_open_member(self):
+        for path in (self.zip_path, self.tar_path):
+            member_path = os.path.join(path, "vol1/iss1/1/fulltext.pdf")
+            with archives.open_local(member_path) as member:
+                self.assertEqual(member.read(), b"%PDF-1.4")
+                self.assertEqual(member.size, 8)
+                self.assertEqual(member.name, "fulltext.pdf")
+
+    def test_missing_member(self):
+        with self.assertRaises(FileNotFoundError):
+            archives.open_local(os.path.join(self.zip_path, "missing.pdf"))
+
+    def test_listdir_and_isfile(self):
+        root = os.path.join(self.zip_path, "vol1/iss1/1")
+        self.assertEqual(
+            sorted(archives.listdir(root)), ["fulltext.pdf", "metadata.xml"])
+        self.assertTrue(archives.isfile(os.path.join(root, "metadata.xml")))
+        self.assertFalse(archives.isfile(os.path.join(root, "missing.xml")))
+
+    def test_modified_archive_is_indexed_again(self):
+        archive = archives.get_archive(self.zip_path)
+        self.assertIs(archives.get_archive(self.zip_path), archive)
+
+        with zipfile.ZipFile(self.zip_path, "a") as zip_file:
+            zip_file.writestr("vol1/iss3/1/metadata.xml", b"<documents/>")
+
+        self.assertTrue(archives.isfile(
+            os.path.join(self.zip_path, "vol1/iss3/1/metadata.xml")))
+        self.assertIsNot(archives.get_archive(self.zip_path), archive)
+
+    def test_wrapped_archive(self):
+        # zip -r dump.zip dump/
+        wrapped_path = os.path.join(
+            os.path.dirname(self.zip_path), "wrapped", "dump.zip")
+        os.makedirs(os.path.dirname(wrapped_path))
+        with zipfile.ZipFile(wrapped_path, "w") as zip_file:
+            for name, content in MEMBERS.items():
+                zip_file.writestr(os.path.join("dump", name), content)
+
+        roots = [root for root, _ in iter_metadata_roots(wrapped_path)]
+        self.assertEqual(
+            roots,
+            [
+                os.path.join(wrapped_path, "vol1/iss1/1"),
+                os.path.join(wrapped_path, "vol1/iss2/1"),
+            ],
+        )
+        member_path = os.path.join(wrapped_path, "vol1/iss1/1/fulltext.pdf")
+        with archives.open_local(member_path) as member:
+            self.assertEqual(member.read(), b"%PDF-1.4")
@@ -1,9 +1,16 @@
 """
 Test cases for the csv_handler module
 """
-from django.test import TestCase
+import csv
+import os
+import tempfile
+from unittest import mock
 
-from plugins.bepress import csv_handler
+from bs4 import BeautifulSoup
+from django.test import SimpleTestCase, TestCase
+
+from plugins.bepress import csv_handler, records, utils
+from plugins.bepress.plugin_settings import BEPRESS_PATH
 
 class TestFilesHandler(TestCase):
     def test_csv_to_xml(self):
@@ -57,6 +64,77 @@ class TestFilesHandler(TestCase):
         result = csv_handler.parse_authors(data)
         self.assertDictEqual(expected, result[0])
 
+
+class TestConvertCSVFiles(SimpleTestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = tmp_dir.name
+        for name in ("series_one.csv", "series_two.csv", "notes.txt"):
+            with open(os.path.join(self.path, name), "w") as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=TEST_ARTICLE_DATA)
+                writer.writeheader()
+                writer.writerow(TEST_ARTICLE_DATA)
+
+    def test_find_csv_files(self):
+        expected = [
+            os.path.join(self.path, "series_one.csv"),
+            os.path.join(self.path, "series_two.csv"),
+        ]
+        self.assertEqual(csv_handler.find_csv_files([self.path]), expected)
+        self.assertEqual(
+            csv_handler.find_csv_files(
+                [os.path.join(self.path, "*_one.csv"), expected[0]]),
+            expected[:1],
+        )
+        with self.assertRaises(FileNotFoundError):
+            csv_handler.find_csv_files([os.path.join(self.path, "*.xml")])
+
+    def test_parallel_output_matches_serial(self):
+        serial, _ = next(
+            csv_handler.csv_to_xml([TEST_ARTICLE_DATA], commit=False))
+
+        summary = csv_handler.convert_csv_files(
+            csv_handler.find_csv_files([self.path]),
+            commit=False, workers=2,
+        )
+
+        self.assertEqual((summary.files, summary.converted), (2, 2))
+        self.assertEqual(summary.failed_files, [])
+        self.assertEqual(summary.documents, [(serial, None), (serial, None)])
+
+
+class TestCSVToRecords(SimpleTestCase):
+
+    def test_record_matches_rendered_xml(self):
+        xml, _ = next(
+            csv_handler.csv_to_xml([TEST_ARTICLE_DATA], commit=False))
+        expected = records.extract_record(BeautifulSoup(xml, "lxml"))
+
+        root, record = next(csv_handler.csv_to_records([TEST_ARTICLE_DATA]))
+
+        self.assertEqual(record, expected)
+        self.assertEqual(
+            root,
+            os.path.join(BEPRESS_PATH, "journal/vol1/iss2", "123456"),
+        )
+
+    @mock.patch("plugins.bepress.utils.import_archive")
+    def test_import_csv(self, import_archive):
+        import_archive.return_value = utils.ImportSummary()
+
+        csv_handler.import_csv([TEST_ARTICLE_DATA], stamped=False)
+
+        root = os.path.join(BEPRESS_PATH, "journal/vol1/iss2", "123456")
+        kwargs = import_archive.call_args.kwargs
+        self.assertEqual(kwargs["folder"], "journal")
+        self.assertEqual(kwargs["documents"], [(root, [])])
+        record = kwargs["record_source"].load(
+            os.path.join(root, "metadata.xml"))
+        self.assertEqual(record["articleid"], "123456")
+        self.assertTrue(record["digest"])
+
 TEST_ARTICLE_DATA = {
     'title': 'The art of importing articles from bepress',
     'abstract': 'This is the abstract of my test paper',
@@ -0,0 +1,81 @@
+"""
+Test cases for the custom_fields module
+"""
+from bs4 import BeautifulSoup
+from django.test import SimpleTestCase, TestCase
+
+from submission import models as submission_models
+from utils.testing import helpers
+
+from plugins.bepress.custom_fields import (
+    CustomFieldMapping,
+    validate_custom_fields,
+)
+from plugins.bepress.records import extract_record
+
+
+class TestValidateCustomFields(SimpleTestCase):
+
+    def test_valid_mapping(self):
+        self.assertEqual(
+            validate_custom_fields([
+                ("location", "Location"),
+                ("data_availability", " Data availability "),
+            ]),
+            {"location": "Location", "data_availability": "Data availability"},
+        )
+
+    def test_bepress_field_mapped_twice(self):
+        with self.assertRaises(ValueError):
+            validate_custom_fields([("location", "A"), ("location", "B")])
+
+    def test_janeway_field_mapped_twice(self):
+        with self.assertRaises(ValueError):
+            validate_custom_fields([("location", "A"), ("city", "A")])
+
+    def test_blank_field(self):
+        with self.assertRaises(ValueError):
+            validate_custom_fields([("location", "")])
+
+
+class TestCustomFieldMapping(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+        cls.article_one = helpers.create_article(journal=cls.journal_one)
+        cls.article_two = helpers.create_article(journal=cls.journal_one)
+
+    def test_batched_answers(self):
+        mapping = CustomFieldMapping(
+            self.journal_one, {"location": "Location"})
+        mapping.add_answers(make_record("London"), self.article_one)
+        mapping.add_answers(make_record("Paris"), self.article_two)
+        mapping.flush()
+        mapping.add_answers(make_record("Lisbon"), self.article_one)
+        mapping.flush()
+
+        answers = submission_models.FieldAnswer.objects.filter(
+            field__name="Location",
+        )
+        self.assertEqual(
+            {answer.article: answer.answer for answer in answers},
+            {self.article_one: "Lisbon", self.article_two: "Paris"},
+        )
+
+
+def make_record(location):
+    return extract_record(BeautifulSoup(XML_DATA % location, "lxml"))
+
+
+XML_DATA = """
+<documents>
+  <document>
+    <fields>
+      <field name="location" type="string">
+        <value>%s</value>
+      </field>
+    </fields>
+  </document>
+</documents>
+"""
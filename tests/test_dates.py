@@ -0,0 +1,110 @@
+"""
+Test cases for the dates module
+"""
+import os
+import sys
+import time
+from unittest import mock, skipUnless
+
+from dateutil import parser
+from django.test import SimpleTestCase
+
+from plugins.bepress import dates
+
+# Date strings as found in bepress archives, CSV batches and OAI exports
+BEPRESS_DATE_CORPUS = [
+    "2016-02-17T00:00:00-08:00",
+    "2015-03-12T05:39:49-07:00",
+    "2019-11-04T10:21:07-08:00",
+    "2020-06-01T00:00:00-07:00",
+    "2012-01-01T00:00:00",
+    "2012-01-01",
+    "1999-01-01 00:00",
+    "2008-05-20 13:45:10",
+    "01/15/2019",
+    "1/5/2019",
+    "1/15/2019 0:00",
+    "12/31/2004 23:59:59",
+    "January 15, 2019",
+    "15 January 2019",
+]
+
+
+class TestParseBepressDate(SimpleTestCase):
+
+    def setUp(self):
+        dates.clear_cache()
+
+    def test_matches_dateutil_on_corpus(self):
+        for date_string in BEPRESS_DATE_CORPUS:
+            with self.subTest(date_string=date_string):
+                self.assertEqual(
+                    dates.parse_bepress_date(date_string),
+                    parser.parse(date_string),
+                )
+
+    def test_corpus_uses_fast_path(self):
+        for date_string in BEPRESS_DATE_CORPUS:
+            with self.subTest(date_string=date_string):
+                self.assertIsNotNone(dates.parse_fast(date_string))
+
+    def test_falls_back_to_dateutil(self):
+        self.assertEqual(
+            dates.parse_bepress_date("Tue, 15 Jan 2019 10:00:00"),
+            parser.parse("Tue, 15 Jan 2019 10:00:00"),
+        )
+
+    def test_extracts_date_from_corrupt_datetime(self):
+        self.assertEqual(
+            dates.parse_bepress_date("2016-02-17T99:99:99"),
+            parser.parse("2016-02-17"),
+        )
+
+    def test_unparseable(self):
+        self.assertIsNone(dates.parse_bepress_date("not a date"))
+        self.assertIsNone(dates.parse_bepress_date(None))
+
+    @mock.patch("plugins.bepress.dates.parse_fallback")
+    def test_dateutil_results_are_not_memoized(self, parse_fallback):
+        parse_fallback.side_effect = [
+            parser.parse("2019-01-15"), parser.parse("2019-01-16"),
+        ]
+
+        self.assertEqual(
+            dates.parse_bepress_date("Jan 15"), parser.parse("2019-01-15"))
+        self.assertEqual(
+            dates.parse_bepress_date("Jan 15"), parser.parse("2019-01-16"))
+
+
+@skipUnless(
+    os.environ.get("BEPRESS_BENCHMARKS"),
+    "Set BEPRESS_BENCHMARKS=1 to run the benchmarks",
+)
+class BenchmarkParseBepressDate(SimpleTestCase):
+    """ Times the parsing of the date corpus, as found in an archive where
+    the same date strings repeat many times
+    """
+    REPEAT = 1000
+
+    def time_parse(self, parse):
+        start = time.perf_counter()
+        for _ in range(self.REPEAT):
+            for date_string in BEPRESS_DATE_CORPUS:
+                parse(date_string)
+        return time.perf_counter() - start
+
+    def test_benchmark(self):
+        dates.clear_cache()
+        timings = [
+            ("dateutil.parser.parse", self.time_parse(parser.parse)),
+            ("fast path, not memoized", self.time_parse(
+                dates.parse_fast.__wrapped__)),
+            ("parse_bepress_date", self.time_parse(
+                dates.parse_bepress_date)),
+        ]
+        parses = self.REPEAT * len(BEPRESS_DATE_CORPUS)
+        for name, seconds in timings:
+            sys.stderr.write("\n%s: %d dates in %.3fs (%.2fus per date)" % (
+                name, parses, seconds, seconds / parses * 1e6,
+            ))
+        sys.stderr.write("\n")
@@ -0,0 +1,252 @@
+"""
+Test cases for the set-based import engine
+"""
+import io
+import os
+import tempfile
+from unittest import mock, skipUnless
+
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase
+
+from submission import models as submission_models
+from utils.testing import helpers
+
+from plugins.bepress import etl, models, records, utils
+
+
+class TestCopyValue(SimpleTestCase):
+
+    def test_copy_value(self):
+        self.assertEqual(etl.copy_value(None), "\\N")
+        self.assertEqual(etl.copy_value(True), "t")
+        self.assertEqual(etl.copy_value(3), "3")
+        self.assertEqual(
+            etl.copy_value("a\tb\nc\\d"), "a\\tb\\nc\\\\d")
+
+
+@skipUnless(connection.vendor == "postgresql", "Requires PostgreSQL")
+class TestCopyRows(TestCase):
+
+    def test_copy_rows(self):
+        rows = [
+            (1, "a\tb\nc\\d\r", None, True),
+            (2, "\\N", "", False),
+        ]
+        with connection.cursor() as cursor:
+            etl.create_staging_tables(cursor)
+            etl.copy_rows(cursor, "bepress_stage_frozen_author", [
+                (pk, first_name, middle_name, "", None, None, display_email)
+                for pk, first_name, middle_name, display_email in rows
+            ])
+            cursor.execute(
+                "SELECT frozen_author_id, first_name, middle_name,"
+                " display_email FROM bepress_stage_frozen_author"
+                " ORDER BY frozen_author_id"
+            )
+            self.assertEqual(cursor.fetchall(), rows)
+
+
+class TestImportArchiveETL(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.bepress_path = tmp_dir.name
+        self.add_document("1", 1001)
+        patches = [
+            mock.patch.object(etl, "BEPRESS_PATH", self.bepress_path),
+            mock.patch.object(
+                records, "RecordCache", lambda: records.RecordCache(None)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def add_document(self, name, bepress_id, xml_data=None):
+        root = os.path.join(self.bepress_path, "dump", "vol1", "iss1", name)
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, "metadata.xml"), "w") as metadata_file:
+            metadata_file.write((xml_data or XML_DATA).replace(
+                "<articleid>1001", "<articleid>%d" % bepress_id))
+
+    def import_dump(self, force=False, stamped=False):
+        return etl.import_archive_etl(
+            "dump", stamped, self.journal_one, "journal", force=force)
+
+    @mock.patch.object(etl, "is_supported", return_value=False)
+    @mock.patch("plugins.bepress.utils.import_archive")
+    def test_fallback_to_orm_import(self, import_archive, _):
+        self.import_dump()
+
+        self.assertTrue(import_archive.called)
+        self.assertTrue(import_archive.call_args.kwargs["defer_files"])
+
+    @mock.patch.object(etl, "is_supported", return_value=True)
+    def test_failed_chunk_is_bisected(self, _):
+        self.add_document("2", 1002)
+        self.add_document("3", 1003)
+        merged = []
+
+        def merge(chunk_merge, chunk, import_batch):
+            if 1002 in chunk:
+                raise DatabaseError("Merge failed")
+            merged.extend(chunk)
+            return {
+                bepress_id: submission_models.Article() for bepress_id in chunk
+            }
+
+        with mock.patch.object(
+            etl.ChunkMerge, "merge", autospec=True, side_effect=merge,
+        ):
+            summary = self.import_dump()
+
+        self.assertEqual((summary.imported, summary.failed), (2, 1))
+        self.assertEqual(sorted(merged), [1001, 1003])
+
+    @mock.patch.object(etl, "is_supported", return_value=True)
+    def test_duplicate_ids_merged_separately(self, _):
+        self.add_document("2", 1002)
+        self.add_document("3", 1001)
+        chunks = []
+
+        def merge(chunk_merge, chunk, import_batch):
+            chunks.append(sorted(chunk))
+            return {
+                bepress_id: submission_models.Article() for bepress_id in chunk
+            }
+
+        with mock.patch.object(
+            etl.ChunkMerge, "merge", autospec=True, side_effect=merge,
+        ):
+            summary = self.import_dump()
+
+        self.assertEqual(summary.imported, 3)
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(sorted(sum(chunks, [])), [1001, 1001, 1002])
+
+    @skipUnless(connection.vendor == "postgresql", "Requires PostgreSQL")
+    def test_merge_documents(self):
+        self.import_dump()
+        summary = self.import_dump(force=True)
+
+        self.assertEqual((summary.imported, summary.failed), (1, 0))
+        imported = models.ImportedArticle.objects.get(
+            dump_name="dump", bepress_id=1001)
+        article = submission_models.Article.objects.get(
+            pk=imported.article_id)
+        self.assertEqual(article.title, "A title")
+        self.assertEqual(article.page_numbers, "1-10")
+        self.assertEqual(imported.submission_path, "journal/vol1/iss1/1")
+        self.assertEqual(
+            sorted(article.keywords.values_list("word", flat=True)),
+            ["access", "open"],
+        )
+        self.assertEqual(
+            list(article.frozenauthor_set.values_list(
+                "first_name", "last_name")),
+            [("Ada", "Lovelace")],
+        )
+        self.assertEqual(article.correspondence_author.email, "ada@example.com")
+        self.assertEqual(
+            models.PendingFile.objects.filter(article=article).count(), 1)
+
+    @skipUnless(connection.vendor == "postgresql", "Requires PostgreSQL")
+    def test_update_frozen_authors(self):
+        self.import_dump()
+        self.add_document("1", 1001, XML_DATA.replace(
+            "<fname>Ada</fname>",
+            "<fname>Augusta</fname><mname>King</mname>",
+        ))
+        summary = self.import_dump()
+
+        self.assertEqual((summary.imported, summary.failed), (1, 0))
+        article = models.ImportedArticle.objects.get(
+            dump_name="dump", bepress_id=1001).article
+        self.assertEqual(
+            list(article.frozenauthor_set.values_list(
+                "first_name", "middle_name", "last_name")),
+            [("Augusta", "King", "Lovelace")],
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "Requires PostgreSQL")
+    def test_skip_unchanged_documents(self):
+        self.import_dump()
+        summary = self.import_dump()
+
+        self.assertEqual((summary.imported, summary.skipped), (0, 1))
+        self.assertTrue(
+            models.ImportedArticle.objects.get(
+                dump_name="dump", bepress_id=1001,
+            ).content_hash,
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "Requires PostgreSQL")
+    def test_reimport_with_other_options(self):
+        self.import_dump()
+        summary = self.import_dump(stamped=True)
+
+        self.assertEqual((summary.imported, summary.skipped), (1, 0))
+
+
+class TestBenchmarkCommand(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal, _ = helpers.create_journals()
+
+    @mock.patch.object(etl, "is_supported", return_value=True)
+    @mock.patch("plugins.bepress.utils.import_archive")
+    @mock.patch.object(etl, "import_archive_etl")
+    def test_runs_are_rolled_back(self, import_archive_etl, import_archive, _):
+        def import_dump(**kwargs):
+            submission_models.Article.objects.create(journal=self.journal)
+            summary = utils.ImportSummary()
+            summary.imported = 1
+            return summary
+        import_archive_etl.side_effect = import_dump
+        import_archive.side_effect = import_dump
+        output = io.StringIO()
+
+        call_command(
+            "benchmark_bepress_import", self.journal.code, "dump",
+            "--runs", "2", stdout=output,
+        )
+
+        self.assertEqual(import_archive_etl.call_count, 2)
+        self.assertEqual(import_archive.call_count, 2)
+        self.assertTrue(import_archive.call_args.kwargs["defer_files"])
+        self.assertFalse(submission_models.Article.objects.exists())
+        self.assertIn("etl: ", output.getvalue())
+        self.assertIn("orm: ", output.getvalue())
+
+
+XML_DATA = """
+<documents>
+  <document>
+    <title>A title</title>
+    <publication-date>2020-01-01T00:00:00-08:00</publication-date>
+    <submission-path>journal/vol1/iss1/1</submission-path>
+    <articleid>1001</articleid>
+    <fulltext-url>https://example.com/viewcontent.cgi?article=1</fulltext-url>
+    <fpage>1</fpage>
+    <lpage>10</lpage>
+    <keywords>
+      <keyword>open; access</keyword>
+    </keywords>
+    <authors>
+      <author>
+        <email>ada@example.com</email>
+        <lname>Lovelace</lname>
+        <fname>Ada</fname>
+      </author>
+    </authors>
+    <fields></fields>
+  </document>
+</documents>
+"""
@@ -0,0 +1,63 @@
+"""
+Test cases for the log of failed imports
+"""
+import os
+import tempfile
+
+from django.test import TestCase
+
+from utils.testing import helpers
+
+from plugins.bepress import models
+from plugins.bepress.failures import FailureLog
+
+
+class TestFailureLog(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.export_path = self.tmp_dir.name
+        self.root = os.path.join(self.export_path, "vol1", "iss1", "1")
+        os.makedirs(self.root)
+        with open(os.path.join(self.root, "metadata.xml"), "w"):
+            pass
+
+    def make_log(self):
+        return FailureLog(self.journal_one, "dump", self.export_path)
+
+    def test_record_failure(self):
+        log = self.make_log()
+        log.record(self.root, "pdf_galley", ValueError("No galley"))
+        log.record(self.root, "pdf_galley", ValueError("Still no galley"))
+
+        failed = models.FailedImport.objects.get()
+        self.assertEqual(failed.path, os.path.join("vol1", "iss1", "1"))
+        self.assertEqual(failed.stage, "pdf_galley")
+        self.assertEqual(failed.exception, "ValueError")
+        self.assertEqual(failed.message, "Still no galley")
+        self.assertEqual(failed.attempts, 2)
+
+    def test_failed_documents(self):
+        self.make_log().record(self.root, "soup_metadata", ValueError())
+        self.make_log().record(
+            os.path.join(self.export_path, "gone"), "soup_metadata",
+            ValueError(),
+        )
+
+        self.assertEqual(
+            list(self.make_log().documents()),
+            [(self.root, ["metadata.xml"])],
+        )
+
+    def test_resolve_failure(self):
+        self.make_log().record(self.root, "soup_metadata", ValueError())
+        log = self.make_log()
+        log.resolve(self.root)
+
+        self.assertFalse(models.FailedImport.objects.exists())
+        self.assertEqual(list(log.documents()), [])
@@ -0,0 +1,148 @@
+"""
+Test cases for the http_client module
+"""
+import io
+from unittest import mock
+
+from django.test import SimpleTestCase
+import requests
+
+from plugins.bepress import http_client
+
+
+def make_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response.raw = io.BytesIO(b"")
+    return response
+
+
+class TestHostLimiter(SimpleTestCase):
+
+    def test_limit_grows_after_a_window_of_successes(self):
+        limiter = http_client.HostLimiter(initial=2, maximum=8)
+        for _ in range(2):
+            limiter.acquire()
+            limiter.release(http_client.SUCCESS)
+        self.assertEqual(int(limiter.limit), 2)
+        for _ in range(2):
+            limiter.acquire()
+            limiter.release(http_client.SUCCESS)
+        self.assertEqual(int(limiter.limit), 3)
+
+    def test_limit_halves_when_throttled(self):
+        limiter = http_client.HostLimiter(initial=8, maximum=8)
+        limiter.acquire()
+        limiter.release(http_client.THROTTLED)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_limit_never_drops_below_one(self):
+        limiter = http_client.HostLimiter(initial=1, maximum=8)
+        limiter.acquire()
+        limiter.release(http_client.THROTTLED)
+        self.assertEqual(limiter.limit, 1)
+
+
+class TestFetchClient(SimpleTestCase):
+
+    def setUp(self):
+        self.client = http_client.FetchClient(max_retries=2)
+
+    @mock.patch("plugins.bepress.http_client.time.sleep")
+    def test_retries_throttled_responses(self, sleep):
+        responses = [make_response(503), make_response(200)]
+        with mock.patch.object(
+            self.client.session, "request", side_effect=responses,
+        ) as request:
+            response = self.client.get("https://example.org/article.pdf")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.call_count, 2)
+
+    @mock.patch("plugins.bepress.http_client.time.sleep")
+    def test_honours_retry_after(self, sleep):
+        responses = [
+            make_response(429, {"Retry-After": "7"}),
+            make_response(200),
+        ]
+        with mock.patch.object(
+            self.client.session, "request", side_effect=responses,
+        ):
+            self.client.get("https://example.org/article.pdf")
+        sleep.assert_called_once_with(7)
+
+    @mock.patch("plugins.bepress.http_client.time.sleep")
+    def test_returns_last_response_when_out_of_retries(self, sleep):
+        responses = [make_response(503) for _ in range(3)]
+        with mock.patch.object(
+            self.client.session, "request", side_effect=responses,
+        ):
+            response = self.client.get("https://example.org/article.pdf")
+        self.assertEqual(response.status_code, 503)
+
+    def test_sets_default_timeout(self):
+        with mock.patch.object(
+            self.client.session, "request", return_value=make_response(200),
+        ) as request:
+            self.client.get("https://example.org/article.pdf")
+        self.assertEqual(request.call_args[1]["timeout"], self.client.timeout)
+
+
+class TestStreamedRequests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = http_client.FetchClient()
+        self.limiter = self.client.limiter_for("https://example.org")
+
+    def get_streamed(self, raw):
+        response = make_response(200)
+        response.raw = raw
+        with mock.patch.object(
+            self.client.session, "request", return_value=response,
+        ):
+            return self.client.get(
+                "https://example.org/article.pdf", stream=True)
+
+    def test_slot_held_until_closed(self):
+        response = self.get_streamed(io.BytesIO(b"%PDF"))
+        self.assertEqual(self.limiter.active, 1)
+
+        response.close()
+        self.assertEqual(self.limiter.active, 0)
+        response.close()
+        self.assertEqual(self.limiter.active, 0)
+
+    def test_slot_released_once_body_read(self):
+        response = self.get_streamed(io.BytesIO(b"%PDF"))
+
+        self.assertEqual(response.raw.read(1024), b"%PDF")
+        self.assertEqual(self.limiter.active, 1)
+        self.assertEqual(response.raw.read(1024), b"")
+        self.assertEqual(self.limiter.active, 0)
+
+    def test_read_error_throttles(self):
+        raw = mock.Mock(closed=False)
+        raw.read.side_effect = requests.ConnectionError("Connection reset")
+        limit = self.limiter.limit
+        response = self.get_streamed(raw)
+
+        with self.assertRaises(requests.ConnectionError):
+            response.raw.read(1024)
+
+        self.assertEqual(self.limiter.active, 0)
+        self.assertEqual(self.limiter.limit, max(1, limit / 2))
+
+
+class TestParseRetryAfter(SimpleTestCase):
+
+    def test_seconds(self):
+        self.assertEqual(http_client.parse_retry_after("120"), 120)
+
+    def test_http_date_in_the_past(self):
+        self.assertEqual(
+            http_client.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"),
+            0,
+        )
+
+    def test_invalid(self):
+        self.assertIsNone(http_client.parse_retry_after("soon"))
@@ -0,0 +1,174 @@
+"""
+Test cases for the identity of the imported articles across dumps
+"""
+import os
+import tempfile
+
+from bs4 import BeautifulSoup
+from django.test import SimpleTestCase, TestCase
+
+from identifiers.models import Identifier
+from utils.testing import helpers
+
+from plugins.bepress import identity, models, records, utils
+
+
+def make_record(xml_data=None, digest="abc"):
+    soup = BeautifulSoup(xml_data or XML_DATA, "lxml")
+    record = records.extract_record(soup)
+    record["digest"] = digest
+    return record
+
+
+class TestIdentityIndex(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+        cls.article = helpers.create_article(journal=cls.journal_one)
+        models.ImportedArticle.objects.create(
+            dump_name="old_dump", bepress_id=1001, journal=cls.journal_one,
+            article=cls.article, submission_path="journal/vol1/iss1/1",
+            content_hash="abc",
+        )
+        Identifier.objects.create(
+            id_type="doi", identifier="10.1234/abc", article=cls.article)
+
+    def test_find_by_bepress_id(self):
+        index = identity.IdentityIndex(self.journal_one)
+
+        self.assertEqual(index.find(make_record()), self.article.pk)
+        self.assertIsNone(
+            identity.IdentityIndex(self.journal_two).find(make_record()))
+
+    def test_find_by_doi(self):
+        record = make_record(XML_DATA.replace("1001", "2001"))
+
+        self.assertEqual(
+            identity.IdentityIndex(self.journal_one).find(record),
+            self.article.pk,
+        )
+
+    def test_find_by_submission_path(self):
+        record = make_record(
+            XML_DATA.replace("1001", "2001").replace("10.1234/abc", ""))
+
+        self.assertEqual(
+            identity.IdentityIndex(self.journal_one).find(record),
+            self.article.pk,
+        )
+
+    def test_is_unchanged(self):
+        index = identity.IdentityIndex(self.journal_one)
+
+        self.assertTrue(index.is_unchanged(make_record(), "abc"))
+        self.assertFalse(index.is_unchanged(make_record(), "def"))
+        self.assertFalse(index.is_unchanged(make_record(), None))
+
+    def test_new_dump_updates_article_in_place(self):
+        index = identity.IdentityIndex(self.journal_one)
+        record = make_record(
+            XML_DATA.replace("A title", "New title"), digest="def")
+
+        article = utils.create_article_record(
+            "new_dump", record, self.journal_one, None, None,
+            identities=index,
+        )
+
+        self.assertEqual(article.pk, self.article.pk)
+        self.assertEqual(article.title, "New title")
+        self.assertEqual(
+            set(models.ImportedArticle.objects.filter(
+                article=self.article,
+            ).values_list("dump_name", "content_hash")),
+            {("old_dump", "abc"), ("new_dump", "")},
+        )
+
+    def test_articles_stamped_on_flush(self):
+        index = identity.IdentityIndex(self.journal_one)
+        models.ImportedArticle.objects.create(
+            dump_name="new_dump", bepress_id=1001, journal=self.journal_one,
+            article=self.article,
+        )
+        content_hashes = identity.ContentHashes(index)
+
+        content_hashes.add(self.article.pk, "def")
+        self.assertFalse(index.is_unchanged(make_record(), "def"))
+        content_hashes.flush()
+
+        self.assertEqual(
+            set(models.ImportedArticle.objects.filter(
+                article=self.article,
+            ).values_list("dump_name", "content_hash")),
+            {("old_dump", "def"), ("new_dump", "def")},
+        )
+        self.assertTrue(index.is_unchanged(make_record(), "def"))
+
+
+class TestDocumentDigest(SimpleTestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.root = tmp_dir.name
+        self.write("metadata.xml", XML_DATA)
+        self.write("fulltext.pdf", "PDF")
+        self.files = ["metadata.xml", "fulltext.pdf"]
+        self.options = utils.import_options(False, None, None, None)
+
+    def write(self, name, content):
+        with open(os.path.join(self.root, name), "w") as file_:
+            file_.write(content)
+
+    def digest(self, record=None, files_=None, options=None):
+        return identity.document_digest(
+            record or make_record(),
+            self.root,
+            self.files if files_ is None else files_,
+            options or self.options,
+        )
+
+    def test_stable(self):
+        self.assertEqual(self.digest(), self.digest())
+
+    def test_metadata_changed(self):
+        self.assertNotEqual(
+            self.digest(), self.digest(record=make_record(digest="def")))
+
+    def test_files_changed(self):
+        digest = self.digest()
+
+        self.assertNotEqual(digest, self.digest(files_=["metadata.xml"]))
+        self.write("fulltext.pdf", "A new PDF")
+        self.assertNotEqual(digest, self.digest())
+
+    def test_options_changed(self):
+        self.assertNotEqual(
+            self.digest(),
+            self.digest(options=utils.import_options(True, None, None, None)),
+        )
+        self.assertNotEqual(
+            self.digest(),
+            self.digest(options=utils.import_options(
+                False, None, None, {"rights": "Rights"})),
+        )
+
+    def test_without_digest(self):
+        self.assertIsNone(self.digest(record=make_record(digest=None)))
+
+
+XML_DATA = """
+<documents>
+  <document>
+    <title>A title</title>
+    <publication-date>2020-01-01T00:00:00-08:00</publication-date>
+    <submission-path>journal/vol1/iss1/1</submission-path>
+    <articleid>1001</articleid>
+    <fields>
+      <field name="doi" type="string">
+        <value>10.1234/abc</value>
+      </field>
+    </fields>
+  </document>
+</documents>
+"""
@@ -0,0 +1,81 @@
+"""
+Guards the cost of loading the plugin's URL configuration
+
+Every Janeway process loads the plugin URLs, while imports are rare admin
+actions, so the import machinery must not be loaded until it is used.
+"""
+import os
+import subprocess
+import sys
+
+from django.test import SimpleTestCase
+
+# Modules that must only be loaded once an import actually runs
+DEFERRED_MODULES = {
+    "bs4",
+    "dateutil",
+    "requests",
+    "plugins.bepress.csv_handler",
+    "plugins.bepress.utils",
+}
+# Budget for the time spent importing the plugin's own modules, in the best
+# of IMPORT_TIME_RUNS runs. The first run may compile the bytecode of the
+# modules and runs on a busy machine are slower, only the best is guarded.
+IMPORT_TIME_BUDGET_US = 50000
+IMPORT_TIME_RUNS = 3
+
+IMPORT_SCRIPT = """
+import sys
+import django
+django.setup()
+before = set(sys.modules)
+import plugins.bepress.urls
+print("\\n".join(set(sys.modules) - before))
+"""
+
+
+class TestImportTime(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        cls.plugin_times = []
+        for _ in range(IMPORT_TIME_RUNS):
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT],
+                env=env, capture_output=True, text=True, check=True,
+            )
+            cls.loaded_modules = set(result.stdout.split())
+            import_times = parse_import_times(result.stderr)
+            cls.plugin_times.append(sum(
+                self_time for module, self_time in import_times.items()
+                if module in cls.loaded_modules
+                and module.startswith("plugins.bepress")
+            ))
+
+    def test_heavy_dependencies_are_deferred(self):
+        loaded = {
+            module for module in self.loaded_modules
+            if module.split(".")[0] in DEFERRED_MODULES
+            or module in DEFERRED_MODULES
+        }
+        self.assertFalse(loaded, "Loaded on URL import: %s" % loaded)
+
+    def test_plugin_import_time_budget(self):
+        self.assertLess(
+            min(self.plugin_times), IMPORT_TIME_BUDGET_US,
+            "Plugin import times (us): %s" % self.plugin_times,
+        )
+
+
+def parse_import_times(output):
+    """ Parses the output of -X importtime into module -> self time (us)"""
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_time, _, module = line[len("import time:"):].split("|")
+        if self_time.strip().isdigit():
+            times[module.strip()] = int(self_time)
+    return times
@@ -0,0 +1,181 @@
+"""
+Test cases for the ingestion of deferred files
+"""
+from unittest import mock
+
+from bs4 import BeautifulSoup
+from django.test import TestCase
+
+from utils.testing import helpers
+
+from plugins.bepress import ingest, models
+from plugins.bepress.records import extract_record
+from plugins.bepress.utils import collect_pending_files
+
+
+class TestCollectPendingFiles(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+        cls.article = helpers.create_article(journal=cls.journal_one)
+
+    def test_remote_files(self):
+        record = extract_record(BeautifulSoup(XML_DATA, "lxml"))
+        pending = collect_pending_files(record, self.article, "/tmp", [])
+
+        self.assertEqual(
+            [(p.kind, p.url, p.label) for p in pending],
+            [
+                (
+                    models.PendingFile.SUPP_FILE,
+                    "https://example.com/data.csv",
+                    "Dataset",
+                ),
+                (
+                    models.PendingFile.PDF_GALLEY,
+                    "https://example.com/viewcontent.cgi?article=1&unstamped=1",
+                    "",
+                ),
+            ],
+        )
+
+    def test_local_galley(self):
+        record = extract_record(
+            BeautifulSoup("<document><fields></fields></document>", "lxml"))
+        pending = collect_pending_files(
+            record, self.article, "/tmp/1", ["fulltext.pdf", "metadata.xml"])
+
+        self.assertEqual(len(pending), 1)
+        self.assertEqual(pending[0].path, "/tmp/1/fulltext.pdf")
+
+
+class TestFileQueue(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+        cls.article = helpers.create_article(journal=cls.journal_one)
+
+    def queue_galley(self):
+        queue = ingest.FileQueue()
+        queue.add([models.PendingFile(
+            article=self.article,
+            kind=models.PendingFile.PDF_GALLEY,
+            url="https://example.com/viewcontent.cgi?article=1",
+        )])
+        queue.flush()
+
+    def test_skips_files_already_queued(self):
+        self.queue_galley()
+        self.queue_galley()
+
+        self.assertEqual(
+            models.PendingFile.objects.filter(article=self.article).count(), 1)
+
+    def test_requeues_failed_files(self):
+        self.queue_galley()
+        models.PendingFile.objects.update(status=models.PendingFile.FAILED)
+        self.queue_galley()
+
+        self.assertEqual(
+            models.PendingFile.objects.filter(
+                article=self.article,
+                status=models.PendingFile.PENDING,
+            ).count(),
+            1,
+        )
+
+
+class TestIngestFiles(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+        cls.article_one = helpers.create_article(journal=cls.journal_one)
+        cls.article_two = helpers.create_article(journal=cls.journal_two)
+
+    def queue(self, article, kind=models.PendingFile.PDF_GALLEY):
+        return models.PendingFile.objects.create(
+            article=article, kind=kind, url="https://example.com/file",
+        )
+
+    def test_claim_files_of_journal(self):
+        one = self.queue(self.article_one)
+        self.queue(self.article_two)
+
+        claimed = ingest.claim_pending_files(journal=self.journal_one)
+
+        self.assertEqual(claimed, [one])
+        one.refresh_from_db()
+        self.assertEqual(one.status, models.PendingFile.CLAIMED)
+        self.assertEqual(ingest.claim_pending_files(journal=self.journal_one), [])
+
+    def test_claim_all_files_of_an_article(self):
+        self.queue(self.article_one)
+        self.queue(self.article_one, models.PendingFile.SUPP_FILE)
+
+        claimed = ingest.claim_pending_files(size=1, journal=self.journal_one)
+
+        self.assertEqual(len(claimed), 2)
+
+    @mock.patch("plugins.bepress.ingest.ingest_file")
+    def test_failed_files_are_retried(self, ingest_file):
+        ingest_file.side_effect = ValueError("Gone")
+        pending = self.queue(self.article_one)
+
+        for _ in range(ingest.MAX_ATTEMPTS):
+            summary = ingest.ingest_article_files([pending])
+
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, models.PendingFile.FAILED)
+        self.assertEqual(pending.attempts, ingest.MAX_ATTEMPTS)
+        self.assertEqual(pending.error, "Gone")
+        self.assertEqual(summary.failed, 1)
+
+    @mock.patch("plugins.bepress.ingest.ingest_file")
+    def test_failed_files_clear_content_hash(self, ingest_file):
+        ingest_file.side_effect = ValueError("Gone")
+        imported = models.ImportedArticle.objects.create(
+            dump_name="dump", bepress_id=1001, journal=self.journal_one,
+            article=self.article_one, content_hash="abc",
+        )
+        pending = self.queue(self.article_one)
+
+        ingest.ingest_article_files([pending])
+        imported.refresh_from_db()
+        self.assertEqual(imported.content_hash, "abc")
+
+        for _ in range(ingest.MAX_ATTEMPTS - 1):
+            ingest.ingest_article_files([pending])
+        imported.refresh_from_db()
+        self.assertEqual(imported.content_hash, "")
+
+    @mock.patch("plugins.bepress.ingest.ingest_file")
+    def test_ingested_files_are_done(self, ingest_file):
+        pending = self.queue(self.article_one)
+
+        summary = ingest.ingest_article_files([pending])
+
+        ingest_file.assert_called_once_with(pending)
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, models.PendingFile.DONE)
+        self.assertEqual(summary.ingested, 1)
+
+
+XML_DATA = """
+<documents>
+  <document>
+    <fulltext-url>https://example.com/viewcontent.cgi?article=1</fulltext-url>
+    <supplemental-files>
+      <file>
+        <archive-name>data.csv</archive-name>
+        <url>https://example.com/data.csv</url>
+        <mime-type>text/csv</mime-type>
+        <description>Dataset</description>
+      </file>
+    </supplemental-files>
+    <fields></fields>
+  </document>
+</documents>
+"""
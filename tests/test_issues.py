@@ -0,0 +1,103 @@
+"""
+Test cases for the issues module
+"""
+from datetime import datetime
+
+from django.db import DatabaseError, transaction
+from django.test import SimpleTestCase, TestCase
+
+from journal import models as journal_models
+from utils.testing import helpers
+
+from plugins.bepress import const, issues
+
+
+class TestGetIssueDetails(SimpleTestCase):
+
+    def test_journal_structure(self):
+        key, year, type_code = issues.get_issue_details(
+            "/vol3/iss2/5", const.JOURNAL_STRUCTURE, datetime(2015, 3, 1),
+        )
+        self.assertEqual(key, (3, "2", ""))
+        self.assertEqual(year, "2015")
+        self.assertEqual(type_code, "issue")
+
+    def test_events_structure(self):
+        key, year, type_code = issues.get_issue_details(
+            "/2014/day1/3", const.EVENTS_STRUCTURE, datetime(2015, 3, 1),
+            "Annual Conference",
+        )
+        self.assertEqual(key, (1, "2014", "Annual Conference 2014"))
+        self.assertEqual(type_code, "collection")
+
+    def test_events_structure_without_year(self):
+        key, year, _ = issues.get_issue_details(
+            "/posters/3", const.EVENTS_STRUCTURE, datetime(2015, 3, 1),
+        )
+        self.assertEqual(key, (1, "2015", ""))
+
+    def test_series_structure(self):
+        key, year, _ = issues.get_issue_details(
+            "/123", const.SERIES_STRUCTURE, datetime(2015, 3, 1),
+        )
+        self.assertEqual(key, (2014, "2014", ""))
+
+    def test_articles_in_same_issue_share_key(self):
+        first, *_ = issues.get_issue_details(
+            "/vol3/iss2/5", const.JOURNAL_STRUCTURE, datetime(2015, 3, 1),
+        )
+        second, *_ = issues.get_issue_details(
+            "/vol3/iss2/6", const.JOURNAL_STRUCTURE, datetime(2015, 4, 1),
+        )
+        self.assertEqual(first, second)
+
+    def test_unknown_structure(self):
+        with self.assertRaises(RuntimeError):
+            issues.get_issue_details(
+                "/vol3/iss2/5", "books", datetime(2015, 3, 1))
+
+
+class TestIssuePlanner(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal, _ = helpers.create_journals()
+        cls.article = helpers.create_article(journal=cls.journal)
+
+    def test_add_article(self):
+        planner = issues.IssuePlanner(
+            self.journal, const.JOURNAL_STRUCTURE, "/export")
+
+        issue = planner.add_article(self.article, "/export/vol3/iss2/5")
+
+        self.assertEqual((issue.volume, issue.issue), (3, "2"))
+        self.assertEqual(planner.pending[issue], [self.article.pk])
+
+    def test_add_article_without_issue(self):
+        planner = issues.IssuePlanner(
+            self.journal, const.JOURNAL_STRUCTURE, "/export")
+
+        issue = planner.add_article(self.article, "/export/misc/5")
+
+        self.assertIsNone(issue)
+        self.assertFalse(planner.pending)
+
+    def test_reset_after_rollback(self):
+        planner = issues.IssuePlanner(
+            self.journal, const.JOURNAL_STRUCTURE, "/export")
+        try:
+            with transaction.atomic():
+                issue = planner.add_article(
+                    self.article, "/export/vol3/iss2/5")
+                raise DatabaseError
+        except DatabaseError:
+            planner.reset()
+
+        self.assertFalse(planner.pending)
+        self.assertNotIn(
+            issues.issue_key(issue.volume, issue.issue, issue.issue_title),
+            planner.issues,
+        )
+        issue = planner.add_article(self.article, "/export/vol3/iss2/5")
+        self.assertTrue(
+            journal_models.Issue.objects.filter(pk=issue.pk).exists())
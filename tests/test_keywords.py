@@ -0,0 +1,61 @@
+"""
+Test cases for the keywords module
+"""
+from django.test import SimpleTestCase, TestCase
+
+from submission import models as submission_models
+from utils.testing import helpers
+
+from plugins.bepress.keywords import KeywordRegistry, keyword_key
+
+
+class TestKeywordKey(SimpleTestCase):
+
+    def test_case_and_whitespace_folded(self):
+        self.assertEqual(
+            keyword_key("  Open \n Access "),
+            keyword_key("open access"),
+        )
+
+
+class TestKeywordRegistry(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+        cls.article_one = helpers.create_article(journal=cls.journal_one)
+        cls.article_two = helpers.create_article(journal=cls.journal_one)
+        cls.existing = submission_models.Keyword.objects.create(
+            word="Open Access")
+
+    def test_existing_keyword_reused(self):
+        registry = KeywordRegistry()
+        registry.add_keywords(self.article_one, ["open  access", " "])
+        registry.flush()
+
+        self.assertEqual(
+            list(self.article_one.keywords.all()), [self.existing])
+        self.assertFalse(
+            submission_models.Keyword.objects.filter(
+                word="open  access").exists()
+        )
+
+    def test_new_keywords_shared_across_articles(self):
+        registry = KeywordRegistry()
+        registry.add_keywords(self.article_one, ["Linguistics", "Syntax"])
+        registry.add_keywords(self.article_two, ["linguistics"])
+        registry.flush()
+
+        keyword = submission_models.Keyword.objects.get(word="Linguistics")
+        self.assertIn(keyword, self.article_one.keywords.all())
+        self.assertIn(keyword, self.article_two.keywords.all())
+        self.assertEqual(self.article_one.keywords.count(), 2)
+
+    def test_duplicate_keyword_linked_once(self):
+        registry = KeywordRegistry()
+        registry.add_keywords(self.article_one, ["Syntax", "SYNTAX"])
+        registry.flush()
+        registry.add_keywords(self.article_one, ["syntax"])
+        registry.flush()
+
+        self.assertEqual(self.article_one.keywords.count(), 1)
@@ -0,0 +1,181 @@
+"""
+Test cases for the distributed imports
+"""
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models.query import QuerySet
+from django.test import TestCase
+from django.utils import timezone
+
+from utils.testing import helpers
+
+from plugins.bepress import leases, models, utils
+
+
+class TestWorkUnits(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        for document in ("vol1/iss1/1", "vol1/iss1/2", "vol1/iss10/1"):
+            os.makedirs(os.path.join(self.tmp_dir.name, "dump", document))
+            with open(os.path.join(
+                self.tmp_dir.name, "dump", document, "metadata.xml"), "w",
+            ):
+                pass
+        patcher = mock.patch(
+            "plugins.bepress.leases.BEPRESS_PATH", self.tmp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_register_work_units(self):
+        self.assertEqual(
+            leases.register_work_units(self.journal_one, "dump"), 2)
+        self.assertEqual(
+            leases.register_work_units(self.journal_one, "dump"), 2)
+        self.assertEqual(
+            set(models.WorkUnit.objects.values_list("path", flat=True)),
+            {"vol1/iss1", "vol1/iss10"},
+        )
+
+    def test_unit_documents(self):
+        path = os.path.join(self.tmp_dir.name, "dump")
+        roots = [
+            root for root, _ in utils.iter_metadata_roots(
+                path, unit_path="vol1/iss1")
+        ]
+        self.assertEqual(
+            roots,
+            [os.path.join(path, "vol1/iss1/1"), os.path.join(path, "vol1/iss1/2")],
+        )
+
+    def test_units_leased_once(self):
+        leases.register_work_units(self.journal_one, "dump")
+        first = leases.lease_work_unit(self.journal_one, "dump", "worker-1")
+        second = leases.lease_work_unit(self.journal_one, "dump", "worker-2")
+
+        self.assertNotEqual(first, second)
+        self.assertIsNone(
+            leases.lease_work_unit(self.journal_one, "dump", "worker-3"))
+
+    def test_unit_leased_concurrently(self):
+        leases.register_work_units(self.journal_one, "dump")
+        first = QuerySet.first
+
+        def lease_concurrently(queryset):
+            unit = first(queryset)
+            if unit is not None and unit.status == models.WorkUnit.PENDING:
+                # Another worker leases the unit once it was read
+                models.WorkUnit.objects.filter(pk=unit.pk).update(
+                    status=models.WorkUnit.LEASED,
+                    owner="worker-1",
+                    lease_expires=timezone.now() + timedelta(seconds=60),
+                )
+            return unit
+
+        with mock.patch.object(QuerySet, "first", lease_concurrently):
+            unit = leases.lease_work_unit(self.journal_one, "dump", "worker-2")
+
+        self.assertIsNone(unit)
+        self.assertEqual(
+            set(models.WorkUnit.objects.values_list("owner", flat=True)),
+            {"worker-1"},
+        )
+
+    def test_expired_lease_reclaimed(self):
+        leases.register_work_units(self.journal_one, "dump")
+        first = leases.lease_work_unit(self.journal_one, "dump", "worker-1")
+        leases.lease_work_unit(self.journal_one, "dump", "worker-1")
+        models.WorkUnit.objects.filter(pk=first.pk).update(
+            lease_expires=timezone.now() - timedelta(seconds=1))
+
+        reclaimed = leases.lease_work_unit(
+            self.journal_one, "dump", "worker-2")
+
+        self.assertEqual(reclaimed, first)
+        self.assertEqual(reclaimed.attempts, 2)
+        self.assertFalse(leases.renew_lease(first))
+
+    @mock.patch("plugins.bepress.leases.utils.ImportState")
+    @mock.patch("plugins.bepress.leases.utils.import_archive")
+    def test_run_worker(self, import_archive, import_state):
+        summary = utils.ImportSummary()
+        summary.imported = 2
+        import_archive.return_value = summary
+        leases.register_work_units(self.journal_one, "dump")
+
+        worker_summary = leases.run_worker(
+            self.journal_one, "dump", owner="worker-1", stamped=False,
+            struct="journal",
+        )
+
+        self.assertEqual(worker_summary.imported, 4)
+        self.assertEqual(
+            set(import_archive.call_args_list[0][1]),
+            {
+                "folder", "site", "unit_path", "stamped", "struct", "state",
+                "stop",
+            },
+        )
+        # The indexes of the journal are only built once per worker
+        import_state.assert_called_once_with("dump", self.journal_one)
+        self.assertEqual(
+            {call[1]["state"] for call in import_archive.call_args_list},
+            {import_state.return_value},
+        )
+        self.assertFalse(
+            models.WorkUnit.objects.exclude(
+                status=models.WorkUnit.DONE).exists()
+        )
+
+    @mock.patch("plugins.bepress.leases.utils.ImportState")
+    @mock.patch("plugins.bepress.leases.utils.import_archive")
+    def test_lost_lease_abandons_unit(self, import_archive, import_state):
+        def import_unit(**kwargs):
+            # Another worker reclaims the unit during the import
+            models.WorkUnit.objects.filter(
+                path=kwargs["unit_path"]).update(owner="worker-2")
+            kwargs["stop"].set()
+            return utils.ImportSummary()
+        import_archive.side_effect = import_unit
+        leases.register_work_units(self.journal_one, "dump")
+
+        leases.run_worker(
+            self.journal_one, "dump", owner="worker-1", stamped=False,
+            struct="journal",
+        )
+
+        self.assertFalse(
+            models.WorkUnit.objects.filter(
+                status=models.WorkUnit.DONE).exists()
+        )
+
+    @mock.patch("plugins.bepress.leases.run_worker")
+    @mock.patch("plugins.bepress.leases.register_work_units")
+    def test_unsupported_options(self, register_work_units, run_worker):
+        for mode, options in (
+            ("--register", ["--stamped"]),
+            ("--register", ["--defer-files"]),
+            ("--register", ["--force"]),
+            ("--worker", ["--pipeline"]),
+            ("--worker", ["--parse-workers", "2"]),
+            ("--worker", ["--fetch-workers", "2"]),
+            ("--worker", ["--chunk-size", "100"]),
+            ("--worker", ["--etl"]),
+        ):
+            with self.assertRaises(CommandError):
+                call_command(
+                    "import_bepress_archive", self.journal_one.code, "dump",
+                    "journal", mode, *options,
+                )
+        register_work_units.assert_not_called()
+        run_worker.assert_not_called()
@@ -0,0 +1,125 @@
+"""
+Test cases for the legacy module
+"""
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from utils.testing import helpers
+
+from plugins.bepress import legacy, models
+
+
+class TestLegacyURLIndex(SimpleTestCase):
+
+    def setUp(self):
+        self.index = legacy.LegacyURLIndex()
+        self.first = (legacy.ARTICLE, 1, 1)
+        self.second = (legacy.ARTICLE, 2, 1)
+        self.other_journal = (legacy.ARTICLE, 3, 2)
+        self.index.add(self.first, 1001, "foo/vol3/iss2/5")
+        self.index.add(self.second, 1002, "foo/vol3/iss2/6")
+        self.index.add(self.other_journal, 1002, "bar/vol1/iss1/1")
+        patcher = mock.patch.multiple(
+            self.index,
+            maybe_refresh=mock.DEFAULT,
+            get_url=lambda target: target,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_resolve_viewcontent(self):
+        self.assertEqual(
+            self.index.resolve(
+                "/cgi/viewcontent.cgi", {"article": "1001", "context": "foo"}),
+            self.first,
+        )
+
+    def test_resolve_viewcontent_without_context(self):
+        self.assertEqual(
+            self.index.resolve("/cgi/viewcontent.cgi", {"article": "1001"}),
+            self.first,
+        )
+
+    def test_context_disambiguates_viewcontent(self):
+        self.assertIsNone(
+            self.index.resolve("/cgi/viewcontent.cgi", {"article": "1002"}),
+        )
+        self.assertEqual(
+            self.index.resolve(
+                "/cgi/viewcontent.cgi", {"article": "1002", "context": "bar"}),
+            self.other_journal,
+        )
+
+    def test_resolve_path(self):
+        self.assertEqual(
+            self.index.resolve("/foo/vol3/iss2/6/"),
+            self.second,
+        )
+
+    def test_resolve_path_without_context(self):
+        self.assertEqual(self.index.resolve("/vol3/iss2/5"), self.first)
+
+    def test_unknown_url(self):
+        self.assertIsNone(self.index.resolve("/foo/vol9/iss9/9/"))
+        self.assertIsNone(
+            self.index.resolve("/cgi/viewcontent.cgi", {"article": "abc"}))
+
+
+class TestLoadArticles(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+        cls.article = helpers.create_article(journal=cls.journal_one)
+        cls.other_article = helpers.create_article(journal=cls.journal_two)
+        models.ImportedArticle.objects.create(
+            dump_name="foo", bepress_id=1001, journal=cls.journal_one,
+            article=cls.article, submission_path="foo/vol1/iss1/1",
+        )
+        models.ImportedArticle.objects.create(
+            dump_name="bar", bepress_id=1001, journal=cls.journal_two,
+            article=cls.other_article, submission_path="bar/vol1/iss1/1",
+        )
+
+    def test_scoped_to_journal(self):
+        index = legacy.LegacyURLIndex(self.journal_one.pk)
+        index._load_articles()
+
+        self.assertEqual(
+            index.by_id[1001],
+            (legacy.ARTICLE, self.article.pk, self.journal_one.pk),
+        )
+        self.assertNotIn("bar/vol1/iss1/1", index.by_path)
+        self.assertEqual(index.journals, {self.journal_one.pk: self.journal_one})
+
+    def test_without_journal(self):
+        index = legacy.LegacyURLIndex()
+        index._load_articles()
+
+        self.assertIs(index.by_id[1001], legacy.AMBIGUOUS)
+        self.assertEqual(
+            index.by_context_id[("bar", 1001)],
+            (legacy.ARTICLE, self.other_article.pk, self.journal_two.pk),
+        )
+
+    def test_pending_articles(self):
+        imported = models.ImportedArticle.objects.create(
+            dump_name="foo", bepress_id=1002, journal=self.journal_one,
+            submission_path="foo/vol1/iss1/2",
+        )
+        index = legacy.LegacyURLIndex(self.journal_one.pk)
+        index._load_articles()
+        self.assertEqual(index.pending, {imported.pk})
+        self.assertNotIn(1002, index.by_id)
+
+        article = helpers.create_article(journal=self.journal_one)
+        imported.article = article
+        imported.save()
+        index._load_articles()
+
+        self.assertEqual(index.pending, set())
+        self.assertEqual(
+            index.by_path["foo/vol1/iss1/2"],
+            (legacy.ARTICLE, article.pk, self.journal_one.pk),
+        )
@@ -0,0 +1,66 @@
+"""
+Test cases for the memory module
+"""
+import os
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from plugins.bepress import memory, utils
+
+
+class TestMemoryMonitor(SimpleTestCase):
+
+    @mock.patch("plugins.bepress.memory.current_rss")
+    def test_reports_peak_per_window(self, current_rss):
+        current_rss.side_effect = [10, 30, 20, 5, 15]
+        monitor = memory.MemoryMonitor(report_every=2)
+        for _ in range(5):
+            monitor.record()
+        self.assertEqual(monitor.finish(), [(2, 30), (4, 20), (5, 15)])
+
+    @mock.patch("plugins.bepress.memory.current_rss")
+    def test_over_ceiling(self, current_rss):
+        current_rss.return_value = 200 * memory.MB
+        monitor = memory.MemoryMonitor(rss_ceiling=100)
+        self.assertFalse(monitor.over_ceiling())
+        monitor.record()
+        self.assertTrue(monitor.over_ceiling())
+
+    def test_no_ceiling(self):
+        monitor = memory.MemoryMonitor()
+        monitor.record()
+        self.assertFalse(monitor.over_ceiling())
+
+
+class TestImportSummary(SimpleTestCase):
+
+    def test_merge_offsets_memory_reports(self):
+        first = utils.ImportSummary()
+        first.imported = 3
+        first.memory_reports = [(3, 100)]
+        first.resume_from = "/path/vol1/iss2/4"
+        second = utils.ImportSummary()
+        second.imported = 2
+        second.failed = 1
+        second.memory_reports = [(3, 50)]
+
+        first.merge(second)
+
+        self.assertEqual(first.imported, 5)
+        self.assertEqual(first.failed, 1)
+        self.assertEqual(first.memory_reports, [(3, 100), (6, 50)])
+        self.assertIsNone(first.resume_from)
+
+
+def exit_without_summary(resume_from=None):
+    os._exit(1)
+
+
+class TestRunRecycled(SimpleTestCase):
+
+    @mock.patch("plugins.bepress.memory.RESULT_POLL_INTERVAL", 0.1)
+    @mock.patch("plugins.bepress.memory.connections")
+    def test_worker_killed(self, connections):
+        with self.assertRaises(memory.WorkerExited):
+            memory.run_recycled(exit_without_summary)
@@ -0,0 +1,61 @@
+"""
+Test cases for the notes module
+"""
+from django.test import TestCase
+
+from submission import models as submission_models
+from utils.testing import helpers
+
+from plugins.bepress import models
+from plugins.bepress.notes import NoteRegistry
+
+
+class TestNoteRegistry(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+        cls.article_one = helpers.create_article(journal=cls.journal_one)
+        cls.article_two = helpers.create_article(journal=cls.journal_one)
+
+    def test_publisher_notes_are_shared(self):
+        registry = NoteRegistry()
+        registry.add_publisher_note(self.article_one, "Erratum")
+        registry.add_publisher_note(self.article_two, "Erratum")
+        registry.flush()
+
+        note = submission_models.PublisherNote.objects.get(text="Erratum")
+        self.assertIn(note, self.article_one.publisher_notes.all())
+        self.assertIn(note, self.article_two.publisher_notes.all())
+
+    def test_publisher_notes_deduplicated_across_imports(self):
+        registry = NoteRegistry()
+        registry.add_publisher_note(self.article_one, "Erratum")
+        registry.flush()
+        registry = NoteRegistry()
+        registry.add_publisher_note(self.article_two, "Erratum")
+        registry.flush()
+
+        self.assertEqual(
+            submission_models.PublisherNote.objects.filter(
+                text="Erratum").count(),
+            1,
+        )
+        self.assertEqual(models.ImportedNote.objects.count(), 1)
+
+    def test_notes_deduplicated_per_article(self):
+        registry = NoteRegistry()
+        registry.add_note(self.article_one, "Private note")
+        registry.add_note(self.article_one, "Private note")
+        registry.add_note(self.article_two, "Private note")
+        registry.flush()
+        registry = NoteRegistry()
+        registry.add_note(self.article_one, "Private note")
+        registry.flush()
+
+        self.assertEqual(
+            submission_models.Note.objects.filter(
+                text="Private note").count(),
+            2,
+        )
+
@@ -0,0 +1,183 @@
+"""
+Test cases for the retrieval of documents from an OAI feed
+"""
+import io
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from plugins.bepress import oai
+
+
+def make_response(content):
+    response = mock.Mock(status_code=200, content=content.encode())
+    response.raise_for_status.return_value = None
+    return response
+
+
+def make_stream(content):
+    raw = mock.Mock(read=io.BytesIO(content.encode()).read)
+    return mock.Mock(raw=raw)
+
+
+class TestFetchRecords(SimpleTestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.bepress_path = tmp_dir.name
+        patch = mock.patch.object(oai, "BEPRESS_PATH", self.bepress_path)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    @mock.patch("plugins.bepress.http_client.get")
+    def test_fetch_records(self, get):
+        def respond(url, params):
+            if params["identifier"] == "oai:example:journal-1":
+                return make_response(GET_RECORD)
+            return make_response(ID_DOES_NOT_EXIST)
+        get.side_effect = respond
+
+        summary = oai.fetch_records(
+            "https://example.com/do/oai/",
+            ["oai:example:journal-1", "oai:example:missing"],
+            workers=2,
+        )
+
+        self.assertEqual(summary.written, 1)
+        self.assertEqual(len(summary.failed), 1)
+        self.assertEqual(summary.failed[0][0], "oai:example:missing")
+        self.assertIn("idDoesNotExist", summary.failed[0][1])
+        self.assertTrue(os.path.exists(os.path.join(
+            self.bepress_path, "journal", "vol1", "iss1", "1", "metadata.xml",
+        )))
+        self.assertEqual(get.call_args_list[0].kwargs["params"], {
+            "verb": "GetRecord",
+            "metadataPrefix": oai.METADATA_PREFIX,
+            "identifier": "oai:example:journal-1",
+        })
+
+    @mock.patch.object(oai, "fetch_records")
+    def test_import_from_oai_by_identifier(self, fetch_records):
+        client = mock.Mock(endpoint="https://example.com/do/oai/")
+
+        oai.import_from_oai(client, identifiers=["oai:example:journal-1"])
+
+        fetch_records.assert_called_once_with(
+            "https://example.com/do/oai/", ["oai:example:journal-1"],
+            oai.RECORD_WORKERS,
+        )
+        client.ListRecords.assert_not_called()
+
+
+class TestListRecords(SimpleTestCase):
+
+    def test_iter_page(self):
+        page = oai.iter_page(io.BytesIO(LIST_RECORDS_PAGE.encode()))
+
+        identifier, documents = next(page)
+        record = documents.getparent().getparent()
+        self.assertEqual(identifier, "oai:example:journal-1")
+        self.assertEqual(
+            documents.findtext(".//submission-path"), "journal/vol1/iss1/1")
+
+        identifier, documents = next(page)
+        self.assertEqual(identifier, "oai:example:journal-2")
+        self.assertIsNone(documents)
+        # Processed records are freed
+        self.assertEqual(len(record), 0)
+
+        with self.assertRaises(StopIteration) as stop:
+            next(page)
+        self.assertEqual(stop.exception.value, "page-2")
+        self.assertIsNone(record.getparent())
+
+    def test_error(self):
+        with self.assertRaises(oai.OAIError):
+            list(oai.iter_page(io.BytesIO(BAD_ARGUMENT.encode())))
+
+    @mock.patch("plugins.bepress.http_client.get")
+    def test_list_records_follows_resumption_token(self, get):
+        last_page = LIST_RECORDS_PAGE.replace(
+            '<resumptionToken cursor="0">page-2</resumptionToken>', "")
+        get.side_effect = [
+            make_stream(LIST_RECORDS_PAGE), make_stream(last_page),
+        ]
+
+        identifiers = [
+            identifier for identifier, _ in oai.list_records(
+                "https://example.com/do/oai/", set_="publication:journal")
+        ]
+
+        self.assertEqual(len(identifiers), 4)
+        self.assertEqual(
+            [call.kwargs["params"] for call in get.call_args_list],
+            [
+                {
+                    "verb": "ListRecords",
+                    "metadataPrefix": oai.METADATA_PREFIX,
+                    "set": "publication:journal",
+                },
+                {"verb": "ListRecords", "resumptionToken": "page-2"},
+            ],
+        )
+
+
+GET_RECORD = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <GetRecord>
+    <record>
+      <header>
+        <identifier>oai:example:journal-1</identifier>
+      </header>
+      <metadata>
+        <documents xmlns="">
+          <document>
+            <title>A title</title>
+            <submission-path>journal/vol1/iss1/1</submission-path>
+          </document>
+        </documents>
+      </metadata>
+    </record>
+  </GetRecord>
+</OAI-PMH>
+"""
+
+ID_DOES_NOT_EXIST = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <error code="idDoesNotExist">No matching identifier</error>
+</OAI-PMH>
+"""
+
+LIST_RECORDS_PAGE = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <ListRecords>
+    <record>
+      <header>
+        <identifier>oai:example:journal-1</identifier>
+      </header>
+      <metadata>
+        <documents xmlns="">
+          <document>
+            <submission-path>journal/vol1/iss1/1</submission-path>
+          </document>
+        </documents>
+      </metadata>
+    </record>
+    <record>
+      <header status="deleted">
+        <identifier>oai:example:journal-2</identifier>
+      </header>
+    </record>
+    <resumptionToken cursor="0">page-2</resumptionToken>
+  </ListRecords>
+</OAI-PMH>
+"""
+
+BAD_ARGUMENT = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <error code="badArgument">Illegal set</error>
+</OAI-PMH>
+"""
@@ -0,0 +1,119 @@
+"""
+Test cases for the import pipeline
+"""
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from plugins.bepress.pipeline import DocumentTracker, Pipeline, Stage
+
+
+class TestPipeline(SimpleTestCase):
+
+    def test_items_flow_through_stages(self):
+        results = []
+        lock = threading.Lock()
+
+        def double(item, emit):
+            emit(item * 2)
+
+        def collect(item, emit):
+            with lock:
+                results.append(item)
+
+        Pipeline([
+            Stage("double", double, workers=3),
+            Stage("collect", collect),
+        ], queue_size=2).run(range(20))
+
+        self.assertEqual(sorted(results), [i * 2 for i in range(20)])
+
+    def test_failed_items_are_counted(self):
+        def fail_odd(item, emit):
+            if item % 2:
+                raise ValueError(item)
+            emit(item)
+
+        collected = []
+        stages = [
+            Stage("fail_odd", fail_odd, workers=2),
+            Stage("collect", lambda item, emit: collected.append(item)),
+        ]
+        Pipeline(stages).run(range(10))
+
+        self.assertEqual(stages[0].items, 10)
+        self.assertEqual(stages[0].failed, 5)
+        self.assertEqual(sorted(collected), [0, 2, 4, 6, 8])
+
+    def test_on_done_runs_once_after_all_items(self):
+        seen = []
+        flushed = []
+
+        def on_done(emit):
+            flushed.append(len(seen))
+            emit("flushed")
+
+        collected = []
+        Pipeline([
+            Stage("seen", lambda item, emit: seen.append(item),
+                  workers=4, on_done=on_done),
+            Stage("collect", lambda item, emit: collected.append(item)),
+        ]).run(range(8))
+
+        self.assertEqual(flushed, [8])
+        self.assertEqual(collected, ["flushed"])
+
+
+class TestDocumentTracker(SimpleTestCase):
+
+    def setUp(self):
+        self.failure_log = mock.Mock()
+        self.content_hashes = mock.Mock()
+        self.tracker = DocumentTracker(self.failure_log, self.content_hashes)
+
+    def test_resolved_once_files_are_attached(self):
+        self.tracker.persist_done("/vol1/iss1/1")
+        self.tracker.add_file("/vol1/iss1/1")
+        self.tracker.add_file("/vol1/iss1/1")
+        self.tracker.flush_done("/vol1/iss1/1")
+        self.tracker.file_done("/vol1/iss1/1")
+        self.failure_log.resolve.assert_not_called()
+
+        self.tracker.file_done("/vol1/iss1/1")
+
+        self.failure_log.resolve.assert_called_once_with("/vol1/iss1/1")
+        self.assertEqual(self.tracker.imported, 1)
+
+    def test_failed_files(self):
+        error = ValueError("Error fetching galley")
+        self.tracker.persist_done("/vol1/iss1/1")
+        self.tracker.add_file("/vol1/iss1/1")
+        self.tracker.add_file("/vol1/iss1/1")
+        self.tracker.flush_done("/vol1/iss1/1")
+        for _ in range(2):
+            self.tracker.fail("/vol1/iss1/1", "fetch", error)
+            self.tracker.file_done("/vol1/iss1/1")
+
+        self.failure_log.record.assert_called_once_with(
+            "/vol1/iss1/1", "fetch", error)
+        self.failure_log.resolve.assert_not_called()
+        self.assertEqual(self.tracker.imported, 0)
+        self.assertEqual(self.tracker.failed, {"/vol1/iss1/1"})
+
+    def test_stamped_once_imported(self):
+        self.tracker.persist_done("/vol1/iss1/1", 1, "abc")
+        self.tracker.add_file("/vol1/iss1/1")
+        self.tracker.flush_done("/vol1/iss1/1")
+        self.content_hashes.stamp.assert_not_called()
+
+        self.tracker.file_done("/vol1/iss1/1")
+
+        self.content_hashes.stamp.assert_called_once_with(1, "abc")
+
+    def test_failed_documents_not_stamped(self):
+        self.tracker.persist_done("/vol1/iss1/1", 1, "abc")
+        self.tracker.fail("/vol1/iss1/1", "flush", ValueError("Error"))
+        self.tracker.flush_done("/vol1/iss1/1")
+
+        self.content_hashes.stamp.assert_not_called()
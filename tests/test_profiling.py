@@ -0,0 +1,87 @@
+"""
+Test cases for the profiling of imports
+"""
+import os
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase
+
+from utils.testing import helpers
+
+from plugins.bepress import profiling
+
+
+class TestImportProfiler(SimpleTestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.output_dir = tmp_dir.name
+
+    def test_samples_items(self):
+        profiler = profiling.ImportProfiler(self.output_dir, sample_every=2)
+
+        sampled = []
+        for _ in range(4):
+            sampled.append(profiler.start_item())
+            with profiler.stage("parse"):
+                pass
+
+        self.assertEqual(sampled, [True, False, True, False])
+        self.assertEqual(list(profiler.profiles), ["parse"])
+
+    def test_nested_stages_are_accounted_to_the_outermost(self):
+        profiler = profiling.ImportProfiler(self.output_dir)
+
+        profiler.start_item()
+        with profiler.stage("import"):
+            with profiler.stage("files"):
+                pass
+
+        self.assertEqual(list(profiler.profiles), ["import"])
+
+    def test_dump(self):
+        profiler = profiling.ImportProfiler(self.output_dir)
+        profiler.start_item()
+        with profiler.stage("parse"):
+            sorted(range(100))
+
+        profiler.dump()
+
+        self.assertEqual(
+            sorted(os.listdir(self.output_dir)),
+            ["parse.collapsed", "parse.pstats"],
+        )
+
+    @mock.patch("plugins.bepress.profiling.tracemalloc")
+    def test_snapshot_once_per_item(self, tracemalloc):
+        profiler = profiling.ImportProfiler(self.output_dir, trace_memory=True)
+
+        for _ in range(2):
+            profiler.start_item()
+            for stage in ("parse", "import", "files"):
+                with profiler.stage(stage):
+                    pass
+        profiler.dump()
+
+        self.assertEqual(tracemalloc.take_snapshot.call_count, 2)
+        tracemalloc.take_snapshot.return_value.dump.assert_called_once_with(
+            os.path.join(self.output_dir, "memory.tracemalloc"))
+
+
+class TestProfileOptions(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal, _ = helpers.create_journals()
+
+    def test_unsupported_engines(self):
+        for engine in (["--etl"], ["--pipeline"], ["--max-rss", "500"]):
+            with self.assertRaises(CommandError):
+                call_command(
+                    "import_bepress_archive", self.journal.code, "dump",
+                    "journal", *engine, "--profile", "/tmp/profile",
+                )
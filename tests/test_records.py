@@ -0,0 +1,144 @@
+"""
+Test cases for the cache of article records
+"""
+import os
+import tempfile
+from unittest import mock
+
+from bs4 import BeautifulSoup
+from django.test import SimpleTestCase
+
+from plugins.bepress import records
+
+
+class TestExtractRecord(SimpleTestCase):
+
+    def test_extract_record(self):
+        record = records.extract_record(BeautifulSoup(XML_DATA, "lxml"))
+
+        self.assertEqual(record["articleid"], "1001")
+        self.assertEqual(record["title"], "A title")
+        self.assertEqual(record["publication_date"], "2020-01-01T00:00:00-08:00")
+        self.assertIsNone(record["submission_date"])
+        self.assertEqual(record["fulltext_url"], "")
+        self.assertEqual(
+            record["fields"],
+            {"doi": "10.1234/abc", "notes": None, "peer_reviewed": "true"},
+        )
+        self.assertEqual(record["keywords"], ["open; access"])
+        self.assertEqual(len(record["authors"]), 2)
+        self.assertEqual(record["authors"][0]["fname"], "Ada")
+        self.assertIsNone(record["authors"][0]["organization"])
+        self.assertEqual(record["authors"][1]["organization"], "ACME")
+        self.assertEqual(record["supplemental_files"], [{
+            "url": "https://example.com/data.csv",
+            "mime_type": "text/csv",
+            "description": None,
+        }])
+
+
+class TestRecordCache(SimpleTestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache_dir = os.path.join(tmp_dir.name, "records")
+        self.metadata_path = os.path.join(tmp_dir.name, "metadata.xml")
+        with open(self.metadata_path, "w") as metadata_file:
+            metadata_file.write(XML_DATA)
+
+    def test_cached_record_is_not_parsed(self):
+        records.RecordCache(self.cache_dir).load(self.metadata_path)
+
+        cache = records.RecordCache(self.cache_dir)
+        with mock.patch.object(records, "BeautifulSoup") as soup_mock:
+            record = cache.load(self.metadata_path)
+
+        soup_mock.assert_not_called()
+        self.assertEqual(record["title"], "A title")
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_changed_document_is_parsed(self):
+        records.RecordCache(self.cache_dir).load(self.metadata_path)
+        with open(self.metadata_path, "w") as metadata_file:
+            metadata_file.write(XML_DATA.replace("A title", "New title"))
+
+        cache = records.RecordCache(self.cache_dir)
+        record = cache.load(self.metadata_path)
+
+        self.assertEqual(record["title"], "New title")
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    def test_parser_upgrade_invalidates_records(self):
+        records.RecordCache(self.cache_dir).load(self.metadata_path)
+
+        with mock.patch.object(records, "PARSER_VERSION", "upgraded"):
+            cache = records.RecordCache(self.cache_dir)
+            cache.prune()
+            cache.load(self.metadata_path)
+
+        self.assertEqual(os.listdir(self.cache_dir), ["upgraded"])
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    def test_unreadable_record_is_parsed(self):
+        cache = records.RecordCache(self.cache_dir)
+        cache.load(self.metadata_path)
+        for root, _, files_ in os.walk(self.cache_dir):
+            for filename in files_:
+                with open(os.path.join(root, filename), "wb") as record_file:
+                    record_file.write(b"corrupt")
+
+        record = cache.load(self.metadata_path)
+
+        self.assertEqual(record["title"], "A title")
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def test_disabled_cache(self):
+        cache = records.RecordCache(None)
+        cache.load(self.metadata_path)
+        cache.load(self.metadata_path)
+
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+
+XML_DATA = """
+<documents>
+  <document>
+    <title>A title</title>
+    <publication-date>2020-01-01T00:00:00-08:00</publication-date>
+    <articleid>1001</articleid>
+    <fulltext-url></fulltext-url>
+    <keywords>
+      <keyword>open; access</keyword>
+    </keywords>
+    <authors>
+      <author>
+        <email>ada@example.com</email>
+        <institution>Birkbeck</institution>
+        <lname>Lovelace</lname>
+        <fname>Ada</fname>
+      </author>
+      <author>
+        <organization>ACME</organization>
+      </author>
+    </authors>
+    <supplemental-files>
+      <file>
+        <url>https://example.com/data.csv</url>
+        <mime-type>text/csv</mime-type>
+      </file>
+    </supplemental-files>
+    <fields>
+      <field name="doi" type="string">
+        <value>10.1234/abc</value>
+      </field>
+      <field name="notes" type="string">
+      </field>
+      <field name="peer_reviewed" type="boolean">
+        <value>true</value>
+      </field>
+    </fields>
+  </document>
+</documents>
+"""
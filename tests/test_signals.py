@@ -0,0 +1,55 @@
+"""
+Test cases for the deferral of model signals
+"""
+from django.db.models.signals import post_save
+from django.test import TestCase
+
+from submission import models as submission_models
+from utils.testing import helpers
+
+from plugins.bepress.signals import DeferredSignals
+
+
+class TestDeferredSignals(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journal_one, cls.journal_two = helpers.create_journals()
+
+    def setUp(self):
+        self.received = []
+        post_save.connect(
+            self.receiver, sender=submission_models.Article,
+            dispatch_uid="test_deferred_signals",
+        )
+        self.addCleanup(
+            post_save.disconnect, sender=submission_models.Article,
+            dispatch_uid="test_deferred_signals",
+        )
+
+    def receiver(self, sender, instance, created, **kwargs):
+        self.received.append((instance.pk, created))
+
+    def test_signals_replayed_once_per_object(self):
+        with DeferredSignals(["submission.Article"]) as deferred:
+            article = helpers.create_article(journal=self.journal_one)
+            article.title = "Deferred"
+            article.save()
+            article.save()
+            self.assertEqual(self.received, [])
+
+        self.assertEqual(self.received, [(article.pk, True)])
+        self.assertGreaterEqual(deferred.deferred, 3)
+        self.assertEqual(deferred.replayed, 1)
+
+    def test_other_senders_not_deferred(self):
+        with DeferredSignals(["journal.Issue"]):
+            article = helpers.create_article(journal=self.journal_one)
+            self.assertIn((article.pk, True), self.received)
+
+    def test_signals_restored(self):
+        with DeferredSignals(["submission.Article"]):
+            pass
+        article = helpers.create_article(journal=self.journal_one)
+
+        self.assertIn((article.pk, True), self.received)
@@ -0,0 +1,98 @@
+"""
+Test cases for the watch-folder import
+"""
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from plugins.bepress import watch
+
+
+class TestDebouncer(SimpleTestCase):
+
+    def test_keys_settle_after_delay(self):
+        debouncer = watch.Debouncer(delay=2)
+        debouncer.add("a", now=0)
+        debouncer.add("b", now=1)
+        debouncer.add("a", now=1.5)
+
+        self.assertEqual(debouncer.pop_settled(now=3), ["b"])
+        self.assertEqual(debouncer.next_timeout(10, now=3), 0.5)
+        self.assertEqual(debouncer.pop_settled(now=3.5), ["a"])
+        self.assertEqual(debouncer.next_timeout(10, now=3.5), 10)
+
+
+class TestGetDocumentKey(SimpleTestCase):
+
+    def test_document_file(self):
+        self.assertEqual(
+            watch.get_document_key("/exports/dump/vol1/iss1/1/metadata.xml",
+                                   "/exports"),
+            ("dump", "/exports/dump/vol1/iss1/1"),
+        )
+
+    def test_archive_file(self):
+        self.assertEqual(
+            watch.get_document_key("/exports/dump.zip", "/exports"),
+            ("dump.zip", None),
+        )
+
+    def test_ignored_files(self):
+        for path in (
+            "/exports/notes.txt",
+            "/exports/.records/ab/abcd",
+            "/elsewhere/dump/1/metadata.xml",
+        ):
+            self.assertIsNone(watch.get_document_key(path, "/exports"))
+
+
+class TestPollingWatcher(SimpleTestCase):
+
+    def test_changed_files(self):
+        with tempfile.TemporaryDirectory() as path:
+            unchanged = os.path.join(path, "unchanged.xml")
+            changed = os.path.join(path, "changed.xml")
+            for file_path in (unchanged, changed):
+                with open(file_path, "w") as f:
+                    f.write("<documents/>")
+            watcher = watch.PollingWatcher(path, interval=0)
+            with open(changed, "a") as f:
+                f.write("\n")
+            created = os.path.join(path, "created.xml")
+            with open(created, "w") as f:
+                f.write("<documents/>")
+
+            self.assertEqual(
+                sorted(watcher.read_changes(0)), [changed, created])
+            self.assertEqual(watcher.read_changes(0), [])
+
+
+class TestFolderWatcher(SimpleTestCase):
+
+    @mock.patch("plugins.bepress.utils.import_archive")
+    def test_import_settled_documents(self, import_archive):
+        with tempfile.TemporaryDirectory() as path:
+            root = os.path.join(path, "dump", "vol1", "iss1", "1")
+            os.makedirs(root)
+            for filename in ("metadata.xml", "fulltext.pdf"):
+                with open(os.path.join(root, filename), "w"):
+                    pass
+            incomplete = os.path.join(path, "dump", "vol1", "iss1", "2")
+            os.makedirs(incomplete)
+
+            watcher = watch.FolderWatcher({"stamped": False}, path=path)
+            watcher.import_documents([
+                ("dump", root),
+                ("dump", incomplete),
+                ("other.zip", None),
+            ])
+
+        import_archive.assert_has_calls([
+            mock.call(
+                stamped=False, folder="dump",
+                documents=[(root, ["fulltext.pdf", "metadata.xml"])],
+            ),
+            mock.call(stamped=False, folder="other.zip"),
+        ], any_order=True)
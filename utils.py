@@ -1,5 +1,5 @@
-import cgi
-import dateutil
+import email.message
+import email.utils
 import hashlib
 import logging
 import os
@@ -7,15 +7,17 @@ from urllib.parse import urlsplit
 from uuid import uuid4
 
 from bs4 import BeautifulSoup
+from django import db
 from django.conf import settings
-from django.core.files import File as DjangoFile
-from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadedfile import (
+    SimpleUploadedFile,
+    TemporaryUploadedFile,
+)
 from django.core.validators import URLValidator
 from django.db.utils import OperationalError
 from django.template.loader import get_template
 from django.utils import timezone
-import requests
-from requests.exceptions import SSLError
+from requests.exceptions import HTTPError, SSLError
 
 from core import files
 from core.models import Account, Galley, SupplementaryFile
@@ -25,8 +27,23 @@ from submission import models as submission_models
 from journal import models as journal_models
 from utils.logger import get_logger
 
+from plugins.bepress import archives
 from plugins.bepress import const
+from plugins.bepress import failures
+from plugins.bepress import http_client
+from plugins.bepress import identity
+from plugins.bepress import ingest
+from plugins.bepress import issues
+from plugins.bepress import memory
 from plugins.bepress import models
+from plugins.bepress import profiling
+from plugins.bepress import records
+from plugins.bepress import signals
+from plugins.bepress.batch import ImportBatch
+from plugins.bepress.custom_fields import CustomFieldMapping
+from plugins.bepress.dates import parse_bepress_date
+from plugins.bepress.keywords import KeywordRegistry, clean_keyword
+from plugins.bepress.notes import NoteRegistry
 from plugins.bepress.plugin_settings import BEPRESS_PATH
 try:
     from plugins.books import models as book_models
@@ -40,31 +57,63 @@ SECTION_FIELDS = ["track"]
 
 URL_VALIDATOR = URLValidator()
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Number of articles covered by each peak memory report
+MEMORY_REPORT_EVERY = getattr(settings, "BEPRESS_MEMORY_REPORT_EVERY", 100)
+# Database connections are closed (and reopened on demand) every N articles
+RECYCLE_CONNECTIONS_EVERY = getattr(
+    settings, "BEPRESS_RECYCLE_CONNECTIONS_EVERY", 500)
+
 
 class FakeRequest():
     user = None
 
 
 def get_bepress_import_folders():
+    """ Lists the exports under BEPRESS_PATH, as directories or archives"""
     if os.path.exists(BEPRESS_PATH):
-        return os.listdir(BEPRESS_PATH)
+        return sorted(
+            name for name in os.listdir(BEPRESS_PATH)
+            # Skips hidden directories such as the record cache
+            if not name.startswith(".")
+            and (
+                os.path.isdir(os.path.join(BEPRESS_PATH, name))
+                or archives.is_archive(name)
+            )
+        )
     else:
         return []
 
 
 def soup_metadata(metadata_path):
     logger.info('Souping article %s' % metadata_path)
-    metadata_content = open(metadata_path).read()
+    with archives.open_local(metadata_path) as metadata_file:
+        metadata_content = metadata_file.read()
     return BeautifulSoup(metadata_content, "lxml")
 
 
-def create_article_record(dump_name, soup, journal, default_section, section_key):
-    imported_article, created = models.ImportedArticle.objects.get_or_create(
-        dump_name=dump_name,
-        bepress_id=soup.articleid.string,
-        journal=journal,
+def create_article_record(
+    dump_name, record, journal, default_section, section_key,
+    imported_articles=None, batch=None, identities=None,
+):
+    """ Creates or updates the article described by the given metadata
+    :param record: The article metadata (See records.extract_record)
+    :param imported_articles: An optional dict of the dump's ImportedArticle
+        records by bepress id (See preload_imported_articles)
+    :param batch: An optional batch.ImportBatch deferring bulk writes
+    :param identities: An optional identity.IdentityIndex, used to update
+        the article imported from another dump or source in place
+    """
+    imported_article, created = get_imported_article(
+        dump_name, int(record["articleid"]), journal, imported_articles,
     )
-    if created or not imported_article.article:
+    if not imported_article.article and identities is not None:
+        article_id = identities.find(record)
+        if article_id is not None:
+            imported_article.article = submission_models.Article.objects.get(
+                pk=article_id)
+    if not imported_article.article:
         article = submission_models.Article(is_import=True)
         logger.info(
             "Importing new article with bepress id %s"
@@ -77,125 +126,197 @@ def create_article_record(dump_name, soup, journal, default_section, section_key
             "" % (article.pk, imported_article.bepress_id)
         )
 
-    article.title = soup.title.string
+    article.title = record["title"]
     article.journal = journal
-    article.abstract = str(soup.abstract.string) if soup.abstract else ''
-    date_string = getattr(soup, 'publication-date').string
+    article.abstract = record["abstract"] or ''
+    date_string = record["publication_date"]
     article.date_published = parse_bepress_date(date_string) or timezone.now()
 
-    if getattr(soup, 'submission-date'):
-        submission_date = getattr(soup, 'submission-date').string
-        try:
-            article.date_submitted = dateutil.parser.parse(submission_date)
-        except Exception as e:
-            logger.warning("Unable to parse sub datetime %s, trying to extract date...", date_published)
-            date_submitted, *_ = date_submitted.split("T")
-            article.date_submitted  = dateutil.parser.parse(date_submitted)
+    submission_date = record["submission_date"]
+    if submission_date is not None:
+        article.date_submitted = (
+            parse_bepress_date(submission_date)
+            or article.date_published
+        )
     else:
         article.date_submitted = article.date_published
     article.stage = submission_models.STAGE_PUBLISHED
-    metadata_section(soup, article, default_section, section_key)
+    metadata_section(record, article, default_section, section_key)
 
     article.save()
 
-    metadata_doi(soup, article)
-    metadata_keywords(soup, article)
-    metadata_authors(soup, article)
-    metadata_license(soup, article)
-    metadata_citation(soup, article)
-    metadata_pages(soup, article)
-    metadata_competing_interests(soup, article)
-    metadata_notes(soup, article)
-    metadata_publisher_notes(soup, article)
-    metadata_publisher_name(soup, article)
-    metadata_peer_reviewed(soup, article)
+    metadata_doi(record, article)
+    metadata_keywords(record, article, batch.keywords if batch else None)
+    metadata_authors(record, article)
+    metadata_license(record, article)
+    metadata_citation(record, article)
+    metadata_pages(record, article)
+    metadata_competing_interests(record, article)
+    notes = batch.notes if batch else None
+    metadata_notes(record, article, notes)
+    metadata_publisher_notes(record, article, notes)
+    metadata_publisher_name(record, article)
+    metadata_peer_reviewed(record, article)
     article.save()
 
     imported_article.article = article
+    submission_path = record["submission_path"]
+    if submission_path:
+        imported_article.submission_path = submission_path.strip("/")
     imported_article.save()
+    if identities is not None:
+        identities.add(record, article.pk)
 
     return article
 
 
-def metadata_doi(soup, article):
-    field = soup.fields.find(attrs={"name": "doi"})
-    if field and field.value:
+def preload_imported_articles(dump_name, journal):
+    """ Fetches all the ImportedArticle records of a dump in a single query
+    :param dump_name: The name of the bepress dump
+    :param journal: The journal.Journal receiving the import
+    :return: A dict of bepress id -> ImportedArticle
+    """
+    imported_articles = models.ImportedArticle.objects.filter(
+        dump_name=dump_name,
+        journal=journal,
+    ).select_related("article")
+    return {imported.bepress_id: imported for imported in imported_articles}
+
+
+def get_imported_article(dump_name, bepress_id, journal, imported_articles=None):
+    """ Gets or creates the ImportedArticle for the given bepress id
+    :param imported_articles: An optional dict of preloaded records which is
+        used instead of querying the database and updated with new records
+    :return: A tuple of the ImportedArticle and whether it was created
+    """
+    if imported_articles is None:
+        return models.ImportedArticle.objects.get_or_create(
+            dump_name=dump_name,
+            bepress_id=bepress_id,
+            journal=journal,
+        )
+    created = False
+    if bepress_id not in imported_articles:
+        imported_articles[bepress_id] = models.ImportedArticle.objects.create(
+            dump_name=dump_name,
+            bepress_id=bepress_id,
+            journal=journal,
+        )
+        created = True
+    return imported_articles[bepress_id], created
+
+
+def metadata_doi(record, article):
+    doi = record["fields"].get("doi")
+    if doi is not None:
         Identifier.objects.get_or_create(
             id_type="doi",
             article=article,
-            identifier=field.value.string
+            identifier=doi
         )
 
 
-def metadata_keywords(soup, article):
-    for keyword_str in soup.find_all("keyword"):
+def metadata_keywords(record, article, keywords=None):
+    """ Imports the keywords of an article
+    :param keywords: An optional keywords.KeywordRegistry queueing the
+        keywords to be linked in bulk
+    """
+    words = []
+    for keyword_str in record["keywords"]:
         # Looks like in an older implementation of bepress keywords were an
         # unparsed string of words separated by a semi-colon
-        keywords = keyword_str.string.split(";")
-        for keyword in keywords:
-            try:
-                word, _ = submission_models.Keyword.objects.get_or_create(
-                    word=keyword)
-                article.keywords.add(word)
-            except OperationalError as e:
-                logger.warning("Couldn't add keyword %s: %s" % (keyword, e))
+        words.extend(keyword_str.split(";"))
+    if keywords is not None:
+        keywords.add_keywords(article, words)
+        return
+    for keyword in words:
+        keyword = clean_keyword(keyword)
+        if not keyword:
+            continue
+        try:
+            word = submission_models.Keyword.objects.filter(
+                word__iexact=keyword).order_by("pk").first()
+            if word is None:
+                word = submission_models.Keyword.objects.create(word=keyword)
+            article.keywords.add(word)
+        except OperationalError as e:
+            logger.warning("Couldn't add keyword %s: %s" % (keyword, e))
 
 
-def metadata_competing_interests(soup, article):
+def metadata_competing_interests(record, article):
     """ Imports financial disclosure field as competing interests"""
-    field = soup.fields.find(attrs={"name": "financial_disclosure"})
-    if field and field.value:
-        article.competing_interests = field.value.string
+    value = record["fields"].get("financial_disclosure")
+    if value is not None:
+        article.competing_interests = value
 
 
 
-def metadata_notes(soup, article):
+def metadata_notes(record, article, notes=None):
     """ Imports private editorial comments into the notes system
+    :param notes: An optional notes.NoteRegistry that deduplicates and
+        creates the notes in bulk
     """
-    field = soup.fields.find(attrs={"name": "notes"})
-    if field and field.value:
+    value = record["fields"].get("notes")
+    if value is not None:
+        if notes:
+            notes.add_note(article, value)
+            return
         user = Account.objects.filter(is_superuser=True).first()
         submission_models.Note.objects.get_or_create(
             creator=user,
             article=article,
-            text=field.value.string,
+            text=value,
         )
 
 
-def metadata_publisher_notes(soup, article):
+def get_publisher_notes(record):
+    """ Gets the texts of the publisher notes of an article"""
+    note_texts = []
+    comments = record["fields"].get("comments")
+    if comments is not None:
+        note_texts.append(comments)
+
+    erratum = record["fields"].get("erratum")
+    if erratum is not None:
+        note_texts.append("<h3>Erratum</h3>%s" % erratum)
+    return note_texts
+
+
+def metadata_publisher_notes(record, article, notes=None):
     """ Imports comments, erratum and retraction as publisher notes
+    :param notes: An optional notes.NoteRegistry that deduplicates and
+        creates the notes in bulk
     """
-    user = Account.objects.filter(is_superuser=True).first()
-    comments_field = soup.fields.find(attrs={"name": "comments"})
-    if comments_field and comments_field.value:
-        note, _ = submission_models.PublisherNote.objects.get_or_create(
-            text=comments_field.value.string,
-            creator=user,
-        )
-        article.publisher_notes.add(note)
-
-    erratum = soup.fields.find(attrs={"name": "erratum"})
-    if erratum and erratum.value:
-        erratum_text = "<h3>Erratum</h3>%s" % erratum.value.string
-        erratum_note, _ = submission_models.PublisherNote.objects.get_or_create(
-            text=erratum_text,
-            creator=user,
-        )
-        article.publisher_notes.add(erratum_note)
+    note_texts = get_publisher_notes(record)
+    if notes:
+        for text in note_texts:
+            notes.add_publisher_note(article, text)
+    elif note_texts:
+        user = Account.objects.filter(is_superuser=True).first()
+        for text in note_texts:
+            note, _ = submission_models.PublisherNote.objects.get_or_create(
+                text=text,
+                creator=user,
+            )
+            article.publisher_notes.add(note)
 
 
-def metadata_section(soup, article, default_section, section_key=None):
+def get_section_name(record, section_key=None):
+    """ Gets the name of the section of an article from its metadata
+    :param section_key: The custom field holding the section name, if any,
+        the document type is used otherwise
+    """
     if section_key:
-        field = soup.fields.find(attrs={"name": section_key})
-        soup_section = field.value.string if field else None
-    else:
-        field = getattr(soup, 'document-type').string
-        soup_section = field.string if field else None
+        return record["fields"].get(section_key)
+    return record["document_type"]
 
-    if soup_section:
+
+def metadata_section(record, article, default_section, section_key=None):
+    record_section = get_section_name(record, section_key)
+    if record_section:
         section, c = submission_models.Section.objects \
         .get_or_create(
-            name=soup_section,
+            name=record_section,
             journal=article.journal,
         )
         article.section = section
@@ -206,13 +327,19 @@ def metadata_section(soup, article, default_section, section_key=None):
             '{article} no section found'.format(article=article.title))
 
 
-def metadata_license(soup, article):
-    field = soup.fields.find(attrs={"name": "distribution_license"})
-    if field:
-        license_url = field.value.string
-        if license_url.endswith("/"):
-            license_url = license_url[:-1]
-        license_url = license_url.replace("http:", "https:")
+def get_license_url(record):
+    """ Gets the normalized URL of the license of an article, if any"""
+    license_url = record["fields"].get("distribution_license")
+    if not license_url:
+        return None
+    if license_url.endswith("/"):
+        license_url = license_url[:-1]
+    return license_url.replace("http:", "https:")
+
+
+def metadata_license(record, article):
+    license_url = get_license_url(record)
+    if license_url:
         article.license, c = submission_models.Licence.objects.get_or_create(
             journal=article.journal,
             url=license_url,
@@ -235,80 +362,86 @@ def metadata_license(soup, article):
         except submission_models.Licence.DoesNotExist:
             logger.warning("No license in metadata, leaving blank")
 
-    rights_field = soup.fields.find(attrs={"name": "rights"})
-    if rights_field and rights_field.value:
-        article.rights = rights_field.value.string
+    rights = record["fields"].get("rights")
+    if rights is not None:
+        article.rights = rights
 
 
-def metadata_citation(soup, article):
+def metadata_citation(record, article):
     return
-    field = soup.fields.find(attrs={"name": "dc_citation"})
-    if field and field.value:
-        article.custom_how_to_cite = field.value.string
+    citation = record["fields"].get("dc_citation")
+    if citation is not None:
+        article.custom_how_to_cite = citation
 
 
-def metadata_pages(soup, article):
+def get_page_numbers(record):
     pages = ""
-    first_page = getattr(soup, "fpage")
-    if first_page:
-        pages = first_page.string
-    last_page = getattr(soup, "lpage")
-    if last_page:
-        pages += "-%s" % last_page.string
-
-    if pages:
-        article.page_numbers = pages
-
-    tpages_field = soup.fields.find(attrs={"name": "tpages"})
-    if tpages_field and tpages_field.value:
-        total_pages_str = tpages_field.value.string
+    first_page = record["fpage"]
+    if first_page is not None:
+        pages = first_page
+    last_page = record["lpage"]
+    if last_page is not None:
+        pages += "-%s" % last_page
+    return pages
+
+
+def get_total_pages(record):
+    total_pages_str = record["fields"].get("tpages")
+    if total_pages_str is not None:
         # This is stored as "XX Pages"
         if not total_pages_str.isdigit():
             # Split as ["XX", "Pages"]
             total_pages_str, *_ = total_pages_str.split(" ")
         if total_pages_str.isdigit():
-            article.total_pages = int(total_pages_str)
+            return int(total_pages_str)
+    return None
+
+
+def metadata_pages(record, article):
+    pages = get_page_numbers(record)
+    if pages:
+        article.page_numbers = pages
+
+    total_pages = get_total_pages(record)
+    if total_pages is not None:
+        article.total_pages = total_pages
 
 
-def metadata_publisher_name(soup, article):
-    field = soup.fields.find(attrs={"name": "publisher_name"})
-    if field and field.value:
-        article.publisher_name = field.value.string
+def metadata_publisher_name(record, article):
+    publisher_name = record["fields"].get("publisher_name")
+    if publisher_name is not None:
+        article.publisher_name = publisher_name
 
 
-def metadata_peer_reviewed(soup, article):
-    field = soup.fields.find(attrs={"name": "peer_reviewed"})
-    if field and field.value == "true":
+def metadata_peer_reviewed(record, article):
+    if record["fields"].get("peer_reviewed") == "true":
         article.peer_reviewed = True
     else:
         article.peer_reviewed = False
 
 
-def metadata_authors(soup, article, dummy_accounts=False):
-    bepress_authors = [a for a in soup.authors if a.string != "\n"]
-    for i, bepress_author in enumerate(bepress_authors):
-        if bepress_author.organization:
+def metadata_authors(record, article, dummy_accounts=False):
+    corresp = record["fields"].get("corresponding_authors")
+    for i, bepress_author in enumerate(record["authors"]):
+        if bepress_author["organization"] is not None:
             handle_corporate_author(bepress_author, article)
             continue
         author_dict = {}
 
-        if bepress_author.fname:
-            author_dict["first_name"] = bepress_author.fname.string
+        if bepress_author["fname"] is not None:
+            author_dict["first_name"] = bepress_author["fname"]
         else:
             author_dict["first_name"] = " "
-        if bepress_author.lname:
-            author_dict["last_name"] = bepress_author.lname.string
+        if bepress_author["lname"] is not None:
+            author_dict["last_name"] = bepress_author["lname"]
         else:
             author_dict["last_name"] = " "
-        if bepress_author.mname:
-            author_dict["middle_name"] = bepress_author.mname.string
-        if bepress_author.institution:
-            author_dict["institution"] = bepress_author.institution.string
+        if bepress_author["mname"] is not None:
+            author_dict["middle_name"] = bepress_author["mname"]
+        if bepress_author["institution"] is not None:
+            author_dict["institution"] = bepress_author["institution"]
 
-        try:
-            email = bepress_author.email.string
-        except AttributeError:
-            email = None
+        email = bepress_author["email"]
         account = None
 
         if not email and dummy_accounts:
@@ -331,12 +464,11 @@ def metadata_authors(soup, article, dummy_accounts=False):
             )
 
         # These fields are frozen only
-        if bepress_author.suffix:
-            author_dict["name_suffix"] = bepress_author.suffix.string
-        corresp = soup.fields.find(attrs={"name": "corresponding_authors"})
+        if bepress_author["suffix"] is not None:
+            author_dict["name_suffix"] = bepress_author["suffix"]
         frozen = handle_frozen_author(author_dict, article, i, account=account)
-        if corresp and corresp.value:
-            if frozen.email in corresp.value.string:
+        if corresp:
+            if frozen.email in corresp:
                 frozen.display_email=True
                 frozen.save()
 
@@ -347,7 +479,7 @@ def metadata_authors(soup, article, dummy_accounts=False):
 def handle_corporate_author(bepress_author, article):
     frozen_record,c = submission_models.FrozenAuthor.objects.get_or_create(
         article=article,
-        institution=bepress_author.organization.string,
+        institution=bepress_author["organization"],
         is_corporate=True,
     )
 
@@ -404,39 +536,43 @@ def make_dummy_email(author):
     return "{0}@{1}".format(hashed, settings.DUMMY_EMAIL_DOMAIN)
 
 
-def fetch_remote_galley(soup, stamped=False):
-    url = getattr(soup, "fulltext-url").string
+def fetch_remote_galley(record, stamped=False):
+    url = record["fulltext_url"]
     if url:
-        if stamped:
-            has = "unstamped=1"
-            wants = "unstamped=0"
-        else:
-            has = "unstamped=0"
-            wants = "unstamped=1"
-        if '?' in url and "unstamped=" in url:
-            url = url.replace(has, wants)
-        elif '?' in url:
-            url += "&%s" % wants
-        else:
-            url += "?%s" % wants
-
-        logger.info("Fetching galley at %s", url)
-        response = requests.get(url, stream=True)
-        if response.status_code != 200:
-            logger.error("Error fetching galley: %s", response.status_code)
-        else:
-            filename = get_filename_from_headers(response)
-            django_file = SimpleUploadedFile(
-                filename,
-                response.content,
-                "application/pdf",
-            )
-            return django_file
+        return fetch_galley_url(galley_url(url, stamped))
 
     return None
 
 
-def import_supp_files(soup, article):
+def galley_url(url, stamped=False):
+    """ Requests the stamped or unstamped version of a bepress galley URL"""
+    if stamped:
+        has = "unstamped=1"
+        wants = "unstamped=0"
+    else:
+        has = "unstamped=0"
+        wants = "unstamped=1"
+    if '?' in url and "unstamped=" in url:
+        url = url.replace(has, wants)
+    elif '?' in url:
+        url += "&%s" % wants
+    else:
+        url += "?%s" % wants
+    return url
+
+
+def fetch_galley_url(url):
+    logger.info("Fetching galley at %s", url)
+    response = http_client.get(url, stream=True)
+    if response.status_code != 200:
+        logger.error("Error fetching galley: %s", response.status_code)
+        response.close()
+        return None
+    filename = get_filename_from_headers(response)
+    return response_to_file(response, filename, "application/pdf")
+
+
+def import_supp_files(record, article):
     """ Imports supplemental files
     XML Sample
     <supplemental-files>
@@ -449,37 +585,90 @@ def import_supp_files(soup, article):
         </file>
     </supplemental-files>
     """
-    soup_supp_files = getattr(soup, "supplemental-files")
-    if soup_supp_files:
-        for souped_file in soup_supp_files.findChildren("file"):
-            mime_type = getattr(souped_file, "mime-type")
-            django_file = fetch_file(souped_file.url.string, mime_type)
-
-            # HTML files are loaded as supplemental files
-            if mime_type.string in files.HTML_MIMETYPES:
-                add_html_galley(django_file, article)
-            else:
-                add_supp_file_to_article(django_file, souped_file, article)
+    for supp_file in record["supplemental_files"]:
+        mime_type = supp_file["mime_type"]
+        django_file = fetch_file(supp_file["url"], mime_type)
+
+        # HTML files are loaded as supplemental files
+        if mime_type in files.HTML_MIMETYPES:
+            add_html_galley(django_file, article)
+        else:
+            add_supp_file_to_article(django_file, supp_file, article)
 
 
-def relation_html_galley(soup, article):
+def collect_pending_files(record, article, root, files_, stamped=False):
+    """ Lists the files of an article to be fetched by a separate job
+    Mirrors the galleys and supplementary files that import_article fetches
+    when files are not deferred. (See ingest.ingest_files)
+    :return: A list of unsaved models.PendingFile
+    """
+    pending = []
+    for supp_file in record["supplemental_files"]:
+        pending.append(models.PendingFile(
+            article=article,
+            kind=models.PendingFile.SUPP_FILE,
+            url=supp_file["url"],
+            mime_type=supp_file["mime_type"] or "",
+            label=(supp_file["description"] or "")[:255],
+        ))
+
+    fulltext_url = record["fulltext_url"]
+    if fulltext_url is not None:
+        if fulltext_url:
+            pending.append(models.PendingFile(
+                article=article,
+                kind=models.PendingFile.PDF_GALLEY,
+                url=galley_url(fulltext_url, stamped),
+            ))
+    else:
+        filename = get_filename_from_local(files_, stamped)
+        if filename:
+            pending.append(models.PendingFile(
+                article=article,
+                kind=models.PendingFile.PDF_GALLEY,
+                path=os.path.join(root, filename),
+            ))
+
+    relation = record["fields"].get("relation")
+    if relation is not None:
+        URL_VALIDATOR(relation)
+        pending.append(models.PendingFile(
+            article=article,
+            kind=models.PendingFile.RELATION_GALLEY,
+            url=relation,
+        ))
+
+    native_url = record["native_url"]
+    if native_url:
+        pending.append(models.PendingFile(
+            article=article,
+            kind=models.PendingFile.IMAGE_GALLEY,
+            url=native_url,
+        ))
+    return pending
+
+
+def relation_html_galley(record, article):
     """ Imports an HTML for a series object
 
     Some Bepress journals objects can point to an HTML file in a field with the
     name "relation". We import it as a galley when there is no regular galley
     available (i.e. from supplemental files)
     """
-    field = soup.fields.find(attrs={"name": "relation"})
-    if field and field.value:
-        value = field.value.string
+    value = record["fields"].get("relation")
+    if value is not None:
         URL_VALIDATOR(value)
-        response = unsafe_get_request(value)
-        mime_type = get_content_type_from_headers(response)
-        if mime_type in files.HTML_MIMETYPES:
-            django_file = fetch_file(value, mime_type, "article.html")
-            add_html_galley(django_file, article)
+        add_relation_galley(value, article)
 
-def add_media_galley(soup, article):
+
+def add_relation_galley(url, article):
+    response = unsafe_get_request(url)
+    mime_type = get_content_type_from_headers(response)
+    if mime_type in files.HTML_MIMETYPES:
+        django_file = fetch_file(url, mime_type, "article.html")
+        add_html_galley(django_file, article)
+
+def add_media_galley(record, article):
     """ Imports multimedia articles as galleys in Janeway
 
     Bepress supports publishing an article with a linked multimedia galley
@@ -494,32 +683,43 @@ def add_media_galley(soup, article):
         <value>//youtu.be/abcxyz</value>
       </field>
     """
-    format_soup = soup.fields.find(attrs={"name": "multimedia_format"})
-    url_soup = soup.fields.find(attrs={"name": "multimedia_url"})
-    if format_soup and format_soup.value.string == "youtube":
-        add_youtube_galley(url_soup.value.string, article)
-    native_url_soup = getattr(soup, "native-url", None)
-    if native_url_soup:
-        native_url = native_url_soup.string
-        # Make a head request to check the mime
-        response = requests.head(native_url, allow_redirects=True)
-        mimetype = get_content_type_from_headers(response)
-        # image/jpg missing from core image f
-        if mimetype and mimetype in files.IMAGE_MIMETYPES:
-            logger.info("Found native-url to be an image, importing as galley")
-            logger.info(native_url)
-            add_image_as_galley(native_url, article)
+    add_multimedia_galley(record, article)
+    if record["native_url"]:
+        add_native_url_galley(record["native_url"], article)
+
+
+def add_multimedia_galley(record, article):
+    """ Imports the linked multimedia galley of an article, if any
+    Only youtube videos are supported. (See add_media_galley)
+    """
+    multimedia_format = record["fields"].get("multimedia_format")
+    multimedia_url = record["fields"].get("multimedia_url")
+    if multimedia_format == "youtube" and multimedia_url:
+        add_youtube_galley(multimedia_url, article)
+
+
+def add_native_url_galley(native_url, article):
+    # Make a head request to check the mime
+    response = http_client.head(native_url, allow_redirects=True)
+    mimetype = get_content_type_from_headers(response)
+    # image/jpg missing from core image f
+    if mimetype and mimetype in files.IMAGE_MIMETYPES:
+        logger.info("Found native-url to be an image, importing as galley")
+        logger.info(native_url)
+        add_image_as_galley(native_url, article)
 
 
 def add_image_as_galley(url, article):
-    response = requests.get(url)
+    response = http_client.get(url, stream=True)
     if response.ok:
         filename = get_filename_from_headers(response)
-        django_file = SimpleUploadedFile(filename, response.content)
+        django_file = response_to_file(response, filename)
         galley = add_image_galley(django_file, article)
 
     else:
-        logger.error("Failed to retrieve image from url: %s" % response.status)
+        response.close()
+        logger.error(
+            "Failed to retrieve image from url: %s" % response.status_code)
 
 
 
@@ -550,11 +750,16 @@ def add_youtube_galley(youtube_url, article):
     return save_galley(article, FakeRequest(), django_file, True)
 
 
-def add_supp_file_to_article(supp_file, file_soup, article, label=None):
-    if not label and file_soup.description:
-        label = file_soup.description.string
-    else:
-        label = "Supplementary File"
+def add_supp_file_to_article(supp_file, file_record, article, label=None):
+    """
+    :param file_record: The supplemental file from the article metadata
+        (See records.extract_record), if any
+    """
+    if not label:
+        if file_record and file_record["description"] is not None:
+            label = file_record["description"]
+        else:
+            label = "Supplementary File"
 
     saved_file = files.save_file_to_article(
         supp_file, article,
@@ -622,110 +827,477 @@ def add_image_galley(image_file, article):
     article.galley_set.add(galley)
 
 
+class ImportSummary:
+    """ Counters and memory usage reported at the end of an import"""
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.memory_reports = []
+        self.resume_from = None
+        self.deferred_signals = 0
+        self.replayed_signals = 0
+        self.reclaimed_time = 0.0
+        self.cached_records = 0
+        self.parsed_records = 0
+        self.skipped = 0
+        # (name, workers, items, failed, busy seconds) See pipeline.Stage
+        self.stage_reports = []
+
+    def add_signals(self, deferred_signals):
+        """ Records the signals deferred by a signals.DeferredSignals"""
+        self.deferred_signals += deferred_signals.deferred
+        self.replayed_signals += deferred_signals.replayed
+        self.reclaimed_time += deferred_signals.reclaimed_time
+
+    def add_records(self, record_cache):
+        """ Records the cache hits and misses of a records.RecordCache"""
+        self.cached_records += record_cache.hits
+        self.parsed_records += record_cache.misses
+
+    def merge(self, other):
+        offset = self.imported + self.failed
+        self.imported += other.imported
+        self.failed += other.failed
+        self.deferred_signals += other.deferred_signals
+        self.replayed_signals += other.replayed_signals
+        self.reclaimed_time += other.reclaimed_time
+        self.cached_records += other.cached_records
+        self.parsed_records += other.parsed_records
+        self.skipped += other.skipped
+        self.stage_reports.extend(other.stage_reports)
+        self.memory_reports.extend(
+            (count + offset, peak) for count, peak in other.memory_reports
+        )
+        self.resume_from = other.resume_from
+
+    def __str__(self):
+        lines = [
+            "Imported: %d" % self.imported,
+            "Failed: %d" % self.failed,
+        ]
+        if self.skipped:
+            lines.append("Skipped (unchanged): %d" % self.skipped)
+        for count, peak in self.memory_reports:
+            lines.append(
+                "Peak RSS after %d articles: %.1f MB" % (count, peak / memory.MB)
+            )
+        if self.cached_records or self.parsed_records:
+            lines.append(
+                "Records: %d cached, %d parsed" % (
+                    self.cached_records, self.parsed_records)
+            )
+        if self.deferred_signals:
+            lines.append(
+                "Signals: %d deferred, %d replayed, ~%.1fs reclaimed" % (
+                    self.deferred_signals,
+                    self.replayed_signals,
+                    self.reclaimed_time,
+                )
+            )
+        for name, workers, items, failed, busy in self.stage_reports:
+            lines.append(
+                "Stage %s (%d workers): %d items, %d failed, %.1fs busy" % (
+                    name, workers, items, failed, busy,
+                )
+            )
+        return "\n".join(lines)
+
+
+class ImportState:
+    """ The indexes and registries of the journal an import is loaded into
+    Building them requires loading the imported articles, identities and
+    keywords of the whole journal. Successive imports into the same journal
+    (e.g. the units of work imported by a worker, See leases.run_worker) can
+    share an ImportState to only build them once.
+    """
+
+    def __init__(self, folder, site, prune_records=True):
+        """
+        :param folder: The name of the bepress dump
+        :param site: The journal.Journal receiving the import
+        :param prune_records: Prune the stale entries of the record cache
+            (See records.RecordCache.prune)
+        """
+        self.imported_articles = preload_imported_articles(folder, site)
+        self.identities = identity.IdentityIndex(site)
+        self.notes = NoteRegistry()
+        self.keywords = KeywordRegistry()
+        if prune_records:
+            records.RecordCache().prune()
+
+
 def import_archive(
     folder, stamped, site, struct,
     default_section=None, section_key=None, import_path=None,
-    custom_fields=None,
+    custom_fields=None, profiler=None, rss_ceiling=None, resume_from=None,
+    defer_files=False, unit_path=None, defer_signals=False,
+    retry_failed=False, documents=None, force=False, record_source=None,
+    state=None, stop=None,
 ):
+    """ Imports all the metadata.xml documents found under the given folder
+    :param rss_ceiling: RSS in MB past which the import stops and records
+        the next document to import in ImportSummary.resume_from, so it can
+        be resumed by a fresh process (See memory.run_recycled)
+    :param resume_from: Skip all the documents before the given path
+    :param defer_files: Queue the galleys and supplementary files of the
+        articles as models.PendingFile to be fetched by a separate job
+        (See ingest.ingest_files) instead of fetching them inline
+    :param unit_path: Only import the documents of the given unit of work
+        (See leases.run_worker)
+    :param defer_signals: Defer the model signals fired by the import and
+        replay them once per object when each batch is flushed
+        (See signals.DeferredSignals)
+    :param retry_failed: Only import the documents that failed to import
+        on previous runs (See failures.FailureLog)
+    :param documents: Only import the given documents, as tuples of their
+        directory and files (See iter_metadata_roots)
+    :param force: Import the documents whose metadata.xml is unchanged since
+        their article was last imported, which are skipped otherwise
+        (See identity.IdentityIndex)
+    :param record_source: An optional records.RecordSet holding the records
+        of the documents, which are read from the export otherwise
+    :param state: An optional ImportState of the journal, built by the
+        import otherwise
+    :param stop: An optional threading.Event, which stops the import before
+        the next document once set
+    :return: An ImportSummary
+    """
     book = None
+    summary = ImportSummary()
+    monitor = memory.MemoryMonitor(MEMORY_REPORT_EVERY, rss_ceiling)
+    # Tracks the stage at which the import of a document fails
+    profiler = profiling.StageTracker(profiler or profiling.NullProfiler())
     logger.set_prefix(site.code)
     path = os.path.join(BEPRESS_PATH, folder)
-    for root, dirs, files_ in os.walk(path):
-        if import_path and import_path not in root:
-            continue
-        try:
-            if 'metadata.xml' in files_:
+    failure_log = failures.FailureLog(
+        None if struct == 'books' else site, folder, path)
+    if documents is not None:
+        documents = list(resume_documents(documents, resume_from))
+    elif retry_failed:
+        documents = list(
+            resume_documents(failure_log.documents(), resume_from))
+    else:
+        documents = list(
+            iter_metadata_roots(path, import_path, resume_from, unit_path))
+
+    import_batch = imported_articles = imported_chapters = None
+    record_cache = identities = None
+    if struct == 'books':
+        imported_chapters = preload_imported_chapters()
+    else:
+        if state is None:
+            state = ImportState(
+                folder, site, prune_records=record_source is None)
+        imported_articles = state.imported_articles
+        identities = state.identities
+        if record_source is not None:
+            record_cache = record_source
+        else:
+            record_cache = records.RecordCache()
+        options = import_options(
+            stamped, default_section, section_key, custom_fields)
+        import_batch = ImportBatch(
+            issues=issues.IssuePlanner(site, struct, path),
+            notes=state.notes,
+            keywords=state.keywords,
+            files=ingest.FileQueue() if defer_files else None,
+            content_hashes=identity.ContentHashes(identities),
+        )
+        if custom_fields:
+            import_batch.custom_fields = CustomFieldMapping(
+                site, custom_fields)
+        with profiler.stage("plan_issues"):
+            import_batch.issues.plan(
+                (root for root, _ in documents), record_cache)
+
+    deferred_signals = None
+    if defer_signals:
+        deferred_signals = signals.DeferredSignals()
+        deferred_signals.start()
+        if import_batch:
+            import_batch.signals = deferred_signals
+    try:
+        for root, files_ in documents:
+            if monitor.over_ceiling():
+                summary.resume_from = root
+                break
+            if stop is not None and stop.is_set():
+                logger.warning("Import stopped before %s", root)
+                break
+            soup = None
+            try:
+                profiler.start_item()
                 metadata_path = os.path.join(root, 'metadata.xml')
-                soup = soup_metadata(metadata_path)
                 if struct == 'books':
-                    book, chapter = import_book_chapter(soup, site)
+                    with profiler.stage("soup_metadata"):
+                        soup = soup_metadata(metadata_path)
+                    with profiler.stage("import_book_chapter"):
+                        book, chapter = import_book_chapter(
+                            soup, site, imported_chapters)
                 else:
-                    import_article(
-                        soup, root, files_, folder, stamped, site,
+                    with profiler.stage("load_record"):
+                        record = record_cache.load(metadata_path)
+                    digest = identity.document_digest(
+                        record, root, files_, options)
+                    if not force and is_unchanged(
+                        record, digest, root, identities, failure_log,
+                    ):
+                        summary.skipped += 1
+                        continue
+                    article = import_article(
+                        record, root, files_, folder, stamped, site,
                         struct, default_section, section_key,
                         custom_fields=custom_fields,
+                        profiler=profiler,
+                        imported_articles=imported_articles,
+                        batch=import_batch,
+                        identities=identities,
                     )
+                    import_batch.content_hashes.add(article.pk, digest)
+                summary.imported += 1
+                failure_log.resolve(root)
+            except Exception as e:
+                summary.failed += 1
+                logger.error("Article import failed: %s", e)
+                logger.exception(e)
+                failure_log.record(root, profiler.current, e)
+            finally:
+                release_resources(soup, monitor.count)
+                monitor.record()
+            if import_batch:
+                import_batch.article_done()
+
+        if import_batch:
+            import_batch.flush()
+        if book:
+            # There is no book metadata other than the title, so we have to
+            # default to the least recent chapter publication date
+            book.date_published = book.chapter_set.order_by(
+                "sequence",
+            ).first().date_published
+            book.save()
+    finally:
+        if deferred_signals:
+            deferred_signals.stop()
+            summary.add_signals(deferred_signals)
+    if record_cache:
+        summary.add_records(record_cache)
+    profiler.dump()
+    summary.memory_reports = monitor.finish()
+    return summary
+
+
+def import_options(stamped, default_section, section_key, custom_fields):
+    """ The options of an import the imported articles depend on, which are
+    part of the digest of the documents (See identity.document_digest)
+    """
+    return (
+        bool(stamped),
+        default_section.pk if default_section else None,
+        section_key,
+        sorted(custom_fields.items()) if custom_fields else None,
+    )
+
+
+def is_unchanged(record, digest, root, identities, failure_log):
+    """ Whether a document can be skipped, as its article was already
+    imported from the very same document and options without failing since
+    :param record: A record loaded by records.RecordCache.load
+    :param digest: The digest of the document (See identity.document_digest)
+    :param root: The directory of the document
+    :param identities: An identity.IdentityIndex of the journal
+    :param failure_log: The failures.FailureLog of the import
+    """
+    if (
+        failure_log.has_failed(root)
+        or not identities.is_unchanged(record, digest)
+    ):
+        return False
+    logger.info("Skipping unchanged document %s", root)
+    return True
+
+
+def resume_documents(documents, resume_from=None):
+    """ Skips the documents that come before the given one
+    Documents are skipped by their position rather than by comparing their
+    paths, since the order in which an export is walked is not the order of
+    its paths (e.g. vol1/iss1-a comes after vol1/iss1/5)
+    :param documents: An iterable of tuples of a directory and its files
+    :param resume_from: The directory of the first document to yield
+    :return: A generator of tuples of the directory and its files
+    """
+    for root, files_ in documents:
+        if resume_from:
+            if root != resume_from:
+                continue
+            resume_from = None
+        yield root, files_
+
+
+def iter_metadata_roots(
+    path, import_path=None, resume_from=None, unit_path=None,
+):
+    """ Finds the directories containing a metadata.xml under the given path
+    The tree is walked in a stable order so that an import can be resumed
+    :param path: The path of the bepress export
+    :param import_path: Only yield directories containing the given path
+    :param resume_from: Skip all the directories before the given one
+    :param unit_path: Only yield the directories directly under the given
+        directory of the export (See get_unit_path)
+    :return: A generator of tuples of the directory and its files
+    """
+    top = os.path.join(path, unit_path) if unit_path else path
+    for root, dirs, files_ in archives.walk(top):
+        dirs.sort()
+        if unit_path is not None:
+            if root != top:
+                dirs[:] = []
+            if get_unit_path(root, path) != unit_path:
+                continue
+        if resume_from:
+            if root != resume_from:
+                continue
+            resume_from = None
+        if import_path and import_path not in root:
+            continue
+        if 'metadata.xml' in files_:
+            yield root, files_
 
 
-        except Exception as e:
-            logger.error("Article import failed: %s", e)
-            logger.exception(e)
-    if book:
-        # There is no book metadata other than the title, so we have to
-        # default to the least recent chapter publication date
-        book.date_published = book.chapter_set.order_by(
-            "sequence",
-        ).first().date_published
-        book.save()
+def get_unit_path(root, path):
+    """ Gets the unit of work of a document, the directory containing it
+    For journals this is the directory of the issue of the document.
+    :param root: The directory of the document
+    :param path: The path of the bepress export
+    :return: The path of the unit relative to the export
+    """
+    return os.path.dirname(os.path.relpath(root, path))
+
+
+def release_resources(soup, count):
+    """ Frees the memory held on behalf of an imported document
+    :param soup: The parsed metadata.xml, decomposed to break its cycles
+    :param count: The number of documents imported so far
+    """
+    if soup is not None:
+        soup.decompose()
+    # Query logging accumulates when running with DEBUG on
+    db.reset_queries()
+    if count and count % RECYCLE_CONNECTIONS_EVERY == 0:
+        db.connections.close_all()
 
 
 def import_article(
-    soup, root, files_,
+    record, root, files_,
     folder, stamped, site,
     struct, default_section, section_key,
-    custom_fields=None
+    custom_fields=None, profiler=None, imported_articles=None, batch=None,
+    identities=None,
 ):
+    """ Imports an article from its metadata and files
+    :param record: The article metadata (See records.RecordCache.load)
+    :param imported_articles: An optional dict of the dump's ImportedArticle
+        records by bepress id (See preload_imported_articles)
+    :param batch: An optional batch.ImportBatch, which defers writes such as
+        adding the article to its issue until the batch is flushed.
+    :param identities: An optional identity.IdentityIndex of the journal
+        (See create_article_record)
+    """
+    profiler = profiler or profiling.NullProfiler()
     path = os.path.join(BEPRESS_PATH, folder)
-    article = create_article_record(
-        folder, soup, site, default_section, section_key)
-                # Query the article to ensure correct attribute types (dates)
-    article = submission_models.Article.objects.get(pk=article.pk)
-    add_to_issue(article, root, path, struct, soup)
-    import_supp_files(soup, article)
-    try:
-        pdf_file = fetch_remote_galley(soup, stamped)
-    except AttributeError:
-        pdf_file = fetch_local_galley(root, files_, stamped)
-
-    if pdf_file:
-        add_pdf_galley(pdf_file, article)
-    relation_html_galley(soup, article)
-    add_media_galley(soup, article)
-    if custom_fields:
-        update_custom_fields(soup, article, custom_fields)
+    with profiler.stage("create_article_record"):
+        article = create_article_record(
+            folder, record, site, default_section, section_key,
+            imported_articles, batch, identities,
+        )
+        # Query the article to ensure correct attribute types (dates)
+        article = submission_models.Article.objects.get(pk=article.pk)
+    with profiler.stage("add_to_issue"):
+        if batch and batch.issues:
+            batch.issues.add_article(
+                article, root, record["publication_title"])
+        else:
+            add_to_issue(article, root, path, struct, record)
+    if batch and batch.files is not None:
+        with profiler.stage("queue_files"):
+            batch.files.add(
+                collect_pending_files(record, article, root, files_, stamped))
+            add_multimedia_galley(record, article)
+    else:
+        import_files(record, article, root, files_, stamped, profiler)
+    if batch and batch.custom_fields:
+        with profiler.stage("update_custom_fields"):
+            batch.custom_fields.add_answers(record, article)
+    elif custom_fields:
+        with profiler.stage("update_custom_fields"):
+            update_custom_fields(record, article, custom_fields)
     return article
 
 
-def update_custom_fields(soup, article, custom_fields):
+def import_files(record, article, root, files_, stamped, profiler=None):
+    """ Fetches the galleys and supplementary files of an article"""
+    profiler = profiler or profiling.NullProfiler()
+    with profiler.stage("import_supp_files"):
+        import_supp_files(record, article)
+    with profiler.stage("pdf_galley"):
+        if record["fulltext_url"] is not None:
+            pdf_file = fetch_remote_galley(record, stamped)
+        else:
+            pdf_file = fetch_local_galley(root, files_, stamped)
+
+        if pdf_file:
+            try:
+                add_pdf_galley(pdf_file, article)
+            finally:
+                pdf_file.close()
+    with profiler.stage("relation_html_galley"):
+        relation_html_galley(record, article)
+    with profiler.stage("add_media_galley"):
+        add_media_galley(record, article)
+
+
+def update_custom_fields(record, article, custom_fields):
     """ Imports Bepress metadata into Janeway's custom submission fields
-    :param soup: An instance of bs4.BeautifulSoup representing the article XML
+    When importing many articles, use a custom_fields.CustomFieldMapping
+    which resolves the fields once and writes the answers in bulk.
+    :param record: The article metadata (See records.extract_record)
     :param article: a Janeway submission.Article instance
     :param custom_fields: a dict mapping a bepress field name to Janeway
     :return: The updated Article
     """
-    for i, (bepress_field, janeway_field) in enumerate(custom_fields.items()):
-        submission_field, _ = submission_models.Field.objects.get_or_create(
-            journal=article.journal,
-            name=janeway_field,
-            defaults=dict(
-                required=False,
-                kind="textarea",
-                display=True,
-                order=i,
-            )
-        )
-        field = soup.fields.find(attrs={"name": bepress_field})
-        if field and field.value:
-            logger.debug(
-                "Setting custom field %s to value:  '%s'",
-                submission_field, field.value.string,
-            )
-            submission_models.FieldAnswer.objects.update_or_create(
-                field=submission_field,
-                article=article,
-                defaults={
-                    "answer": field.value.string
-                }
-            )
+    mapping = CustomFieldMapping(article.journal, custom_fields)
+    mapping.add_answers(record, article)
+    mapping.flush()
     return article
 
 
-def import_book_chapter(soup, site):
+def preload_imported_chapters():
+    """ Fetches all the ImportedChapter records in a single query
+    :return: A dict of bepress id -> ImportedChapter
+    """
+    imported_chapters = models.ImportedChapter.objects.select_related(
+        "book", "chapter",
+    )
+    return {imported.bepress_id: imported for imported in imported_chapters}
+
+
+def import_book_chapter(soup, site, imported_chapters=None):
+    """ Imports a book chapter from its metadata
+    :param imported_chapters: An optional dict of ImportedChapter records by
+        bepress id (See preload_imported_chapters)
+    """
     book = chapter = None
     book_title = getattr(soup, 'publication-title').string
     bepress_id = int(soup.articleid.string)
     try:
-        imported = models.ImportedChapter.objects.get(bepress_id=bepress_id)
+        if imported_chapters is None:
+            imported = models.ImportedChapter.objects.get(
+                bepress_id=bepress_id)
+        elif bepress_id in imported_chapters:
+            imported = imported_chapters[bepress_id]
+        else:
+            raise models.ImportedChapter.DoesNotExist
         chapter = imported.chapter
         book = imported.book
     except models.ImportedChapter.DoesNotExist:
@@ -740,6 +1312,8 @@ def import_book_chapter(soup, site):
             chapter=chapter,
             bepress_id=bepress_id,
         )
+        if imported_chapters is not None:
+            imported_chapters[bepress_id] = imported
     else:
         # Update the chapter metadata
         chapter_metadata = get_chapter_metadata(soup)
@@ -809,14 +1383,12 @@ def fetch_local_galley(root_path, sub_files, stamped):
 
     if filename:
         pdf_path = os.path.join(root_path, filename)
-
-        f = open(pdf_path, "rb")
-        return DjangoFile(f)
+        return archives.open_local(pdf_path)
     else:
         return None
 
 
-def add_to_issue(article, root_path, export_path, struct, soup):
+def add_to_issue(article, root_path, export_path, struct, record):
     """ Adds the new article to the right issue. Issue created if not present
 
     Bepress exports have roughly this structure:
@@ -827,35 +1399,15 @@ def add_to_issue(article, root_path, export_path, struct, soup):
     :param article: The submission.Article being imported
     :param root_path: The absolute path in which the metadata.xml was found
     :param export_path: The absolute path to the provided exported data
-    :param struct: (str) One of const.BEPRESS_STRUCTURESujj
-    :param soup: (bs4.Soup) Soupified metadata.xml
+    :param struct: (str) One of const.BEPRESS_STRUCTURES
+    :param record: The article metadata (See records.extract_record)
     """
     relative_path = root_path.replace(export_path, "")
-    year = issue_num = vol_num = None
-    issue_title = ""
-    issue_type = journal_models.IssueType.objects.get(
-        code="issue", journal=article.journal)
     try:
-        if struct == const.EVENTS_STRUCTURE:
-            issue_type = journal_models.IssueType.objects.get(
-                code="collection", journal=article.journal)
-            _, year, *remaining = relative_path.split("/")
-            if not year.isdigit():
-                year = str(article.date_published.year)
-            pub_title = getattr(soup, 'publication-title')
-            if pub_title:
-                issue_title = "%s %s" % (pub_title.string, year)
-        elif struct == const.JOURNAL_STRUCTURE:
-            _, volume_code, issue_code, article_id = relative_path.split("/")
-            vol_num = int(volume_code.replace("vol", ""))  # volN
-            issue_num = int(issue_code.replace("iss", ""))  # issN
-            # We don't have an issue date on metadata.xml so we use the article's
-            if article.date_published:
-                year = str(article.date_published.year)
-        elif struct == const.SERIES_STRUCTURE:
-            year = vol_num = str(article.date_published.year - 1)
-        else:
-            raise RuntimeError("Unkown bepress structure %s" % struct)
+        key, year, issue_type_code = issues.get_issue_details(
+            relative_path, struct, article.date_published,
+            record["publication_title"],
+        )
     except Exception as e:
         logger.exception(e)
         logger.error(
@@ -865,18 +1417,20 @@ def add_to_issue(article, root_path, export_path, struct, soup):
             )
         )
     else:
+        volume, issue_num, issue_title = key
         issue, created = journal_models.Issue.objects.get_or_create(
             journal=article.journal,
-            volume=vol_num or 1,
-            issue=issue_num or year,
+            volume=volume,
+            issue=issue_num,
             issue_title=issue_title
         )
         if created:
-            issue.issue_type = issue_type
+            issue.issue_type = journal_models.IssueType.objects.get(
+                code=issue_type_code, journal=article.journal)
             logger.info("Created new issue {}".format(issue))
 
         if year:
-            issue.date = dateutil.parser.parse(year)
+            issue.date = parse_bepress_date(year)
         issue.save()
         issue.articles.add(article)
         article.primary_issue = issue
@@ -911,7 +1465,7 @@ def get_filename_from_local(sub_files, stamped=False):
 def get_filename_from_headers(response):
     try:
         header = response.headers["Content-Disposition"]
-        _, params = cgi.parse_header(header)
+        _, params = parse_header(header)
         return params["filename"]
     except Exception as e:
         logger.warning(
@@ -921,10 +1475,24 @@ def get_filename_from_headers(response):
         return '{uuid}.pdf'.format(uuid=uuid4())
 
 
+def parse_header(header):
+    """ Parses a MIME header into its main value and a dict of parameters
+    Replacement for the deprecated cgi.parse_header
+    """
+    message = email.message.Message()
+    message["content-type"] = header
+    value, *params = message.get_params()
+    return value[0], {
+        # RFC 2231 values (e.g. filename*=) are returned as tuples
+        key: email.utils.collapse_rfc2231_value(param)
+        for key, param in params
+    }
+
+
 def get_content_type_from_headers(response):
     try:
         header = response.headers["Content-Type"]
-        mime_type, _ = cgi.parse_header(header)
+        mime_type, _ = parse_header(header)
         return mime_type
     except Exception as e:
         logger.warning(
@@ -934,44 +1502,47 @@ def get_content_type_from_headers(response):
 
 
 def fetch_file(url, mime=None, filename=None):
-    response = requests.get(url)
-    response.raise_for_status()
+    response = http_client.get(url, stream=True)
+    try:
+        response.raise_for_status()
+    except HTTPError:
+        response.close()
+        raise
     if not filename:
         filename = get_filename_from_headers(response)
     if not mime:
         mime = get_content_type_from_headers(response)
-    django_file = SimpleUploadedFile(
-        filename,
-        response.content,
-        mime or "application/pdf",
-    )
+    return response_to_file(response, filename, mime or "application/pdf")
+
+
+def response_to_file(response, filename, mime=None):
+    """ Streams the body of a response into a temporary file on disk
+    Avoids holding the entire file in memory while it is being imported
+    :param response: A streamed requests.Response
+    :param filename: The name of the file
+    :param mime: The content type of the file
+    :return: A django TemporaryUploadedFile
+    """
+    mime = mime or get_content_type_from_headers(response)
+    django_file = TemporaryUploadedFile(filename, mime, None, None)
+    try:
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            django_file.write(chunk)
+    finally:
+        # Gives the slot of the request back (See http_client.StreamSlot)
+        response.close()
+    django_file.size = django_file.tell()
+    django_file.seek(0)
     return django_file
 
 
 def unsafe_get_request(url):
     """ Fetch a URL despite SSLErrors by attempting to request over http"""
     try:
-        return requests.get(url, verify=False)
+        return http_client.get(url, verify=False)
     except SSLError:
-        return requests.get(url.replace("https", "http"))
-
+        return http_client.get(url.replace("https", "http"))
 
-def parse_bepress_date(date_string):
-    date_published = None
-    try:
-        date_published = dateutil.parser.parse(date_string)
-    except Exception as e:
-        logger.warning(
-            "Unable to parse pub datetime %s, trying to extract date...",
-            date_string,
-        )
-        try:
-            # Extract date from corrupt datetime
-            date_string, *_ = date_string.split("T")
-            date_published = dateutil.parser.parse(date_published)
-        except Exception as e:
-            logger.warning("No publication date could be parsed")
-    return date_published
 
 YOUTUBE_JATS_TEMPLATE = """
 <fig>
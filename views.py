@@ -12,8 +12,10 @@ from submission.models import Section
 from utils.logger import get_logger
 
 from plugins.bepress import const
-from plugins.bepress import utils
-from plugins.bepress import csv_handler
+
+# utils and csv_handler pull in bs4, requests, lxml and the template engine,
+# they are imported within the views so that loading the URL configuration
+# doesn't pay for them on every Janeway process.
 
 logger = get_logger(__name__)
 
@@ -23,6 +25,8 @@ CSV_MIMETYPES = ["application/csv", "text/csv"]
 
 @staff_member_required
 def index(request):
+    from plugins.bepress import utils
+
     folders = utils.get_bepress_import_folders()
     sections = Section.objects.filter(journal=request.journal)
 
@@ -37,6 +41,8 @@ def index(request):
 
 @staff_member_required
 def import_bepress_csv(request):
+    from plugins.bepress import csv_handler
+
     form = core_forms.FileUploadForm(mimetypes=CSV_MIMETYPES)
     if request.FILES and 'file' in request.FILES:
         form = core_forms.FileUploadForm(
@@ -71,6 +77,8 @@ def import_bepress_csv(request):
 @staff_member_required
 @require_POST
 def import_bepress_articles(request):
+    from plugins.bepress import utils
+
     folder = request.POST.get('folder', None)
     struct = request.POST.get('bepress_structure')
     pdf_type = request.POST.get('pdf_type', None)
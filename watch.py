@@ -0,0 +1,316 @@
+"""
+Continuous import of the documents dropped under BEPRESS_PATH
+
+A FolderWatcher watches BEPRESS_PATH for documents that are written by CSV
+conversions, OAI harvests or anyone copying exports in, and imports each new
+or changed document shortly after it was last written to. Changes are
+received from inotify, so the tree is only walked once on start. Where
+inotify isn't available (e.g. on macOS or network filesystems), the tree is
+polled instead.
+
+Writes are debounced: a document is only imported once none of its files
+were written to for BEPRESS_WATCH_DEBOUNCE seconds, so that a document being
+copied in is not imported before all of its files are in place.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from utils.logger import get_logger
+
+from plugins.bepress import archives, utils
+from plugins.bepress.plugin_settings import BEPRESS_PATH
+
+logger = get_logger(__name__)
+
+# Seconds without writes after which a document is imported
+DEBOUNCE = getattr(settings, "BEPRESS_WATCH_DEBOUNCE", 2.0)
+# Seconds between scans of the tree when inotify is not available
+POLL_INTERVAL = getattr(settings, "BEPRESS_WATCH_POLL_INTERVAL", 10.0)
+
+# See inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+
+def is_hidden(name):
+    """ Hidden files and directories, such as the record cache, are ignored
+    """
+    return name.startswith(".")
+
+
+def walk_files(path):
+    """ Lists all the files under the given directory, skipping hidden ones
+    """
+    for root, dirs, files_ in os.walk(path):
+        dirs[:] = [name for name in dirs if not is_hidden(name)]
+        for name in files_:
+            if not is_hidden(name):
+                yield os.path.join(root, name)
+
+
+class InotifyWatcher:
+    def __init__(self, path):
+        """
+        :param path: The directory to watch, along with all its descendants
+        :raises OSError: When inotify is not available
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        try:
+            self.add_watch = libc.inotify_add_watch
+            inotify_init1 = libc.inotify_init1
+        except AttributeError:
+            raise OSError("inotify is not available")
+        self.add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32,
+        ]
+        self.fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.path = path
+        # watch descriptor -> directory
+        self.watches = {}
+        self.watch_tree(path)
+
+    def watch_tree(self, path):
+        """ Watches a directory and its descendants
+        :return: The files found in the directories, which may have been
+            written to before they were watched
+        """
+        found = []
+        for root, dirs, files_ in os.walk(path):
+            dirs[:] = [name for name in dirs if not is_hidden(name)]
+            wd = self.add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                logger.warning(
+                    "Unable to watch %s: %s",
+                    root, os.strerror(ctypes.get_errno()),
+                )
+                continue
+            self.watches[wd] = root
+            found.extend(
+                os.path.join(root, name) for name in files_
+                if not is_hidden(name)
+            )
+        return found
+
+    def read_changes(self, timeout):
+        """ Waits for files to be written to
+        :param timeout: The maximum number of seconds to wait for
+        :return: A list of the paths of the files written to
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("Missed inotify events, rescanning the tree")
+                changed.extend(self.watch_tree(self.path))
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name or is_hidden(name):
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.extend(self.watch_tree(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    def __init__(self, path, interval=POLL_INTERVAL):
+        """
+        :param path: The directory to watch, along with all its descendants
+        :param interval: The number of seconds between scans of the tree
+        """
+        self.path = path
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for path in walk_files(self.path):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def read_changes(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = self.scan()
+        changed = [
+            path for path, stat in snapshot.items()
+            if self.snapshot.get(path) != stat
+        ]
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def get_watcher(path, polling=False):
+    """ Gets an InotifyWatcher, or a PollingWatcher if inotify is not
+    available or polling is requested
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(path)
+        except OSError as e:
+            logger.warning("Falling back to polling %s: %s", path, e)
+    return PollingWatcher(path)
+
+
+class Debouncer:
+    def __init__(self, delay=DEBOUNCE):
+        """
+        :param delay: Seconds without changes after which a key is settled
+        """
+        self.delay = delay
+        self.pending = {}
+
+    def add(self, key, now=None):
+        self.pending[key] = time.monotonic() if now is None else now
+
+    def pop_settled(self, now=None):
+        """ Pops the keys that didn't change for the delay
+        :return: A list of the settled keys
+        """
+        now = time.monotonic() if now is None else now
+        settled = [
+            key for key, changed in self.pending.items()
+            if now - changed >= self.delay
+        ]
+        for key in settled:
+            del self.pending[key]
+        return settled
+
+    def next_timeout(self, default, now=None):
+        """ Seconds until the next key settles, or default when idle"""
+        if not self.pending:
+            return default
+        now = time.monotonic() if now is None else now
+        oldest = min(self.pending.values())
+        return max(0, min(default, oldest + self.delay - now))
+
+
+def get_document_key(path, watched_path=BEPRESS_PATH):
+    """ Finds the document to import for a file that was written to
+    :param path: The path of the file
+    :param watched_path: The path containing the exports
+    :return: A tuple of the name of the export and the directory of the
+        document, where the directory is None for archive files (the whole
+        archive is imported). None if the file is not part of an export.
+    """
+    relative_path = os.path.relpath(path, watched_path)
+    parts = relative_path.split(os.sep)
+    if parts[0] in (os.curdir, os.pardir) or any(map(is_hidden, parts)):
+        return None
+    if len(parts) == 1:
+        if archives.is_archive(parts[0]):
+            return parts[0], None
+        return None
+    return parts[0], os.path.dirname(path)
+
+
+class FolderWatcher:
+    def __init__(
+        self, import_kwargs, path=BEPRESS_PATH, debounce=DEBOUNCE,
+        polling=False, on_import=None,
+    ):
+        """
+        :param import_kwargs: Passed on to utils.import_archive, other than
+            the folder to import
+        :param path: The directory containing the exports
+        :param debounce: Seconds without writes after which a document is
+            imported
+        :param polling: Poll the tree rather than relying on inotify
+        :param on_import: An optional callable taking the name of an export
+            and the utils.ImportSummary of each import
+        """
+        self.import_kwargs = import_kwargs
+        self.path = path
+        self.debouncer = Debouncer(debounce)
+        self.polling = polling
+        self.on_import = on_import
+
+    def run(self, max_iterations=None):
+        """ Imports the documents as they change, until interrupted
+        :param max_iterations: Stop after the given number of waits for
+            changes
+        """
+        watcher = get_watcher(self.path, self.polling)
+        logger.info("Watching %s", self.path)
+        iterations = 0
+        try:
+            while max_iterations is None or iterations < max_iterations:
+                iterations += 1
+                timeout = self.debouncer.next_timeout(POLL_INTERVAL)
+                for changed in watcher.read_changes(timeout):
+                    key = get_document_key(changed, self.path)
+                    if key is not None:
+                        self.debouncer.add(key)
+                settled = self.debouncer.pop_settled()
+                if settled:
+                    self.import_documents(settled)
+        finally:
+            watcher.close()
+
+    def import_documents(self, keys):
+        """ Imports the settled documents, export by export
+        :param keys: A list of keys (See get_document_key)
+        """
+        documents = defaultdict(list)
+        whole_folders = set()
+        for folder, root in keys:
+            if root is None:
+                whole_folders.add(folder)
+            elif archives.isfile(os.path.join(root, "metadata.xml")):
+                documents[folder].append((root, sorted(os.listdir(root))))
+
+        for folder in sorted(whole_folders | set(documents)):
+            kwargs = dict(self.import_kwargs, folder=folder)
+            if folder not in whole_folders:
+                kwargs["documents"] = sorted(documents[folder])
+            logger.info("Importing changes to %s", folder)
+            try:
+                summary = utils.import_archive(**kwargs)
+            except Exception as e:
+                logger.error("Import of %s failed: %s", folder, e)
+                logger.exception(e)
+                continue
+            if self.on_import:
+                self.on_import(folder, summary)